@@ -0,0 +1,116 @@
+"""
+Send safe reads from selected views to read replicas.
+
+``ReplicaRoutingMiddleware`` decides per request whether reads may use a
+replica: only GET/HEAD requests to views listed in ``REPLICA_READ_VIEWS``
+qualify, and only when the client has not written anything in the last
+``REPLICA_STICKY_SECONDS`` (read-your-writes). ``ReplicaRouter`` then picks a
+replica from ``DATABASE_REPLICAS`` for reads; writes always go to ``default``.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+class _Routing:
+    """Per-request switch. Mutable so that a decision made in ``process_view``
+    is seen by the view even when the two run in different (copied) contexts,
+    as they do under ASGI."""
+    __slots__ = ('replica',)
+
+    def __init__(self, replica=False):
+        self.replica = replica
+
+
+_routing = ContextVar('replica_routing', default=None)
+
+STICKY_COOKIE = 'ltalk_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_reads_allowed():
+    routing = _routing.get()
+    return routing is not None and routing.replica
+
+
+@contextmanager
+def use_replica(enabled=True):
+    token = _routing.set(_Routing(enabled))
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and replica_reads_allowed():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request._replica_routing = _Routing()
+        token = _routing.set(request._replica_routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        request._replica_routing = _Routing()
+        token = _routing.set(request._replica_routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._pin_after_write(request, response)
+
+    def _pin_after_write(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            sticky = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + sticky)), max_age=sticky,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return None
+        if request.resolver_match.view_name not in settings.REPLICA_READ_VIEWS:
+            return None
+        try:
+            pinned_until = int(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            return None
+        request._replica_routing.replica = True
+        return None
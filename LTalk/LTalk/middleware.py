@@ -0,0 +1,73 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+from . import metrics
+
+
+def _timed_execute(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(time.perf_counter() - started)
+
+
+def _instrument_connections():
+    # Connections are per thread. Outside a request record_query() is a no-op,
+    # so the wrapper can stay installed once added.
+    for conn in connections.all():
+        if _timed_execute not in conn.execute_wrappers:
+            conn.execute_wrappers.append(_timed_execute)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure SQL, LLM and total view time for every request.
+
+    The numbers are sent back in a ``Server-Timing`` header and aggregated
+    into histograms labelled by URL name (see ``LTalk.metrics``).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        _instrument_connections()
+        stats, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._report(request, stats, response)
+
+    async def __acall__(self, request):
+        # Async views reach the database through sync_to_async, which runs all
+        # of a request's queries on one thread; instrument that thread's connections.
+        await sync_to_async(_instrument_connections)()
+        stats, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._report(request, stats, response)
+
+    def _report(self, request, stats, response):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        elapsed = metrics.observe_request(stats, view, request.method, response.status_code)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_queries} queries"',
+            f'llm;dur={stats.llm_seconds * 1000:.1f};desc="{stats.llm_calls} calls"',
+            f'app;dur={elapsed * 1000:.1f}',
+        ])
+        return response
@@ -50,11 +50,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LTalk.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'LTalk.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +93,24 @@ DATABASES = {
     }
 }
 
+# Read replicas (aliases in DATABASES) used for safe reads from REPLICA_READ_VIEWS
+DATABASE_ROUTERS = ['LTalk.db_router.ReplicaRouter']
+DATABASE_REPLICAS = []
+
+REPLICA_READ_VIEWS = [
+    'explore_sets',
+    'exercise_history',
+    'exercise-history',
+    'wordset_detail',
+    'wordset-list',
+    'wordset-detail',
+    'word-list',
+    'word-detail',
+]
+
+# After a client writes, its reads stay on the primary for this long
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -158,3 +178,110 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 5,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
+
+# Bearer token a scraper sends to read /metrics. When empty only logged-in
+# staff can read it.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'LTalk.log.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'structured': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'api.llm': {
+            'handlers': ['structured'],
+            'level': os.getenv('LLM_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Import and configure the Gemini client at worker start instead of on first use
+LLM_PRELOAD = os.getenv('LLM_PRELOAD', 'False') == 'True'
+
+# Strip diacritics from Word lookup keys, so "kate" matches "katė". Run
+# "manage.py rebuild_word_keys" after changing it.
+WORD_KEY_FOLD_DIACRITICS = os.getenv('WORD_KEY_FOLD_DIACRITICS', 'False') == 'True'
+
+# Serve the Gemini-bound endpoints from async views (api.async_views); for ASGI servers such as uvicorn
+ASYNC_LLM_VIEWS = os.getenv('ASYNC_LLM_VIEWS', 'False') == 'True'
+
+# Gemini requests per minute for this API key (api.llm.budget). Past the safe
+# limit, work that has a local fallback stops calling the model.
+LLM_CALLS_PER_MINUTE = int(os.getenv('LLM_CALLS_PER_MINUTE', '15'))
+LLM_SAFE_CALLS_PER_MINUTE = int(os.getenv('LLM_SAFE_CALLS_PER_MINUTE', '12'))
+
+# Resilience of Gemini calls (api.llm). Each request times out after
+# LLM_TIMEOUT_SECONDS, and a call made while serving a request gives up
+# LLM_REQUEST_DEADLINE_SECONDS after the request started. Timeouts, 429s and
+# server errors are retried up to LLM_RETRIES times with jittered exponential
+# backoff. After LLM_BREAKER_FAILURES failures in a row calls fail at once and
+# views serve their fallbacks, until one trial call after the cooldown succeeds.
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '20'))
+LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv('LLM_REQUEST_DEADLINE_SECONDS', '30'))
+LLM_RETRIES = int(os.getenv('LLM_RETRIES', '2'))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv('LLM_RETRY_BACKOFF_SECONDS', '0.5'))
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv('LLM_BREAKER_COOLDOWN_SECONDS', '30'))
+
+# Identical concurrent prompts share one generation (api.singleflight), within
+# a worker and across workers through the shared cache
+LLM_SINGLE_FLIGHT = os.getenv('LLM_SINGLE_FLIGHT', 'True') == 'True'
+
+# Where multiple-choice distractors come from: 'llm' (Gemini, with the local
+# engine as fallback) or 'local' (api.distractors only)
+MULTIPLE_CHOICE_DISTRACTORS = os.getenv('MULTIPLE_CHOICE_DISTRACTORS', 'llm')
+DISTRACTOR_POOL_SIZE = int(os.getenv('DISTRACTOR_POOL_SIZE', '20000'))
+DISTRACTOR_INDEX_TTL = 10 * 60
+
+# Fill-in-the-gap grading (api.grading): credit per kind of answer, and the
+# edit distance still treated as a typo. Exercises are scored by summed credit.
+GRADING_CREDIT = {'exact': 1.0, 'diacritics': 0.75, 'typo': 0.5, 'wrong_form': 0.0}
+GRADING_TYPO_DISTANCE = int(os.getenv('GRADING_TYPO_DISTANCE', '1'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Two-tier cache for hot reads (main.cache): in-process LRU in front of this shared cache
+HOT_CACHE_ALIAS = 'default'
+HOT_CACHE_TIMEOUT = 60 * 60
+LOCAL_CACHE_SIZE = 2048
+LOCAL_CACHE_TTL = 30
+
+# Generated reading texts kept per wordset content version (api.text_pool)
+TEXT_VARIANT_POOL_SIZE = int(os.getenv('TEXT_VARIANT_POOL_SIZE', '5'))
+TEXT_VARIANT_WORKERS = int(os.getenv('TEXT_VARIANT_WORKERS', '2'))
+# Calls of the per-minute model budget (LLM_SAFE_CALLS_PER_MINUTE) that
+# background refills leave to requests
+TEXT_VARIANT_REFILL_RESERVE = int(os.getenv('TEXT_VARIANT_REFILL_RESERVE', '4'))
+
+# Seconds an unsubmitted generated exercise is kept before purge_exercises may delete it
+EXERCISE_SESSION_TTL = int(os.getenv('EXERCISE_SESSION_TTL', str(24 * 60 * 60)))
+
+# Words in a flashcard or multiple-choice exercise (main.selection)
+REVIEW_BATCH_SIZE = int(os.getenv('REVIEW_BATCH_SIZE', '20'))
+
+# Submissions accepted in one POST to /api/submissions/ (api.submissions)
+SUBMIT_BATCH_MAX = int(os.getenv('SUBMIT_BATCH_MAX', '200'))
+
+# Answer log (main.answer_log). By default submissions update WordProgress and
+# DailyProgress in their transaction, locking the user's rows. Deferred: they
+# only insert events and attempts, and manage.py compact_answer_log folds them
+# into WordProgress and DailyProgress. Events younger than the settle time are
+# left for the next run, so slow transactions commit first.
+ANSWER_LOG_DEFERRED = os.getenv('ANSWER_LOG_DEFERRED', 'False') == 'True'
+ANSWER_LOG_SETTLE_SECONDS = int(os.getenv('ANSWER_LOG_SETTLE_SECONDS', '60'))
+ANSWER_LOG_BATCH_SIZE = int(os.getenv('ANSWER_LOG_BATCH_SIZE', '5000'))
@@ -3,6 +3,9 @@ Production settings for LTalk project when running in Docker.
 """
 import os
 from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
 from .settings import *  # Import base settings
 
 # Set production environment
@@ -11,17 +14,40 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '').split(',')
 
 # Database settings
-DATABASES = {
-    'default': {
+def _postgres(host, port):
+    config = {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
-        'HOST': os.environ.get('DB_HOST'),
-        'PORT': os.environ.get('DB_PORT', '5432'),
+        'HOST': host,
+        'PORT': port,
+        'CONN_HEALTH_CHECKS': True,
     }
+    if os.environ.get('DB_POOL', 'False') == 'True':
+        # psycopg 3's driver-side pool (psycopg[pool] in requirements.txt); incompatible with CONN_MAX_AGE.
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS'] = {'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+        }}
+    else:
+        # Persistent connections reused across requests by each worker thread.
+        config['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+    return config
+
+
+DATABASES = {
+    'default': _postgres(os.environ.get('DB_HOST'), os.environ.get('DB_PORT', '5432')),
 }
 
+# Comma-separated host[:port] list, e.g. DB_REPLICA_HOSTS=replica1,replica2:5433
+for i, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica{i}'] = dict(_postgres(host, port or '5432'), TEST={'MIRROR': 'default'})
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
 # Static files configuration
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -40,11 +66,15 @@ CSRF_COOKIE_SECURE = True
 SECURE_BROWSER_XSS_FILTER = True
 X_FRAME_OPTIONS = 'DENY'
 
-# Cache settings
+# Cache settings: a cache shared by all containers backs the in-process LRU tier.
+# The namespace versions live there, so a per-process cache would leave other
+# workers serving entries that a write has already invalidated (main.cache).
+if not os.environ.get('REDIS_URL'):
+    raise ImproperlyConfigured("REDIS_URL must be set: the hot cache needs a cache shared by all workers")
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': '/tmp/django_cache',
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
     }
 }
 
@@ -52,12 +82,22 @@ CACHES = {
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'LTalk.log.JsonFormatter',
+        },
+    },
     'handlers': {
         'file': {
             'level': 'WARNING',
             'class': 'logging.FileHandler',
             'filename': '/app/logs/django.log',
         },
+        'llm_file': {
+            'class': 'logging.FileHandler',
+            'filename': '/app/logs/llm.jsonl',
+            'formatter': 'json',
+        },
     },
     'loggers': {
         'django': {
@@ -65,5 +105,10 @@ LOGGING = {
             'level': 'WARNING',
             'propagate': True,
         },
+        'api.llm': {
+            'handlers': ['llm_file'],
+            'level': os.environ.get('LLM_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
     },
 } 
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Test helpers for enforcing per-endpoint performance budgets.
+
+Each view has a maximum number of SQL queries and a maximum in-process time.
+Tests wrap a request in ``assertWithinBudget('<name>')``; when a budget is
+exceeded the failure lists the executed SQL grouped by normalized statement,
+so N+1 patterns show up as one statement with a large count.
+"""
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+@dataclass(frozen=True)
+class Budget:
+    queries: int
+    ms: float
+
+
+# Budgets are measured against the fixture built by ``create_budget_fixture``
+# (several wordsets with several words each), so a per-row query pattern
+# blows through them immediately.
+BUDGETS = {
+    # Cold cache: includes computing the progress summary.
+    'home': Budget(queries=4, ms=1500),
+    'wordset_detail': Budget(queries=4, ms=1000),
+    # Summary only; the attempts come from the paginated API.
+    'exercise_history': Budget(queries=4, ms=1000),
+    'wordset-list': Budget(queries=3, ms=1000),
+    # Both include the ETag/Last-Modified validator lookup.
+    'wordset-list-others': Budget(queries=4, ms=1000),
+    'wordset-detail': Budget(queries=3, ms=1000),
+    'word-list': Budget(queries=2, ms=1000),
+    'word-progress-list': Budget(queries=2, ms=1000),
+    'exercise-history': Budget(queries=3, ms=1000),
+    'progress-daily': Budget(queries=1, ms=1000),
+    'exercise-create-flashcard': Budget(queries=9, ms=1000),
+    # Words, progress rows and answer events are read and written in bulk (api.submissions).
+    'submit-exercise': Budget(queries=14, ms=1500),
+    # One exercise in each of five wordsets: fixed cost plus two rollup queries per wordset.
+    'submit-batch': Budget(queries=22, ms=1500),
+}
+
+# Slow CI machines can scale the time budgets without touching query budgets.
+TIME_FACTOR = float(os.getenv('PERF_BUDGET_TIME_FACTOR', '1'))
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)'), '(?, ...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize_sql(sql):
+    for pattern, replacement in _LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def format_queries(queries):
+    grouped = Counter(normalize_sql(q['sql']) for q in queries)
+    lines = [f"{count:4d} x {sql}" for sql, count in grouped.most_common()]
+    return "\n".join(lines)
+
+
+def create_budget_fixture(user, wordsets=5, words=8):
+    """Create wordsets with progress and history for ``user``; returns the wordsets."""
+    from main.models import DailyProgress, WordSet, Word, WordProgress, Exercise, ExerciseProgress
+
+    created = []
+    for n in range(wordsets):
+        wordset = WordSet.objects.create(user=user, title=f"Budget set {n}", public=True)
+        batch = Word.objects.bulk_create([
+            Word(word=f"žodis{n}_{i}", infinitive=f"žodis{n}_{i}", translation=f"word {n} {i}")
+            for i in range(words)
+        ])
+        wordset.words.add(*batch)
+        WordProgress.objects.bulk_create([
+            WordProgress(user=user, word=w, correct_attempts=3, is_learned=i % 2 == 0)
+            for i, w in enumerate(batch)
+        ])
+        exercise = Exercise.objects.create(
+            wordset=wordset, type='flashcard',
+            questions={str(i): {"front": w.word, "back": w.translation} for i, w in enumerate(batch)},
+            correct_answers={str(i): w.translation for i, w in enumerate(batch)},
+        )
+        DailyProgress.record(ExerciseProgress.objects.bulk_create([
+            ExerciseProgress.graded(k, words, user=user, exercise=exercise, user_answer={"0": "x"})
+            for k in range(3)
+        ]))
+        created.append(wordset)
+    return created
+
+
+class PerformanceBudgetMixin:
+    """Adds ``assertWithinBudget`` to a TestCase."""
+
+    budgets = BUDGETS
+
+    @contextmanager
+    def assertWithinBudget(self, name):
+        budget = self.budgets[name]
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            yield ctx
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        problems = []
+        if len(ctx.captured_queries) > budget.queries:
+            problems.append(f"{len(ctx.captured_queries)} queries (budget {budget.queries})")
+        if elapsed_ms > budget.ms * TIME_FACTOR:
+            problems.append(f"{elapsed_ms:.0f} ms (budget {budget.ms * TIME_FACTOR:.0f} ms)")
+        if problems:
+            self.fail(
+                f"'{name}' exceeded its budget: {', '.join(problems)}\n"
+                f"{format_queries(ctx.captured_queries)}"
+            )
@@ -18,8 +18,11 @@ from django.contrib import admin
 from django.urls import path, include
 from django.urls import path, include
 
+from .views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('main.urls')),
     path('auth/', include('authentication.urls')),
     path('api/', include('api.urls')),
@@ -0,0 +1,252 @@
+"""
+Async versions of the endpoints that wait on Gemini.
+
+Under ASGI (uvicorn) these views await the model instead of blocking a
+worker thread, so a single worker can keep many LLM requests in flight.
+They are routed instead of the DRF views when ``ASYNC_LLM_VIEWS`` is set
+(see ``api.urls``) and return the same payloads. DRF has no async views, so
+these are plain Django views: database work runs through ``sync_to_async``
+and reuses the helpers on the DRF view classes. Users are authenticated by
+DRF's configured authentication classes, so session users need a CSRF token
+and Basic auth clients do not, as with the DRF views.
+"""
+import asyncio
+import json
+import logging
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from main.models import Exercise, WordSet
+from main.selection import sample_unlearned
+
+from . import distractors, llm, prompts, singleflight, text_pool
+from .serializer import ExerciseSerializer
+from .views import ExerciseViewSet, ProcessPhotoAPIView, SubmitExerciseAPIView
+
+
+logger = logging.getLogger(__name__)
+
+# Exercise listing, non-generated exercises and the submit description stay on DRF
+exercise_list = ExerciseViewSet.as_view({'get': 'list', 'post': 'create'})
+submit_description = SubmitExerciseAPIView.as_view()
+
+
+def _authenticate(request):
+    """The user DRF's authentication classes find for ``request``, or the APIException they raise."""
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    drf_request = Request(request, authenticators=authenticators)
+    try:
+        user = drf_request.user
+        if not user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+    except exceptions.APIException as e:
+        if isinstance(e, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # As in APIView.handle_exception: 401 only if the first class names a scheme
+            header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+            if header:
+                e.auth_header = header
+            else:
+                e.status_code = 403
+        return e
+    return user
+
+
+def api_login_required(view):
+    """Async counterpart of DRF's authentication and ``IsAuthenticated`` check."""
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await sync_to_async(_authenticate)(request)
+        if isinstance(user, exceptions.APIException):
+            response = JsonResponse({"detail": str(user.detail)}, status=user.status_code)
+            if getattr(user, 'auth_header', None):
+                response['WWW-Authenticate'] = user.auth_header
+            return response
+        # Resolved here so the view never evaluates the lazy user on the event loop
+        request.user = user
+        # Already checked for session users; DRF views this delegates to must not check again
+        request._dont_enforce_csrf_checks = True
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+
+
+@require_http_methods(['POST'])
+@api_login_required
+async def process_photo(request):
+    helper = ProcessPhotoAPIView()
+    if 'image' not in request.FILES:
+        return JsonResponse({"error": "No image file uploaded."}, status=400)
+
+    import PIL.Image
+
+    try:
+        img = PIL.Image.open(request.FILES['image'])
+    except Exception as e:
+        return JsonResponse({"error": f"Error loading image: {e}"}, status=400)
+
+    with llm.call('photo_extraction') as call:
+        try:
+            response = await call.generate_async(prompts.photo_words(img),
+                                                 generation_config=prompts.json_config(prompts.PHOTO_WORDS_SCHEMA))
+        except Exception as e:
+            data, status = helper._processing_error(e)
+        else:
+            data, status = helper._parse_words(call, response)
+    return JsonResponse(data, status=status)
+
+
+@require_http_methods(['GET'])
+@api_login_required
+async def text_exercise(request):
+    wordset_id = request.GET.get('wordset_id')
+    if not wordset_id:
+        return JsonResponse({"error": "wordset_id parameter is required"}, status=400)
+
+    try:
+        wordset = await WordSet.objects.filter(id=wordset_id).afirst()
+        if wordset is None:
+            return JsonResponse({"error": "Wordset not found"}, status=404)
+        words = await sync_to_async(text_pool.wordset_words)(wordset.id)
+        if not words:
+            return JsonResponse({"error": "Wordset has no words"}, status=400)
+
+        if request.GET.get('stream'):
+            response = StreamingHttpResponse(text_pool.astream_variant(wordset, words, request.user),
+                                             content_type='application/x-ndjson')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        return JsonResponse(await text_pool.aget_variant(wordset, words, request.user))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_http_methods(['GET', 'POST'])
+@api_login_required
+async def submit_exercise(request, exercise_id):
+    if request.method == 'GET':
+        return await sync_to_async(submit_description)(request, exercise_id=exercise_id)
+
+    helper = SubmitExerciseAPIView()
+    # An expired session may already be purged; submitting must not revive it
+    exercise = await Exercise.objects.live().filter(id=exercise_id).afirst()
+    if exercise is None:
+        return JsonResponse({"detail": "No Exercise matches the given query."}, status=404)
+    user_answers = (_json_body(request) or {}).get('user_answers')
+    if not user_answers:
+        return JsonResponse({"error": "'user_answers' is required."}, status=400)
+
+    # Feedback for every wrong answer is requested at the same time
+    pending = helper._answers_needing_feedback(exercise, user_answers)
+    texts = await asyncio.gather(*(_feedback(helper, *item[1:]) for item in pending))
+    feedback = {item[0]: text for item, text in zip(pending, texts)}
+
+    data = await sync_to_async(helper._record_submission)(request.user, exercise, user_answers, feedback)
+    return JsonResponse(data)
+
+
+async def _feedback(helper, question_data, user_answer, correct_answer):
+    with llm.call('feedback') as call:
+        try:
+            response = await call.generate_async(prompts.feedback(question_data, user_answer, correct_answer))
+            return response.text.strip()
+        except Exception as e:
+            return helper._feedback_failed(call, e, correct_answer)
+
+
+@require_http_methods(['GET', 'POST', 'HEAD', 'OPTIONS'])
+@api_login_required
+async def exercise_collection(request):
+    """``/api/exercise/``: multiple choice and fill-in-gap creation are generated here, the rest goes to DRF."""
+    if request.method != 'POST':
+        return await sync_to_async(exercise_list)(request)
+
+    data = _json_body(request)
+    if data is None:
+        return await sync_to_async(exercise_list)(request)
+    serializer = ExerciseSerializer(data=data)
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+
+    exercise_type = serializer.validated_data['type']
+    generated = exercise_type == 'fill_in_gap' or (
+        exercise_type == 'multiple_choice' and not serializer.validated_data.get('questions'))
+    if not generated:
+        return await sync_to_async(exercise_list)(request)
+
+    helper = ExerciseViewSet()
+    wordset = serializer.validated_data['wordset']
+    if exercise_type == 'multiple_choice':
+        words = await sync_to_async(sample_unlearned)(request.user, wordset, settings.REVIEW_BATCH_SIZE)
+        questions, correct_answers = await _m_choice_data(helper, words, request.user)
+    else:
+        words = await sync_to_async(helper._fill_in_gap_words)(wordset, request.user)
+        if words:
+            questions, correct_answers = await _fill_in_gap_data(helper, words)
+        else:
+            questions, correct_answers = helper._empty_fill_in_gap()
+    instance = await sync_to_async(helper._save_session)(serializer, questions, correct_answers)
+
+    return JsonResponse(await sync_to_async(lambda: ExerciseSerializer(instance).data)(), status=201)
+
+
+async def _m_choice_data(helper, words, user):
+    if helper._local_m_choice():
+        return helper._m_choice_data(await sync_to_async(distractors.multiple_choice_questions)(words, user))
+    with llm.call('multiple_choice') as call:
+        try:
+            text = await singleflight.agenerate(call, helper._m_choice_prompt(words),
+                                                generation_config=prompts.json_config(prompts.MULTIPLE_CHOICE_SCHEMA))
+            questions_list = prompts.parse(call, text, list)
+        except Exception as e:
+            questions_list = await sync_to_async(helper._m_choice_failed)(call, e, words, user)
+    return helper._m_choice_data(questions_list)
+
+
+async def _fill_in_gap_data(helper, words):
+    """
+    All sentences are requested concurrently, up to the per-minute LLM budget
+    (``llm.budget``). Words over the budget get a stored template or a basic gap
+    rather than holding the request until the window frees up.
+    """
+    questions = {}
+    correct_answers = {}
+    budget = llm.budget.remaining()
+
+    async def generate(i, word):
+        with llm.call('fill_in_gap') as call:
+            try:
+                response = await call.generate_async(prompts.fill_in_gap(word),
+                                                     generation_config=prompts.json_config(prompts.FILL_IN_GAP_SCHEMA))
+            except Exception as e:
+                await sync_to_async(helper._fill_in_gap_failed)(call, e, word, i, questions, correct_answers)
+            else:
+                await sync_to_async(helper._fill_in_gap_question_from)(
+                    call, response, word, i, questions, correct_answers)
+
+    await asyncio.gather(*(generate(i, word) for i, word in enumerate(words[:budget])))
+    for i, word in enumerate(words[budget:], start=budget):
+        if await sync_to_async(helper._template_question)(word, i, questions, correct_answers):
+            llm.record_fallback('fill_in_gap', 'template', reason='rate_limit')
+        else:
+            helper._basic_question(word, i, questions, correct_answers)
+            llm.record_fallback('fill_in_gap', 'basic', reason='rate_limit')
+
+    order = sorted(questions, key=int)
+    return {k: questions[k] for k in order}, {k: correct_answers[k] for k in order}
@@ -0,0 +1,164 @@
+"""
+Local distractors for multiple-choice questions.
+
+A multiple-choice question needs three wrong English answers per word.
+Instead of asking Gemini, they are picked from translations already stored:
+first from the user's own wordsets, then from the shared word table. The
+candidates are ranked by part of speech, length and character-trigram
+similarity to the correct answer, so "to walk" gets other verbs and "house"
+other short nouns.
+
+Each pool is kept as a ``DistractorIndex`` with trigram and length postings,
+held per process for ``DISTRACTOR_INDEX_TTL`` seconds. The user's index is
+also keyed on their wordset cache version, so it is rebuilt as soon as their
+words change. Ranking a question only touches the postings of its own
+trigrams and length, so a 50-question exercise takes milliseconds.
+"""
+import heapq
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from main import cache as hot_cache
+from main.models import Word, lookup_key
+
+
+# English translations of verbs start with "to"; Lithuanian infinitives end in -ti/-tis
+VERB_INFINITIVE_ENDINGS = ('ti', 'tis')
+ADJECTIVE_ENDINGS = ('ful', 'less', 'ous', 'ive', 'able', 'ible', 'ish')
+
+# Postings read per trigram or length, so very common trigrams stay cheap
+MAX_POSTINGS = 200
+LENGTH_WINDOW = 2
+# Candidates this similar read as a second right answer ("house" / "houses")
+NEAR_DUPLICATE = 0.7
+PART_OF_SPEECH_WEIGHT = 2.0
+
+_indexes = hot_cache.LocalLRU(256, settings.DISTRACTOR_INDEX_TTL)
+
+
+def part_of_speech(translation, infinitive=""):
+    """Rough part of speech from the English translation and the Lithuanian infinitive."""
+    text = lookup_key(translation)
+    if text.startswith("to ") or lookup_key(infinitive).endswith(VERB_INFINITIVE_ENDINGS):
+        return 'verb'
+    if " " in text:
+        return 'phrase'
+    if text.endswith("ly"):
+        return 'adverb'
+    if text.endswith(ADJECTIVE_ENDINGS):
+        return 'adjective'
+    return 'noun'
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DistractorIndex:
+    """Distinct translations with trigram and length postings for nearest-neighbour lookups."""
+
+    def __init__(self, entries):
+        self.texts = []
+        self.keys = []
+        self.grams = []
+        self.parts = []
+        self.by_gram = defaultdict(list)
+        self.by_length = defaultdict(list)
+        seen = set()
+        for translation, infinitive in entries:
+            key = lookup_key(translation)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            n = len(self.texts)
+            grams = trigrams(key)
+            self.texts.append(translation.strip())
+            self.keys.append(key)
+            self.grams.append(grams)
+            self.parts.append(part_of_speech(translation, infinitive))
+            for gram in grams:
+                self.by_gram[gram].append(n)
+            self.by_length[len(key)].append(n)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def neighbours(self, translation, infinitive="", k=3, exclude=()):
+        """Up to ``k`` stored translations most like ``translation`` without meaning the same."""
+        key = lookup_key(translation)
+        grams = trigrams(key)
+        part = part_of_speech(translation, infinitive)
+
+        shared = Counter()
+        for gram in grams:
+            for n in self.by_gram.get(gram, ())[:MAX_POSTINGS]:
+                shared[n] += 1
+        for length in range(len(key) - LENGTH_WINDOW, len(key) + LENGTH_WINDOW + 1):
+            for n in self.by_length.get(length, ())[:MAX_POSTINGS]:
+                shared[n] += 0
+        if len(shared) <= k:
+            # Nothing alike in a small pool; rank whatever there is
+            for n in range(min(len(self.texts), MAX_POSTINGS)):
+                shared[n] += 0
+
+        excluded = {key, *exclude}
+        ranked = []
+        for n, common in shared.items():
+            if self.keys[n] in excluded:
+                continue
+            similarity = common / (len(grams) + len(self.grams[n]) - common)
+            if similarity >= NEAR_DUPLICATE:
+                continue
+            score = (PART_OF_SPEECH_WEIGHT * (self.parts[n] == part) + similarity
+                     + 1 / (1 + abs(len(self.keys[n]) - len(key))))
+            ranked.append((score, n))
+        return [self.texts[n] for _, n in heapq.nlargest(k, ranked)]
+
+
+def _cached(key, build):
+    index = _indexes.get(key, None)
+    if index is None:
+        index = build()
+        _indexes.set(key, index)
+    return index
+
+
+def user_index(user):
+    """Translations from every wordset ``user`` owns."""
+    version, = hot_cache.versions([hot_cache.owner_ns(user.pk)])
+    return _cached(f"user:{user.pk}@{version}", lambda: DistractorIndex(
+        Word.objects.filter(wordsets__user=user).order_by().distinct()
+        .values_list('translation', 'infinitive')[:settings.DISTRACTOR_POOL_SIZE]
+    ))
+
+
+def shared_index():
+    """The most recently added translations across all users."""
+    return _cached("shared", lambda: DistractorIndex(
+        Word.objects.order_by('-id').values_list('translation', 'infinitive')[:settings.DISTRACTOR_POOL_SIZE]
+    ))
+
+
+def distractors(word, pools, k=3):
+    """``k`` wrong answers for ``word``, taken from the first pool that has enough."""
+    picked = []
+    for index in pools:
+        picked += index.neighbours(word.translation, word.infinitive, k - len(picked),
+                                   exclude={lookup_key(text) for text in picked})
+        if len(picked) >= k:
+            break
+    return picked
+
+
+def multiple_choice_questions(words, user, rng=random):
+    """``[{"question", "choices", "correct"}]`` for ``words``, the shape the LLM is asked for."""
+    pools = [user_index(user), shared_index()]
+    questions = []
+    for word in words:
+        choices = [word.translation, *distractors(word, pools)]
+        rng.shuffle(choices)
+        questions.append({"question": word.word, "choices": choices, "correct": word.translation})
+    return questions
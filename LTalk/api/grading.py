@@ -0,0 +1,129 @@
+"""
+Local grading of fill-in-the-gap answers.
+
+Every wrong answer used to get a Gemini explanation, even a missing
+diacritic or a slipped key. Answers are now classified first:
+
+- ``exact``: matches the correct form, ignoring case and extra spaces;
+- ``diacritics``: matches once diacritics are removed (``keltu`` for ``kėltų``);
+- ``typo``: within ``GRADING_TYPO_DISTANCE`` edits (a transposition counts as
+  one) of the correct form, with the word's ending intact;
+- ``wrong_form``: anything else, usually the wrong ending for the case,
+  tense or person.
+
+Each kind earns the partial credit set in ``GRADING_CREDIT``. An exercise is
+scored by the summed credit of its answers, and only full credit counts as a
+correct answer; a near miss reschedules its word as recalled with difficulty.
+Near misses get templated feedback, and only ``wrong_form`` answers are sent
+to the model for an explanation.
+"""
+import unicodedata
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from main.models import SM2_CORRECT_GRADE, SM2_HARD_GRADE, SM2_WRONG_GRADE
+
+
+EXACT = 'exact'
+DIACRITICS = 'diacritics'
+TYPO = 'typo'
+WRONG_FORM = 'wrong_form'
+
+# Lithuanian inflection changes the last few letters, so an edit there is a
+# different form of the word rather than a typo
+ENDING_LENGTH = 3
+
+
+@dataclass(frozen=True)
+class Grade:
+    kind: str
+    credit: float
+    feedback: str = ""
+
+    @property
+    def correct(self):
+        """Full credit."""
+        return self.credit >= 1
+
+    @property
+    def review_grade(self):
+        """SM-2 grade for rescheduling the word: near misses count as recalled with difficulty."""
+        if self.correct:
+            return SM2_CORRECT_GRADE
+        return SM2_HARD_GRADE if self.credit > 0 else SM2_WRONG_GRADE
+
+    @property
+    def needs_explanation(self):
+        """Whether the model should explain the mistake."""
+        return self.kind == WRONG_FORM and not self.feedback
+
+
+def normalize(text):
+    return unicodedata.normalize('NFC', " ".join((text or "").split()).casefold())
+
+
+def strip_diacritics(text):
+    return "".join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def _changed_in_ending(answer, correct):
+    common = 0
+    for x, y in zip(answer, correct):
+        if x != y:
+            break
+        common += 1
+    return common >= len(correct) - ENDING_LENGTH
+
+
+def _diacritic_hint(answer, correct):
+    missed = [f"'{a}' should be '{c}'" for a, c in zip(answer, correct) if a != c]
+    return ", ".join(missed)
+
+
+def classify(user_answer, correct_answer):
+    """The kind of match between ``user_answer`` and ``correct_answer``."""
+    answer, correct = normalize(user_answer), normalize(correct_answer)
+    if not answer or not correct:
+        return WRONG_FORM
+    if answer == correct:
+        return EXACT
+    if strip_diacritics(answer) == strip_diacritics(correct):
+        return DIACRITICS
+    limit = settings.GRADING_TYPO_DISTANCE
+    if edit_distance(answer, correct, limit) <= limit and not _changed_in_ending(answer, correct):
+        return TYPO
+    return WRONG_FORM
+
+
+def grade(user_answer, correct_answer):
+    """``Grade`` for one fill-in-the-gap answer, with local feedback where no explanation is needed."""
+    kind = classify(user_answer, correct_answer)
+    credit = settings.GRADING_CREDIT.get(kind, 0.0)
+    if kind == DIACRITICS:
+        hint = _diacritic_hint(normalize(user_answer), normalize(correct_answer))
+        feedback = f"Almost: mind the diacritics ({hint}). The correct form is '{correct_answer}'."
+    elif kind == TYPO:
+        feedback = f"Looks like a typo. The correct form is '{correct_answer}'."
+    elif kind == WRONG_FORM and not normalize(user_answer):
+        feedback = f"The correct answer is '{correct_answer}'."
+    else:
+        feedback = ""
+    return Grade(kind, credit, feedback)
@@ -0,0 +1,415 @@
+import asyncio
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from dotenv import load_dotenv
+
+from LTalk import metrics
+
+
+logger = logging.getLogger('api.llm')
+
+MODEL_NAME = 'gemini-2.0-flash'
+
+# The Gemini client is heavy to import and needs an API key, so it is only
+# created on first use (or by warm_up() in workers that want it preloaded).
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+
+                # Load environment variables from .env file
+                load_dotenv()
+                api_key = os.getenv('GOOGLE_API_KEY')
+                if not api_key:
+                    raise ImproperlyConfigured("Please set the GOOGLE_API_KEY in your .env file.")
+                genai.configure(api_key=api_key)
+                _model = genai.GenerativeModel(MODEL_NAME)
+    return _model
+
+
+def warm_up():
+    """Import and configure the LLM client and imaging library ahead of the first request."""
+    started = time.perf_counter()
+    import PIL.Image  # noqa: F401
+    get_model()
+    logger.info("llm_warm_up", extra={'llm': {'latency_ms': round((time.perf_counter() - started) * 1000, 1)}})
+
+
+class RateBudget:
+    """
+    Model requests this process made in the last ``window`` seconds.
+
+    Gemini limits requests per minute per API key. Work that can also be done
+    without the model checks ``remaining()`` first and switches to its
+    fallback instead of queueing behind the limit. Every request made through
+    ``LLMCall`` is counted.
+    """
+
+    def __init__(self, limit, safe_limit, window=60):
+        self.limit = limit
+        self.safe_limit = safe_limit
+        self.window = window
+        self._requests = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._requests and self._requests[0] <= now - self.window:
+            self._requests.popleft()
+
+    def record(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def used(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return len(self._requests)
+
+    def remaining(self):
+        """Requests left before the safety margin under the limit is reached."""
+        return max(self.safe_limit - self.used(), 0)
+
+    def exhausted(self):
+        return self.remaining() == 0
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+
+
+budget = RateBudget(settings.LLM_CALLS_PER_MINUTE, settings.LLM_SAFE_CALLS_PER_MINUTE)
+
+
+CALLS = metrics.register(metrics.Counter(
+    'ltalk_llm_calls_total', "LLM calls by prompt type and outcome.", ('prompt_type', 'outcome')))
+CALL_SECONDS = metrics.register(metrics.Histogram(
+    'ltalk_llm_call_seconds', "LLM latency per call including retries.", ('prompt_type', 'outcome'),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)))
+TOKENS = metrics.register(metrics.Counter(
+    'ltalk_llm_tokens_total', "Tokens sent to and received from the LLM.", ('prompt_type', 'direction')))
+RETRIES = metrics.register(metrics.Counter(
+    'ltalk_llm_retries_total', "Repeated model requests within one call.", ('prompt_type',)))
+PARSE_FAILURES = metrics.register(metrics.Counter(
+    'ltalk_llm_parse_failures_total', "Responses that could not be parsed.", ('prompt_type',)))
+FALLBACKS = metrics.register(metrics.Counter(
+    'ltalk_llm_fallbacks_total', "Results served from a fallback instead of the LLM.", ('prompt_type', 'kind')))
+COALESCED = metrics.register(metrics.Counter(
+    'ltalk_llm_coalesced_total', "Calls that shared an identical in-flight generation.", ('prompt_type',)))
+CIRCUIT_OPENED = metrics.register(metrics.Counter(
+    'ltalk_llm_circuit_opened_total', "Times the LLM circuit breaker opened."))
+
+
+class LLMUnavailable(Exception):
+    """The model was not called: the circuit is open or the call's deadline has passed."""
+
+    def __init__(self, reason):
+        super().__init__(f"LLM unavailable ({reason})")
+        self.reason = reason
+
+
+def transient(error):
+    """True for failures worth retrying: timeouts, rate limiting and server errors."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    from google.api_core import exceptions
+
+    return isinstance(error, (exceptions.ServerError, exceptions.TooManyRequests, exceptions.RetryError))
+
+
+class CircuitBreaker:
+    """
+    Consecutive transient failures of model requests in this process.
+
+    After ``threshold`` of them the circuit opens: ``acquire()`` refuses
+    requests, so callers go straight to their fallbacks instead of waiting for
+    a failure. Every ``cooldown`` seconds one trial request is let through; a
+    success closes the circuit and a failure keeps it open.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """True if a request may be made now."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now < self._opened_at + self.cooldown:
+                return False
+            # The trial request; the next one waits for another cooldown
+            self._opened_at = now
+            return True
+
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def record_success(self):
+        """The model answered (even with an error that retrying would not fix)."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            opened = self._opened_at is None and self._failures >= self.threshold
+            if opened or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+        if opened:
+            CIRCUIT_OPENED.inc()
+            logger.warning("llm_circuit_open", extra={'llm': {'failures': self.threshold}})
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+
+breaker = CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_COOLDOWN_SECONDS)
+
+
+class LLMCall:
+    """
+    Telemetry for one logical model call.
+
+    Use as a context manager; ``generate`` may be invoked more than once
+    (every extra invocation counts as a retry). On exit the call is logged
+    to ``api.llm`` and folded into the LLM metrics.
+
+    Every request has a timeout, and all of them must finish by the call's
+    deadline: ``LLM_REQUEST_DEADLINE_SECONDS`` after the current HTTP request
+    started, or after the call was created outside a request. Transient
+    failures are retried with jittered backoff while the deadline allows.
+    ``LLMUnavailable`` is raised without calling the model once the deadline
+    has passed or while the circuit ``breaker`` is open.
+    """
+
+    def __init__(self, prompt_type):
+        self.prompt_type = prompt_type
+        self.attempts = 0
+        self.seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.parse_failures = 0
+        self.fallback = None
+        self.fallback_reason = None
+        self.error = None
+        # Waited for an identical call's response (api.singleflight) instead of requesting one
+        self.coalesced = False
+        stats = metrics.current_stats()
+        started = stats.started if stats is not None else time.perf_counter()
+        self.deadline = started + settings.LLM_REQUEST_DEADLINE_SECONDS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.error is None and not self.parse_failures:
+            self.error = exc_type.__name__
+        self._emit()
+        return False
+
+    def _admit(self):
+        """``request_options`` for the next request; raises LLMUnavailable if none may be made."""
+        remaining = self.deadline - time.perf_counter()
+        if remaining <= 0:
+            reason = 'deadline'
+        elif not breaker.acquire():
+            reason = 'circuit_open'
+        else:
+            self.attempts += 1
+            budget.record()
+            # The client's own retries would ignore the deadline
+            return {'timeout': min(settings.LLM_TIMEOUT_SECONDS, remaining), 'retry': None}
+        self.error = LLMUnavailable.__name__
+        raise LLMUnavailable(reason)
+
+    def _failed(self, error, retries):
+        """Seconds to wait before retrying after ``error``; None to give up."""
+        self.error = type(error).__name__
+        if not transient(error):
+            breaker.record_success()
+            return None
+        breaker.record_failure()
+        if retries >= settings.LLM_RETRIES:
+            return None
+        delay = random.uniform(0, settings.LLM_RETRY_BACKOFF_SECONDS * 2 ** retries)
+        if time.perf_counter() + delay >= self.deadline:
+            return None
+        return delay
+
+    def _succeeded(self, response):
+        self.error = None
+        breaker.record_success()
+        self._count_usage(response)
+        return response
+
+    def _finished_request(self, started):
+        elapsed = time.perf_counter() - started
+        self.seconds += elapsed
+        metrics.record_llm_call(elapsed)
+
+    def generate(self, contents, **kwargs):
+        for retries in itertools.count():
+            options = self._admit()
+            started = time.perf_counter()
+            try:
+                return self._succeeded(get_model().generate_content(contents, request_options=options, **kwargs))
+            except Exception as e:
+                delay = self._failed(e, retries)
+                if delay is None:
+                    raise
+            finally:
+                self._finished_request(started)
+            time.sleep(delay)
+
+    async def generate_async(self, contents, **kwargs):
+        """``generate`` for async views: the event loop stays free while the model works."""
+        for retries in itertools.count():
+            options = self._admit()
+            started = time.perf_counter()
+            try:
+                return self._succeeded(
+                    await get_model().generate_content_async(contents, request_options=options, **kwargs))
+            except Exception as e:
+                delay = self._failed(e, retries)
+                if delay is None:
+                    raise
+            finally:
+                self._finished_request(started)
+            await asyncio.sleep(delay)
+
+    def _count_usage(self, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.input_tokens += getattr(usage, 'prompt_token_count', 0) or 0
+            self.output_tokens += getattr(usage, 'candidates_token_count', 0) or 0
+
+    def stream(self, contents, **kwargs):
+        """
+        Like ``generate`` but yields the response text chunk by chunk as it is
+        produced. Not retried, since chunks may already have been shown.
+        """
+        options = self._admit()
+        started = time.perf_counter()
+        try:
+            response = get_model().generate_content(contents, stream=True, request_options=options, **kwargs)
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            self._failed(e, settings.LLM_RETRIES)
+            raise
+        finally:
+            self._finished_request(started)
+
+        # Usage is only complete once the whole stream has been consumed
+        self._succeeded(response)
+
+    async def stream_async(self, contents, **kwargs):
+        options = self._admit()
+        started = time.perf_counter()
+        try:
+            response = await get_model().generate_content_async(contents, stream=True, request_options=options,
+                                                                **kwargs)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            self._failed(e, settings.LLM_RETRIES)
+            raise
+        finally:
+            self._finished_request(started)
+
+        self._succeeded(response)
+
+    def parse_failed(self):
+        self.parse_failures += 1
+
+    def used_fallback(self, kind, reason=None):
+        """Record that a ``SentenceTemplate``, basic or other fallback was served."""
+        self.fallback = kind
+        self.fallback_reason = reason
+
+    @property
+    def outcome(self):
+        if self.error:
+            return 'error'
+        if self.parse_failures:
+            return 'parse_error'
+        return 'ok'
+
+    def _emit(self):
+        outcome = self.outcome
+        if self.attempts:
+            CALLS.inc(prompt_type=self.prompt_type, outcome=outcome)
+            CALL_SECONDS.observe(self.seconds, prompt_type=self.prompt_type, outcome=outcome)
+            TOKENS.inc(self.input_tokens, prompt_type=self.prompt_type, direction='input')
+            TOKENS.inc(self.output_tokens, prompt_type=self.prompt_type, direction='output')
+        if self.attempts > 1:
+            RETRIES.inc(self.attempts - 1, prompt_type=self.prompt_type)
+        if self.parse_failures:
+            PARSE_FAILURES.inc(self.parse_failures, prompt_type=self.prompt_type)
+        if self.coalesced:
+            COALESCED.inc(prompt_type=self.prompt_type)
+        if self.fallback:
+            FALLBACKS.inc(prompt_type=self.prompt_type, kind=self.fallback)
+
+        level = logging.WARNING if self.error or self.parse_failures else logging.INFO
+        logger.log(level, "llm_call", extra={'llm': {
+            'prompt_type': self.prompt_type,
+            'outcome': outcome,
+            'attempts': self.attempts,
+            'retries': max(self.attempts - 1, 0),
+            'latency_ms': round(self.seconds * 1000, 1),
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'parse_failures': self.parse_failures,
+            'fallback': self.fallback,
+            'fallback_reason': self.fallback_reason,
+            'coalesced': self.coalesced,
+            'error': self.error,
+        }})
+
+
+def call(prompt_type):
+    return LLMCall(prompt_type)
+
+
+def generate(contents, prompt_type, **kwargs):
+    """Single model call with telemetry, for sites that need no parse/fallback reporting."""
+    with LLMCall(prompt_type) as c:
+        return c.generate(contents, **kwargs)
+
+
+def fallback_reason(error, default='error'):
+    """The ``fallback_reason`` to record for ``error``: why the model was not called, or ``default``."""
+    return error.reason if isinstance(error, LLMUnavailable) else default
+
+
+def record_fallback(prompt_type, kind, reason=None):
+    """Record a fallback that was served without calling the model at all."""
+    with LLMCall(prompt_type) as c:
+        c.used_fallback(kind, reason)
@@ -0,0 +1,132 @@
+"""
+Prompts and response schemas for the model calls.
+
+Every prompt is a list of parts: a static instruction block, identical on
+every call of its kind, followed by the request's data. Keeping the variable
+part last lets the provider reuse the cached prefix. Data is encoded
+compactly: one ``word: translation`` line per word rather than indented JSON.
+
+Calls that return data ask for Gemini's JSON output mode with a response
+schema (``json_config()``), so replies are bare JSON matching the schema and
+are read with ``parse()``. Nothing is scraped from free text with a regex.
+Feedback is plain prose and uses no schema. The streamed text exercise puts
+the passage first as plain text so it can be shown while the questions are
+generated; only its questions section is JSON.
+"""
+import json
+
+
+def _array(items):
+    return {'type': 'array', 'items': items}
+
+
+def _object(**properties):
+    return {'type': 'object', 'properties': properties, 'required': list(properties)}
+
+
+STRING = {'type': 'string'}
+
+MULTIPLE_CHOICE_SCHEMA = _array(_object(question=STRING, choices=_array(STRING), correct=STRING))
+FILL_IN_GAP_SCHEMA = _object(sentence=STRING, correct_form=STRING)
+PHOTO_WORDS_SCHEMA = _array(_object(word=STRING, translation=STRING, infinitive=STRING))
+TEXT_QUESTIONS_SCHEMA = _array(_object(question=STRING, choices=_array(STRING), correct_answer=STRING))
+TEXT_EXERCISE_SCHEMA = _object(text=STRING, questions=TEXT_QUESTIONS_SCHEMA)
+
+
+def json_config(schema):
+    """``generation_config`` for a reply that is JSON matching ``schema``."""
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+
+def parse(call, text, expected):
+    """The JSON reply ``text`` as an ``expected`` (``list`` or ``dict``); raises ValueError otherwise."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        call.parse_failed()
+        raise ValueError(f"JSON parsing error: {e}")
+    if not isinstance(data, expected):
+        call.parse_failed()
+        raise ValueError(f"Response is not a {expected.__name__}")
+    return data
+
+
+def word_lines(words):
+    """``word: translation`` per line, for ``Word`` objects or dicts."""
+    return "\n".join(
+        f"{w['word']}: {w['translation']}" if isinstance(w, dict) else f"{w.word}: {w.translation}"
+        for w in words
+    )
+
+
+MULTIPLE_CHOICE = (
+    "Write a multiple-choice question for each Lithuanian word below (one 'word: English translation' per line). "
+    "The question is the Lithuanian word. Give four English choices: its translation, which is also 'correct', "
+    "and three plausible but wrong translations.\n\nWords:\n"
+)
+
+
+def multiple_choice(words):
+    return [MULTIPLE_CHOICE, word_lines(words)]
+
+
+FILL_IN_GAP = (
+    "Write one complete, beginner-friendly Lithuanian sentence using the given word, with enough context for a "
+    "learner. Use an inflected form of the word (another case for a noun, another tense or person for a verb) "
+    "and replace it with '___'. Never return a fragment, the word alone or a placeholder. "
+    "'correct_form' is the form that fills the gap.\nExample: {\"sentence\": \"Man patinka keliauti su ___ "
+    "per upę.\", \"correct_form\": \"keltu\"}\n\nWord: "
+)
+
+
+def fill_in_gap(word):
+    return [FILL_IN_GAP, f"{word.word} ({word.translation})"]
+
+
+FEEDBACK = (
+    "A learner of Lithuanian filled the gap in the sentence below with a wrong form of the word. In 2-3 clear "
+    "sentences explain why the answer is wrong, which grammar rule applies and how the correct form is built "
+    "from the base form. Focus on Lithuanian grammar.\n\n"
+)
+
+
+def feedback(question_data, user_answer, correct_answer):
+    return [FEEDBACK, (
+        f"Sentence: {question_data.get('sentence', '')}\n"
+        f"Base form: {question_data.get('infinitive', '')}\n"
+        f"Correct form: {correct_answer}\n"
+        f"Answer: {user_answer}"
+    )]
+
+
+PHOTO_WORDS = (
+    "Extract only the Lithuanian words from the image. For each give 'word' exactly as it appears, its English "
+    "'translation' and 'infinitive': its dictionary form in the same part of speech. Despite the name, "
+    "'infinitive' is a verb's infinitive only for verbs: use the nominative singular for nouns and the masculine "
+    "nominative singular for adjectives. Never turn a noun into a verb (the base form of 'stalo' is 'stalas', "
+    "not 'stalauti')."
+)
+
+
+def photo_words(image):
+    return [PHOTO_WORDS, image]
+
+
+TEXT_EXERCISE = (
+    "You are a Lithuanian teacher for beginners. Using the vocabulary below (one 'word: English translation' "
+    "per line), write a coherent, meaningful Lithuanian text with beginner-friendly grammar that uses at least "
+    "half of the words. Then write 5 multiple-choice comprehension questions about it in simple Lithuanian, "
+    "of varying difficulty, each with 4 choices; 'correct_answer' repeats the right choice.\n"
+)
+
+QUESTIONS_MARKER = "###QUESTIONS###"
+
+TEXT_EXERCISE_STREAMED = TEXT_EXERCISE + (
+    "Reply with the text alone as plain text, without a heading or formatting, then a line containing only "
+    f"{QUESTIONS_MARKER}, then the questions as a JSON array of objects with 'question', 'choices' and "
+    "'correct_answer', without code fences.\n"
+)
+
+
+def text_exercise(words, streamed=False):
+    return [TEXT_EXERCISE_STREAMED if streamed else TEXT_EXERCISE, "\nVocabulary:\n" + word_lines(words)]
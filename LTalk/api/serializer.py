@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from main.models import ExerciseProgress, Word, WordSet, WordProgress, Exercise
+from django.conf import settings
+from main.models import ExerciseProgress, Word, WordSet, WordProgress, Exercise, lookup_key
 from authentication.serializer import UserSerializer
 
 class WordSerializer(serializers.ModelSerializer):
@@ -25,10 +26,32 @@ class WordSetSerializer(serializers.ModelSerializer):
         words = validated_data.pop('words')
         wordset = self.Meta.model.objects.create(**validated_data)
 
+        existing = self._existing_words(words)
         for word in words:
-            w, _ = Word.objects.get_or_create(word=word['word'], defaults=word)
-            wordset.words.add(w)
+            spelling = self._spelling(word['word'])
+            if spelling not in existing:
+                # Later entries with the same spelling reuse this one
+                existing[spelling] = Word.objects.create(**word)
+        # One add() call so the membership signals fire once for the whole set
+        wordset.words.add(*[existing[self._spelling(word['word'])] for word in words])
         return wordset
+
+    @staticmethod
+    def _spelling(text):
+        return " ".join(text.split()).casefold()
+
+    def _existing_words(self, words):
+        """
+        ``{spelling: Word}`` for stored words matching ``words`` apart from case
+        and whitespace, found through the indexed key. Keys are not unique: the
+        oldest of several case variants wins, and with WORD_KEY_FOLD_DIACRITICS
+        a word whose key matches but whose diacritics differ is not reused.
+        """
+        existing = {}
+        candidates = Word.objects.filter(word_key__in={lookup_key(word['word']) for word in words}).order_by('pk')
+        for candidate in candidates:
+            existing.setdefault(self._spelling(candidate.word), candidate)
+        return existing
     
     def update(self, instance, validated_data):
         instance.public = validated_data.get('public', instance.public)
@@ -40,7 +63,7 @@ class WordProgressSerializer(serializers.ModelSerializer):
     class Meta:
         model = WordProgress
         fields = "__all__"
-        read_only_fields = ['id', 'user', 'word']
+        read_only_fields = ['id', 'user', 'word', 'repetitions', 'interval_days', 'ease_factor', 'due_at']
         unique_together = ('user', 'word')
 
     # override validate function
@@ -58,8 +81,10 @@ class WordProgressSerializer(serializers.ModelSerializer):
 
         if correct == 1:
             instance.correct_attempts += 1
+            instance.schedule(True)
         elif incorrect == 1:
             instance.incorrect_attempts += 1
+            instance.schedule(False)
 
         instance.is_learned = instance.correct_attempts > instance.incorrect_attempts
         instance.save()
@@ -78,7 +103,7 @@ class ExerciseSerializer(serializers.ModelSerializer):
         # unique_together = ('wordset', 'type')
 
     def create(self, validated_data):
-        # Remove timestamp field if present as it's not part of the model
+        # Sent by older clients to force a fresh exercise; every generated exercise is one now
         validated_data.pop('timestamp', None)
         return super().create(validated_data)
 
@@ -109,11 +134,42 @@ class ExerciseSerializer(serializers.ModelSerializer):
         return data
     
 
+class ExerciseHistorySerializer(serializers.ModelSerializer):
+    """One attempt in the history listing; expects the ``exercise_type`` annotation."""
+    type = serializers.CharField(source='exercise_type', read_only=True)
+
+    class Meta:
+        model = ExerciseProgress
+        fields = ['id', 'exercise', 'type', 'is_correct', 'grade', 'answered_at']
+        read_only_fields = fields
+
+
+class ExerciseHistorySummarySerializer(serializers.Serializer):
+    type = serializers.CharField()
+    label = serializers.CharField()
+    attempts = serializers.IntegerField()
+    correct = serializers.IntegerField()
+    answers_correct = serializers.FloatField()
+    answers_total = serializers.IntegerField()
+    accuracy = serializers.IntegerField()
+    last_attempt = serializers.DateTimeField()
+
+
+class DailyProgressSerializer(serializers.Serializer):
+    day = serializers.DateField()
+    attempts = serializers.IntegerField()
+    correct_attempts = serializers.IntegerField()
+    answers_correct = serializers.FloatField()
+    answers_total = serializers.IntegerField()
+    accuracy = serializers.IntegerField()
+
+
 class ExerciseProgressSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExerciseProgress
-        fields = ['id', 'user', 'exercise', 'user_answer', 'is_correct', 'answered_at', 'grade']
-        read_only_fields = ['id', 'answered_at']
+        fields = ['id', 'user', 'exercise', 'user_answer', 'is_correct', 'answered_at', 'grade',
+                  'correct_count', 'total_count']
+        read_only_fields = ['id', 'answered_at', 'correct_count', 'total_count']
 
     def validate_user_answer(self, value):
         if not value:
@@ -124,3 +180,12 @@ class ExerciseProgressSerializer(serializers.ModelSerializer):
         if 'is_correct' not in data:
             raise serializers.ValidationError("The field 'is_correct' must be provided.")
         return data
+
+
+class SubmissionSerializer(serializers.Serializer):
+    exercise = serializers.IntegerField()
+    user_answers = serializers.DictField(child=serializers.CharField(allow_blank=True), allow_empty=False)
+
+
+class SubmitBatchSerializer(serializers.Serializer):
+    submissions = SubmissionSerializer(many=True, allow_empty=False, max_length=settings.SUBMIT_BATCH_MAX)
@@ -0,0 +1,322 @@
+"""
+Single-flight model calls: identical concurrent prompts share one generation.
+
+When many users open the same exercise at once, each request would send the
+same prompt to Gemini. ``generate()`` keys a call on a hash of its prompt
+type, contents and options. The first caller (the leader) makes the request;
+callers that arrive while it is in flight wait for it and get the same
+response text. Their ``LLMCall`` is marked ``coalesced`` and makes no request.
+
+Callers in the same process wait on the leader's flight. Across workers the
+leader holds a lock in the shared cache (``main.cache.shared()``) and stores
+the text there under a token only its followers know, so a later call with
+the same prompt generates afresh. Followers give up at their call's deadline
+with ``LLMUnavailable``. If the leader fails, they raise ``LLMUnavailable``
+too instead of repeating the request, and fall back.
+
+``stream()`` does the same for streamed responses: the leader relays its
+chunks as they arrive and shares the text they amount to; followers get that
+text as a single chunk once it is done.
+
+Contents must be text. Calls are only coalesced while a flight is in
+progress; nothing is cached after it. ``LLM_SINGLE_FLIGHT=False`` turns
+coalescing off.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from main import cache as hot_cache
+
+from .llm import LLMUnavailable, fallback_reason
+
+
+POLL_SECONDS = 0.05
+# Followers in other workers only need the text until they have polled it
+RESULT_SECONDS = 60
+FAILED = 'coalesced_failure'
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.text = None
+        self.reason = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def flight_key(prompt_type, contents, **kwargs):
+    data = json.dumps([prompt_type, contents, kwargs], ensure_ascii=False, sort_keys=True)
+    return f"llm-flight:{hashlib.sha256(data.encode()).hexdigest()}"
+
+
+def _lock_seconds():
+    # Outlives any leader, whose requests all end by the call's deadline
+    return int(settings.LLM_REQUEST_DEADLINE_SECONDS) + 5
+
+
+def _join(key):
+    """``(flight, leader)`` for ``key`` in this process."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+
+def _land(key, flight, text=None, reason=None):
+    flight.text, flight.reason = text, reason
+    with _flights_lock:
+        del _flights[key]
+    flight.done.set()
+
+
+def _shared_result(call, result):
+    """The text of a finished flight, or LLMUnavailable with the leader's failure."""
+    call.coalesced = True
+    if result.get('reason'):
+        call.error = LLMUnavailable.__name__
+        raise LLMUnavailable(result['reason'])
+    return result['text']
+
+
+def _deadline_passed(call):
+    call.coalesced = True
+    call.error = LLMUnavailable.__name__
+    return LLMUnavailable('deadline')
+
+
+def generate(call, contents, **kwargs):
+    """Response text of ``call.generate(contents, **kwargs)``, shared with identical concurrent calls."""
+    if not settings.LLM_SINGLE_FLIGHT:
+        return call.generate(contents, **kwargs).text
+    key = flight_key(call.prompt_type, contents, **kwargs)
+    flight, leader = _join(key)
+    if not leader:
+        if not flight.done.wait(max(call.deadline - time.perf_counter(), 0)):
+            raise _deadline_passed(call)
+        return _shared_result(call, {'text': flight.text, 'reason': flight.reason})
+
+    try:
+        text = _lead(call, key, lambda: call.generate(contents, **kwargs).text)
+    except Exception as e:
+        _land(key, flight, reason=fallback_reason(e, FAILED))
+        raise
+    _land(key, flight, text=text)
+    return text
+
+
+def _lead(call, key, produce):
+    """Makes the request unless another worker is already making it."""
+    cache = hot_cache.shared()
+    token, result = _take_lock(call, cache, key)
+    if token is None:
+        return _shared_result(call, result)
+
+    result_key = f"{key}:{token}"
+    try:
+        text = produce()
+    except Exception as e:
+        cache.set(result_key, {'reason': fallback_reason(e, FAILED)}, RESULT_SECONDS)
+        raise
+    else:
+        cache.set(result_key, {'text': text}, RESULT_SECONDS)
+    finally:
+        cache.delete(f"{key}:lock")
+    return text
+
+
+def _take_lock(call, cache, key):
+    """``(token, None)`` once this caller holds the lock, or ``(None, result)`` of the worker that held it."""
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    while True:
+        if cache.add(lock_key, token, _lock_seconds()):
+            return token, None
+        owner = cache.get(lock_key)
+        if owner is None:
+            # Finished between add() and get()
+            continue
+        result = _wait_for_worker(call, cache, lock_key, f"{key}:{owner}", owner)
+        if result is not None:
+            return None, result
+        # The owner's lock expired without a result; take over
+
+
+def _wait_for_worker(call, cache, lock_key, result_key, owner):
+    while True:
+        result = cache.get(result_key)
+        if result is not None:
+            return result
+        if cache.get(lock_key) != owner:
+            # The result is stored before the lock is released
+            return cache.get(result_key)
+        if time.perf_counter() + POLL_SECONDS >= call.deadline:
+            raise _deadline_passed(call)
+        time.sleep(POLL_SECONDS)
+
+
+def stream(call, key, chunks, result_text):
+    """
+    Relays ``chunks()`` (a streamed model response) and shares
+    ``result_text()``, called after the last chunk, with the calls that join
+    ``key`` meanwhile. A caller that joins gets that text as its only chunk
+    and its call is marked ``coalesced``.
+    """
+    if not settings.LLM_SINGLE_FLIGHT:
+        yield from chunks()
+        return
+    flight, leader = _join(key)
+    if not leader:
+        if not flight.done.wait(max(call.deadline - time.perf_counter(), 0)):
+            raise _deadline_passed(call)
+        yield _shared_result(call, {'text': flight.text, 'reason': flight.reason})
+        return
+
+    try:
+        cache = hot_cache.shared()
+        token, result = _take_lock(call, cache, key)
+        if token is None:
+            text = _shared_result(call, result)
+            yield text
+        else:
+            text = yield from _relay(cache, key, token, chunks, result_text)
+    except BaseException as e:
+        # Includes the client going away mid-stream
+        _land(key, flight, reason=fallback_reason(e, FAILED))
+        raise
+    _land(key, flight, text=text)
+
+
+def _relay(cache, key, token, chunks, result_text):
+    result_key = f"{key}:{token}"
+    try:
+        yield from chunks()
+        text = result_text()
+    except BaseException as e:
+        cache.set(result_key, {'reason': fallback_reason(e, FAILED)}, RESULT_SECONDS)
+        raise
+    else:
+        cache.set(result_key, {'text': text}, RESULT_SECONDS)
+    finally:
+        cache.delete(f"{key}:lock")
+    return text
+
+
+async def agenerate(call, contents, **kwargs):
+    """``generate`` for async views."""
+    if not settings.LLM_SINGLE_FLIGHT:
+        return (await call.generate_async(contents, **kwargs)).text
+    key = flight_key(call.prompt_type, contents, **kwargs)
+    flight, leader = _join(key)
+    if not leader:
+        while not flight.done.is_set():
+            if time.perf_counter() + POLL_SECONDS >= call.deadline:
+                raise _deadline_passed(call)
+            await asyncio.sleep(POLL_SECONDS)
+        return _shared_result(call, {'text': flight.text, 'reason': flight.reason})
+
+    async def produce():
+        return (await call.generate_async(contents, **kwargs)).text
+
+    try:
+        text = await _alead(call, key, produce)
+    except Exception as e:
+        _land(key, flight, reason=fallback_reason(e, FAILED))
+        raise
+    _land(key, flight, text=text)
+    return text
+
+
+async def _alead(call, key, produce):
+    cache = hot_cache.shared()
+    token, result = await _atake_lock(call, cache, key)
+    if token is None:
+        return _shared_result(call, result)
+
+    result_key = f"{key}:{token}"
+    try:
+        text = await produce()
+    except Exception as e:
+        await cache.aset(result_key, {'reason': fallback_reason(e, FAILED)}, RESULT_SECONDS)
+        raise
+    else:
+        await cache.aset(result_key, {'text': text}, RESULT_SECONDS)
+    finally:
+        await cache.adelete(f"{key}:lock")
+    return text
+
+
+async def _atake_lock(call, cache, key):
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    while True:
+        if await cache.aadd(lock_key, token, _lock_seconds()):
+            return token, None
+        owner = await cache.aget(lock_key)
+        if owner is None:
+            continue
+        result = await _await_worker(call, cache, lock_key, f"{key}:{owner}", owner)
+        if result is not None:
+            return None, result
+
+
+async def astream(call, key, chunks, result_text):
+    """``stream`` for async views; ``chunks()`` returns an async iterator."""
+    if not settings.LLM_SINGLE_FLIGHT:
+        async for chunk in chunks():
+            yield chunk
+        return
+    flight, leader = _join(key)
+    if not leader:
+        while not flight.done.is_set():
+            if time.perf_counter() + POLL_SECONDS >= call.deadline:
+                raise _deadline_passed(call)
+            await asyncio.sleep(POLL_SECONDS)
+        yield _shared_result(call, {'text': flight.text, 'reason': flight.reason})
+        return
+
+    try:
+        cache = hot_cache.shared()
+        token, result = await _atake_lock(call, cache, key)
+        if token is None:
+            text = _shared_result(call, result)
+            yield text
+        else:
+            result_key = f"{key}:{token}"
+            try:
+                async for chunk in chunks():
+                    yield chunk
+                text = result_text()
+            except BaseException as e:
+                await cache.aset(result_key, {'reason': fallback_reason(e, FAILED)}, RESULT_SECONDS)
+                raise
+            else:
+                await cache.aset(result_key, {'text': text}, RESULT_SECONDS)
+            finally:
+                await cache.adelete(f"{key}:lock")
+    except BaseException as e:
+        _land(key, flight, reason=fallback_reason(e, FAILED))
+        raise
+    _land(key, flight, text=text)
+
+
+async def _await_worker(call, cache, lock_key, result_key, owner):
+    while True:
+        result = await cache.aget(result_key)
+        if result is not None:
+            return result
+        if await cache.aget(lock_key) != owner:
+            return await cache.aget(result_key)
+        if time.perf_counter() + POLL_SECONDS >= call.deadline:
+            raise _deadline_passed(call)
+        await asyncio.sleep(POLL_SECONDS)
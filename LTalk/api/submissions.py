@@ -0,0 +1,179 @@
+"""
+Recording submitted answers.
+
+Both the per-exercise submit endpoint and the batch endpoint
+(``/api/submissions/``) go through ``record()``. It takes any number of
+submissions, across exercises, and applies them in one transaction with a
+fixed number of queries. The words behind all answers are matched in one
+query. Each answered word is appended to the answer log in a single insert,
+and folded into its progress row in bulk (see ``main.answer_log``). Complete
+submissions become ``ExerciseProgress`` rows in a single insert and are added
+to the ``DailyProgress`` rollups. With ``ANSWER_LOG_DEFERRED`` the inserts are
+all a submission writes; compaction folds progress and rollups later.
+"""
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from main import answer_log
+from main.models import AnswerEvent, DailyProgress, Exercise, ExerciseProgress, Word, lookup_key
+
+from . import grading
+from .serializer import ExerciseProgressSerializer
+
+
+@dataclass
+class Submission:
+    exercise: Exercise
+    user_answers: dict
+    # Model feedback already generated for some answers, by question key
+    feedback: dict = field(default_factory=dict)
+
+    def answered(self):
+        return [key for key in self.user_answers if key in self.exercise.questions]
+
+    @property
+    def is_partial(self):
+        return len(self.user_answers) < len(self.exercise.questions)
+
+
+def check_answer(user_answer, correct_answer, exercise_type):
+    """Check if the user's answer matches the correct answer for the given exercise type (full credit)"""
+    if exercise_type == 'multiple_choice':
+        if isinstance(correct_answer, list):
+            return user_answer in correct_answer
+        return user_answer == correct_answer
+
+    if exercise_type == 'flashcard':
+        return user_answer == correct_answer
+
+    if exercise_type == 'fill_in_gap':
+        # Near misses (diacritics, typos) earn only partial credit; see api.grading
+        return grading.grade(user_answer, correct_answer).correct
+
+    return False
+
+
+def grades(exercise, user_answers):
+    """``{key: Grade}`` for each answered fill-in-gap question."""
+    if exercise.type != 'fill_in_gap':
+        return {}
+    return {
+        key: grading.grade(user_answer, exercise.correct_answers[key])
+        for key, user_answer in user_answers.items()
+        if key in exercise.questions
+    }
+
+
+def _match_key(exercise, key):
+    """The lookup field and key of the word behind question ``key``."""
+    if exercise.type == 'fill_in_gap':
+        return 'word_key', lookup_key(exercise.questions[key].get('word', ''))
+    return 'translation_key', lookup_key(exercise.correct_answers[key])
+
+
+def _match_words(submissions):
+    """``{(wordset_id, field, key): word}`` for every answered question, in one query."""
+    wanted = {'word_key': set(), 'translation_key': set()}
+    wordset_ids = set()
+    for sub in submissions:
+        wordset_ids.add(sub.exercise.wordset_id)
+        for key in sub.answered():
+            match_field, value = _match_key(sub.exercise, key)
+            wanted[match_field].add(value)
+    if not any(wanted.values()):
+        return {}
+
+    links = (
+        Word.wordsets.through.objects
+        .filter(wordset_id__in=wordset_ids)
+        .filter(Q(word__word_key__in=wanted['word_key']) | Q(word__translation_key__in=wanted['translation_key']))
+        .select_related('word').order_by('word_id')
+    )
+    words = {}
+    for link in links:
+        for match_field in wanted:
+            words.setdefault((link.wordset_id, match_field, getattr(link.word, match_field)), link.word)
+    return words
+
+
+def record(user, submissions):
+    """
+    Grade ``submissions`` for ``user``, log the answers (updating word progress
+    unless ``ANSWER_LOG_DEFERRED``) and save the complete ones as attempts.
+    Returns the response data for each submission.
+    """
+    with transaction.atomic():
+        pending = [sub.exercise.pk for sub in submissions if sub.exercise.expires_at is not None]
+        if pending:
+            # The cached API payload does not include expires_at, so no cache bump is needed
+            Exercise.objects.filter(pk__in=pending).update(expires_at=None)
+        for sub in submissions:
+            sub.exercise.expires_at = None
+
+        words = _match_words(submissions)
+        results = []
+        attempts = []
+        events = []
+        for sub in submissions:
+            result, attempt = _apply(user, sub, words, events)
+            results.append(result)
+            if attempt is not None:
+                attempts.append((result, attempt))
+
+        deferred = settings.ANSWER_LOG_DEFERRED
+        if not deferred:
+            answer_log.fold(events)
+            for event in events:
+                event.applied = True
+        AnswerEvent.objects.bulk_create(events)
+        if attempts:
+            for _, attempt in attempts:
+                attempt.rolled_up = not deferred
+            saved = ExerciseProgress.objects.bulk_create([attempt for _, attempt in attempts])
+            if not deferred:
+                DailyProgress.record(saved)
+            for (result, _), attempt in zip(attempts, saved):
+                result['exercise_progress'] = [ExerciseProgressSerializer(attempt).data]
+    return results
+
+
+def _apply(user, sub, words, events):
+    exercise = sub.exercise
+    answer_grades = grades(exercise, sub.user_answers)
+    feedback = {**{key: g.feedback for key, g in answer_grades.items() if g.feedback}, **sub.feedback}
+    score = 0
+    answered = sub.answered()
+
+    for key in answered:
+        grade = answer_grades.get(key)
+        if grade:
+            credit = grade.credit
+        else:
+            credit = float(check_answer(sub.user_answers[key], exercise.correct_answers[key], exercise.type))
+        score += credit
+
+        word = words.get((exercise.wordset_id, *_match_key(exercise, key)))
+        if word:
+            events.append(AnswerEvent(user=user, word=word, exercise=exercise, correct=credit >= 1,
+                                      grade=grade.review_grade if grade else None))
+
+    result = {"feedback": feedback}
+    if answer_grades:
+        result["grades"] = {key: {"kind": g.kind, "credit": g.credit} for key, g in answer_grades.items()}
+    if sub.is_partial:
+        # Partial submissions (single answers) only update word progress
+        return result, None
+
+    # Graded from the summed credit, so near misses lower the score
+    result["is_correct"] = score >= len(answered)
+    attempt = ExerciseProgress.graded(
+        score, len(answered),
+        user=user,
+        exercise=exercise,
+        user_answer=sub.user_answers,
+        is_correct=result["is_correct"],
+    )
+    return result, attempt
@@ -1,12 +1,32 @@
-from io import BytesIO
+import asyncio
+import base64
+import json
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
+from asgiref.sync import sync_to_async
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from google.api_core.exceptions import InvalidArgument, ServiceUnavailable
 from PIL import Image
-from django.test import TestCase
+from django.conf import settings
+from django.test import AsyncClient, TestCase, override_settings
 from rest_framework.test import APITestCase, APIClient
 from authentication.models import User
-from django.urls import reverse
+from django.urls import include, path, reverse
 from rest_framework import status
-from main.models import Exercise, WordProgress, WordSet, Word
+from main import cache as hot_cache
+from main.models import (SM2_HARD_GRADE, AnswerEvent, DailyProgress, Exercise, ExerciseProgress, TextExerciseVariant,
+                         WordProgress, WordSet, Word, lookup_key)
+from LTalk.testing import PerformanceBudgetMixin, create_budget_fixture
+from LTalk import db_router
+from LTalk.db_router import ReplicaRouter, STICKY_COOKIE, use_replica
+from api import distractors, grading, llm, prompts, singleflight, text_pool, urls as api_urls
+from api.views import ExerciseViewSet
 
 class WordSetAPITestCase(APITestCase):
     def setUp(self):
@@ -135,6 +155,187 @@ class ExerciseAPITest(TestCase):
         self.assertTrue(Exercise.objects.filter(id=data["id"], wordset=self.wordset).exists())
 
 
+
+
+class ExerciseSessionTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = create_budget_fixture(self.user, wordsets=1, words=3)[0]
+
+    def _session(self, **kwargs):
+        return Exercise.objects.create(wordset=self.wordset, type='flashcard', questions={"0": {}},
+                                       correct_answers={"0": "x"}, **kwargs)
+
+    def test_generated_exercise_is_kept_once_submitted(self):
+        response = self.client.post("/api/exercise/", {"type": "flashcard", "wordset": self.wordset.id}, format="json")
+        exercise = Exercise.objects.get(id=response.json()["id"])
+        self.assertIsNotNone(exercise.expires_at)
+
+        key, answer = next(iter(exercise.correct_answers.items()))
+        self.client.post(f"/api/exercise/{exercise.id}/submit/", {"user_answers": {key: answer}}, format="json")
+        exercise.refresh_from_db()
+        self.assertIsNone(exercise.expires_at)
+
+    def test_expired_sessions_are_hidden_and_purged_in_batches(self):
+        past = timezone.now() - timedelta(minutes=1)
+        expired = [self._session(expires_at=past) for _ in range(3)]
+        current = self._session(expires_at=timezone.now() + timedelta(hours=1))
+        submitted = self._session(expires_at=past)
+        ExerciseProgress.objects.create(user=self.user, exercise=submitted, grade="1/1")
+
+        listed = {e["id"] for e in self.client.get(f"/api/exercise/?wordset={self.wordset.id}").json()["results"]}
+        self.assertNotIn(expired[0].id, listed)
+
+        out = StringIO()
+        call_command('purge_exercises', batch_size=2, stdout=out)
+        self.assertIn("Purged 3", out.getvalue())
+        remaining = set(Exercise.objects.filter(wordset=self.wordset).values_list('id', flat=True))
+        self.assertTrue({current.id, submitted.id} <= remaining)
+        self.assertFalse(remaining & {e.id for e in expired})
+
+    def test_expired_sessions_cannot_be_opened_or_submitted(self):
+        expired = self._session(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.client.get(f"/api/exercise/{expired.id}/").status_code, 404)
+
+        response = self.client.post(f"/api/exercise/{expired.id}/submit/", {"user_answers": {"0": "x"}}, format="json")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post("/api/submissions/", {"submissions": [
+            {"exercise": expired.id, "user_answers": {"0": "x"}},
+        ]}, format="json")
+        self.assertEqual(response.data["results"][0]["status"], "rejected")
+        expired.refresh_from_db()
+        self.assertIsNotNone(expired.expires_at)
+        self.assertFalse(ExerciseProgress.objects.filter(exercise=expired).exists())
+
+class ExerciseHistoryAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.other = User.objects.create_user(username="other", password="pass", email="other@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        flashcard = Exercise.objects.create(wordset=self.wordset, type='flashcard', questions={}, correct_answers={})
+        fill_in_gap = Exercise.objects.create(wordset=self.wordset, type='fill_in_gap', questions={}, correct_answers={})
+        ExerciseProgress.objects.bulk_create(
+            [ExerciseProgress.graded(int(i % 3 == 0), 1, user=self.user, exercise=flashcard, is_correct=i % 3 == 0)
+             for i in range(25)]
+            + [ExerciseProgress.graded(2, 2, user=self.user, exercise=fill_in_gap, is_correct=True)]
+            + [ExerciseProgress.graded(1, 1, user=self.other, exercise=flashcard, is_correct=True)]
+        )
+        self.url = f"/api/wordset/{self.wordset.id}/history/"
+
+    def test_summary_is_aggregated_per_type(self):
+        summary = {row['type']: row for row in self.client.get(self.url).json()['summary']}
+        self.assertEqual(set(summary), {'flashcard', 'fill_in_gap'})
+        self.assertEqual((summary['flashcard']['attempts'], summary['flashcard']['correct']), (25, 9))
+        self.assertEqual(summary['flashcard']['accuracy'], 36)
+        self.assertEqual(summary['fill_in_gap']['label'], "Fill in the Gap")
+
+    def test_entries_are_paginated_and_filtered_by_type(self):
+        first = self.client.get(self.url, {'type': 'flashcard'}).json()
+        self.assertEqual(first['count'], 25)
+        self.assertEqual(len(first['results']), 20)
+        self.assertTrue(all(entry['type'] == 'flashcard' for entry in first['results']))
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+
+    def test_history_page_renders_summary_without_entries(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('exercise_history', args=[self.wordset.id]))
+        self.assertContains(response, "<strong>25</strong> attempts", html=False)
+        self.assertNotContains(response, 'class="progress-entry"')
+
+
+class DailyProgressTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordsets = create_budget_fixture(self.user, wordsets=2, words=4)
+        self.exercise = self.wordsets[0].exercises.get()
+
+    def test_submission_updates_grade_columns_and_rollup(self):
+        answers = dict(self.exercise.correct_answers, **{"0": "wrong"})
+        data = self.client.post(f"/api/exercise/{self.exercise.id}/submit/", {"user_answers": answers},
+                                format="json").json()
+        self.assertEqual(data["exercise_progress"][0]["grade"], "3/4")
+        self.assertEqual((data["exercise_progress"][0]["correct_count"], data["exercise_progress"][0]["total_count"]),
+                         (3, 4))
+
+        rollup = DailyProgress.objects.get(user=self.user, wordset=self.wordsets[0], day=timezone.localdate())
+        # Three fixture attempts (0/4, 1/4, 2/4) plus this one
+        self.assertEqual((rollup.attempts, rollup.answers_correct, rollup.answers_total), (4, 6, 16))
+
+    def test_api_reads_only_the_rollups(self):
+        with self.assertNumQueries(1):
+            days = self.client.get("/api/progress/daily/").json()["days"]
+        self.assertEqual(len(days), 1)
+        self.assertEqual((days[0]["attempts"], days[0]["answers_total"], days[0]["accuracy"]), (6, 24, 25))
+
+        only_first = self.client.get("/api/progress/daily/", {"wordset": self.wordsets[0].id}).json()["days"]
+        self.assertEqual(only_first[0]["attempts"], 3)
+        self.assertEqual(self.client.get("/api/progress/daily/", {"days": "x"}).status_code, 400)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        fields = ('wordset_id', 'day', 'attempts', 'correct_attempts', 'answers_correct', 'answers_total')
+        incremental = sorted(DailyProgress.objects.values_list(*fields))
+        call_command('rebuild_daily_progress', user=[self.user.id], stdout=StringIO())
+        self.assertEqual(sorted(DailyProgress.objects.values_list(*fields)), incremental)
+
+
+class ReviewScheduleTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.words = Word.objects.bulk_create(
+            [Word(word=f"zodis{i}", infinitive=f"zodis{i}", translation=f"word{i}") for i in range(6)])
+        self.wordset.words.add(*self.words)
+
+    def test_sm2_intervals(self):
+        now = timezone.now()
+        wp = WordProgress(user=self.user, word=self.words[0])
+        intervals = []
+        for correct in (True, True, True, False, True):
+            wp.schedule(correct, now=now)
+            intervals.append(wp.interval_days)
+        self.assertEqual(intervals, [1, 6, 15, 1, 1])
+        self.assertAlmostEqual(wp.ease_factor, 2.18)
+        self.assertEqual(wp.due_at, now + timedelta(days=1))
+
+    def test_queue_orders_overdue_then_new_then_upcoming(self):
+        now = timezone.now()
+        for word, days in ((self.words[0], -1), (self.words[1], -3), (self.words[2], 2), (self.words[3], 5)):
+            WordProgress.objects.create(user=self.user, word=word, due_at=now + timedelta(days=days))
+
+        response = self.client.post("/api/exercise/", {"type": "flashcard", "wordset": self.wordset.id}, format="json")
+        fronts = [q["front"] for q in response.json()["questions"].values()]
+        # Words never practised come in random order
+        self.assertEqual(fronts[:2] + sorted(fronts[2:4]) + fronts[4:],
+                         ["zodis1", "zodis0", "zodis4", "zodis5", "zodis2", "zodis3"])
+
+        with override_settings(REVIEW_BATCH_SIZE=2):
+            response = self.client.post("/api/exercise/", {"type": "flashcard", "wordset": self.wordset.id},
+                                        format="json")
+        self.assertEqual([q["front"] for q in response.json()["questions"].values()], ["zodis1", "zodis0"])
+
+    def test_answers_push_words_back_in_the_queue(self):
+        exercise = Exercise.objects.create(wordset=self.wordset, type='flashcard',
+                                           questions={"0": {"front": "zodis0"}}, correct_answers={"0": "word0"})
+        self.client.post(f"/api/exercise/{exercise.id}/submit/", {"user_answers": {"0": "word0"}}, format='json')
+        wp = WordProgress.objects.get(user=self.user, word=self.words[0])
+        self.assertEqual((wp.repetitions, wp.interval_days), (1, 1))
+        self.assertGreater(wp.due_at, timezone.now())
+
+        response = self.client.post("/api/exercise/", {"type": "flashcard", "wordset": self.wordset.id}, format="json")
+        fronts = [q["front"] for q in response.json()["questions"].values()]
+        self.assertEqual(fronts[-1], "zodis0")
+
+
 class SubmitExerciseAPITest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -172,6 +373,75 @@ class SubmitExerciseAPITest(TestCase):
         self.assertEqual(response2.status_code, 200)
 
 
+class WordLookupKeyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.word = Word.objects.create(word="Namas", infinitive="namas", translation="House")
+        self.wordset.words.add(self.word)
+
+    def test_keys_are_normalized(self):
+        self.assertEqual(lookup_key("  Katė\tmedis "), "katė medis")
+        with override_settings(WORD_KEY_FOLD_DIACRITICS=True):
+            self.assertEqual(lookup_key("Katė"), "kate")
+        self.assertEqual((self.word.word_key, self.word.translation_key), ("namas", "house"))
+
+    def test_bulk_writes_keep_keys_in_sync(self):
+        word, = Word.objects.bulk_create([Word(word="Medis ", infinitive="medis", translation="Tree")])
+        self.assertEqual(Word.objects.get(pk=word.pk).word_key, "medis")
+        word.translation = "Wood"
+        Word.objects.bulk_update([word], ['translation'])
+        self.assertEqual(Word.objects.get(pk=word.pk).translation_key, "wood")
+
+    def test_submission_matches_words_by_key(self):
+        flashcard = Exercise.objects.create(wordset=self.wordset, type='flashcard',
+                                            questions={"0": {"front": "Namas"}}, correct_answers={"0": " HOUSE"})
+        fill_in_gap = Exercise.objects.create(wordset=self.wordset, type='fill_in_gap',
+                                              questions={"0": {"sentence": "Tai ___.", "word": "NAMAS "}},
+                                              correct_answers={"0": "namas"})
+        self.client.post(f"/api/exercise/{flashcard.id}/submit/", {"user_answers": {"0": " HOUSE"}}, format='json')
+        self.client.post(f"/api/exercise/{fill_in_gap.id}/submit/", {"user_answers": {"0": "namas"}}, format='json')
+        self.assertEqual(WordProgress.objects.get(user=self.user, word=self.word).correct_attempts, 2)
+
+    def test_import_reuses_words_regardless_of_case(self):
+        response = self.client.post("/api/wordset/", {
+            "title": "Copy", "words": [{"word": " namas", "infinitive": "namas", "translation": "house"}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Word.objects.filter(word_key="namas").count(), 1)
+
+    def test_import_picks_the_oldest_of_case_variants(self):
+        Word.objects.create(word="namas", infinitive="namas", translation="house")
+        response = self.client.post("/api/wordset/", {
+            "title": "Copy", "words": [{"word": "NAMAS", "infinitive": "namas", "translation": "house"}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(WordSet.objects.get(pk=response.json()["id"]).words.all()), [self.word])
+        self.assertEqual(Word.objects.filter(word_key="namas").count(), 2)
+
+    @override_settings(WORD_KEY_FOLD_DIACRITICS=True)
+    def test_import_keeps_words_that_differ_in_diacritics(self):
+        cat = Word.objects.create(word="katė", infinitive="katė", translation="cat")
+        response = self.client.post("/api/wordset/", {
+            "title": "Copy", "words": [{"word": "kate", "infinitive": "kate", "translation": "kate"},
+                                       {"word": "Katė", "infinitive": "katė", "translation": "cat"}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        katė, kate = WordSet.objects.get(pk=response.json()["id"]).words.order_by('pk')
+        self.assertEqual((katė, kate.word), (cat, "kate"))
+
+    def test_import_creates_a_repeated_word_once(self):
+        response = self.client.post("/api/wordset/", {
+            "title": "Copy", "words": [{"word": "medis", "infinitive": "medis", "translation": "tree"},
+                                       {"word": "Medis ", "infinitive": "medis", "translation": "tree"}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Word.objects.filter(word_key="medis").count(), 1)
+        self.assertEqual(WordSet.objects.get(pk=response.json()["id"]).words.count(), 1)
+
+
 
 class ProcessPhotoAPITest(TestCase):
     def setUp(self):
@@ -191,4 +461,1049 @@ class ProcessPhotoAPITest(TestCase):
         uploaded_file = SimpleUploadedFile("food.png", buffer.read(), content_type="image/png")
 
         response = self.client.post(self.url, {'image': uploaded_file}, format='multipart')
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+
+class EndpointBudgetTest(PerformanceBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="budget", password="pass", email="budget@gmail.com")
+        self.other = User.objects.create_user(username="other", password="pass", email="other@gmail.com")
+        self.wordsets = create_budget_fixture(self.user)
+        create_budget_fixture(self.other)
+        self.client.force_authenticate(self.user)
+
+    def test_exercise_history_budget(self):
+        with self.assertWithinBudget('exercise-history'):
+            response = self.client.get(f"/api/wordset/{self.wordsets[0].id}/history/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_daily_progress_budget(self):
+        with self.assertWithinBudget('progress-daily'):
+            response = self.client.get("/api/progress/daily/", {'days': 365})
+        self.assertEqual(response.status_code, 200)
+
+    def test_wordset_list_budget(self):
+        with self.assertWithinBudget('wordset-list'):
+            response = self.client.get("/api/wordset/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_wordset_list_others_budget(self):
+        with self.assertWithinBudget('wordset-list-others'):
+            response = self.client.get("/api/wordset/?scope=others")
+        self.assertEqual(response.status_code, 200)
+
+    def test_wordset_detail_budget(self):
+        with self.assertWithinBudget('wordset-detail'):
+            response = self.client.get(f"/api/wordset/{self.wordsets[0].id}/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_word_list_budget(self):
+        with self.assertWithinBudget('word-list'):
+            response = self.client.get("/api/word/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_word_progress_list_budget(self):
+        with self.assertWithinBudget('word-progress-list'):
+            response = self.client.get("/api/wordprogress/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_flashcard_budget(self):
+        with self.assertWithinBudget('exercise-create-flashcard'):
+            response = self.client.post("/api/exercise/", {
+                "type": "flashcard", "wordset": self.wordsets[0].id
+            }, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_submit_budget(self):
+        exercise = self.wordsets[0].exercises.first()
+        with self.assertWithinBudget('submit-exercise'):
+            response = self.client.post(f"/api/exercise/{exercise.id}/submit/", {
+                "user_answers": exercise.correct_answers
+            }, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_submit_batch_budget(self):
+        exercises = list(Exercise.objects.filter(wordset__in=self.wordsets))
+        with self.assertWithinBudget('submit-batch'):
+            response = self.client.post("/api/submissions/", {"submissions": [
+                {"exercise": exercise.id, "user_answers": exercise.correct_answers} for exercise in exercises
+            ]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), len(exercises))
+
+
+def scrape_metrics(client):
+    with override_settings(METRICS_TOKEN="scrape-token"):
+        return client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-token")
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        response = self.client.get("/api/word/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('llm;dur=0.0;desc="0 calls"', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        self.client.get("/api/word/")
+        response = scrape_metrics(self.client)
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE ltalk_request_db_queries histogram', body)
+        self.assertIn('ltalk_request_duration_seconds_count{view="word-list",method="GET",status="200"}', body)
+
+    def test_metrics_need_the_token_or_staff(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with override_settings(METRICS_TOKEN="scrape-token"):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save(update_fields=['is_staff'])
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+
+class FakeModel:
+    def __init__(self, text, input_tokens=10, output_tokens=20):
+        self.text = text
+        self.usage = SimpleNamespace(prompt_token_count=input_tokens, candidates_token_count=output_tokens)
+
+    def generate_content(self, contents, **kwargs):
+        return SimpleNamespace(text=self.text, usage_metadata=self.usage)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return self.generate_content(contents, **kwargs)
+
+
+class LLMTelemetryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.wordset.words.add(Word.objects.create(word="namas", infinitive="namas", translation="house"))
+        llm.budget.reset()
+
+    def test_multiple_choice_call_is_logged(self):
+        reply = '[{"question": "namas", "choices": ["house", "tree", "cat", "dog"], "correct": "house"}]'
+        with mock.patch('api.llm.get_model', return_value=FakeModel(reply, 12, 34)), self.assertLogs('api.llm', 'INFO') as logs:
+            response = self.client.post("/api/exercise/", {
+                "type": "multiple_choice", "wordset": self.wordset.id
+            }, format="json")
+        self.assertEqual(response.status_code, 201)
+        record = logs.records[0].llm
+        self.assertEqual(record['prompt_type'], 'multiple_choice')
+        self.assertEqual(record['outcome'], 'ok')
+        self.assertEqual((record['input_tokens'], record['output_tokens']), (12, 34))
+
+    def test_calls_ask_for_json_matching_a_schema(self):
+        reply = '[{"question": "namas", "choices": ["house", "tree", "cat", "dog"], "correct": "house"}]'
+        model = FakeModel(reply)
+        with mock.patch('api.llm.get_model', return_value=model), \
+                mock.patch.object(model, 'generate_content', wraps=model.generate_content) as generate:
+            self.client.post("/api/exercise/", {"type": "multiple_choice", "wordset": self.wordset.id}, format="json")
+        contents, = generate.call_args.args
+        self.assertEqual(contents, [prompts.MULTIPLE_CHOICE, "namas: house"])
+        self.assertEqual(generate.call_args.kwargs['generation_config'],
+                         prompts.json_config(prompts.MULTIPLE_CHOICE_SCHEMA))
+
+    def test_fill_in_gap_fallback_is_recorded(self):
+        with mock.patch('api.llm.get_model', return_value=FakeModel("no json here")), self.assertLogs('api.llm', 'INFO') as logs:
+            response = self.client.post("/api/exercise/", {
+                "type": "fill_in_gap", "wordset": self.wordset.id
+            }, format="json")
+        self.assertEqual(response.status_code, 201)
+        record = logs.records[0].llm
+        self.assertEqual(record['outcome'], 'parse_error')
+        self.assertEqual(record['fallback'], 'basic')
+        metrics = scrape_metrics(self.client).content.decode()
+        self.assertIn('ltalk_llm_fallbacks_total{prompt_type="fill_in_gap",kind="basic"}', metrics)
+
+    def test_fill_in_gap_falls_back_without_waiting_when_budget_is_spent(self):
+        for _ in range(settings.LLM_SAFE_CALLS_PER_MINUTE):
+            llm.budget.record()
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")), \
+                mock.patch('time.sleep', side_effect=AssertionError("waited")), \
+                self.assertLogs('api.llm', 'INFO') as logs:
+            response = self.client.post("/api/exercise/", {"type": "fill_in_gap", "wordset": self.wordset.id},
+                                        format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["correct_answers"], {"0": "namas"})
+        self.assertEqual((logs.records[0].llm['fallback'], logs.records[0].llm['fallback_reason']),
+                         ('basic', 'rate_limit'))
+
+
+class FlakyModel(FakeModel):
+    """Raises ``error`` for the first ``failures`` requests."""
+
+    def __init__(self, text, error, failures):
+        super().__init__(text)
+        self.error = error
+        self.failures = failures
+        self.requests = []
+
+    def generate_content(self, contents, **kwargs):
+        self.requests.append(kwargs)
+        if len(self.requests) <= self.failures:
+            raise self.error
+        return super().generate_content(contents, **kwargs)
+
+
+@override_settings(LLM_RETRY_BACKOFF_SECONDS=0)
+class LLMResilienceTest(TestCase):
+    REPLY = '[{"question": "namas", "choices": ["house", "tree", "cat", "dog"], "correct": "house"}]'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.wordset.words.add(Word.objects.create(word="namas", infinitive="namas", translation="house"))
+        llm.budget.reset()
+        llm.breaker.reset()
+        self.addCleanup(llm.breaker.reset)
+
+    def m_choice(self, model):
+        with mock.patch('api.llm.get_model', return_value=model), self.assertLogs('api.llm', 'INFO') as logs:
+            response = self.client.post("/api/exercise/", {"type": "multiple_choice", "wordset": self.wordset.id},
+                                        format="json")
+        self.assertEqual(response.status_code, 201)
+        return [r.llm for r in logs.records if r.getMessage() == 'llm_call'][-1]
+
+    def test_transient_errors_are_retried_with_a_timeout(self):
+        model = FlakyModel(self.REPLY, ServiceUnavailable("overloaded"), failures=1)
+        record = self.m_choice(model)
+        self.assertEqual((record['outcome'], record['attempts'], record['fallback']), ('ok', 2, None))
+        for options in (kwargs['request_options'] for kwargs in model.requests):
+            self.assertIsNone(options['retry'])
+            self.assertLessEqual(options['timeout'], settings.LLM_TIMEOUT_SECONDS)
+
+    def test_other_errors_are_not_retried(self):
+        model = FlakyModel(self.REPLY, InvalidArgument("bad request"), failures=1)
+        record = self.m_choice(model)
+        self.assertEqual((record['attempts'], record['fallback'], record['fallback_reason']), (1, 'local', 'error'))
+        self.assertFalse(llm.breaker.is_open())
+
+    @override_settings(LLM_RETRIES=1)
+    def test_open_circuit_goes_straight_to_the_fallback(self):
+        with mock.patch.object(llm.breaker, 'threshold', 2):
+            self.m_choice(FlakyModel(self.REPLY, ServiceUnavailable("down"), failures=2))
+            self.assertTrue(llm.breaker.is_open())
+            record = self.m_choice(mock.Mock(side_effect=AssertionError("model called")))
+        self.assertEqual((record['attempts'], record['fallback'], record['fallback_reason']),
+                         (0, 'local', 'circuit_open'))
+        self.assertRegex(scrape_metrics(self.client).content.decode(), r'ltalk_llm_circuit_opened_total [1-9]')
+
+    def test_circuit_closes_after_a_successful_trial_call(self):
+        breaker = llm.CircuitBreaker(threshold=1, cooldown=30)
+        with self.assertLogs('api.llm', 'WARNING'):
+            breaker.record_failure()
+        self.assertFalse(breaker.acquire())
+        breaker._opened_at -= 31
+        self.assertTrue(breaker.acquire())
+        # Only one trial call per cooldown
+        self.assertFalse(breaker.acquire())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.acquire())
+
+    @override_settings(LLM_REQUEST_DEADLINE_SECONDS=0)
+    def test_spent_deadline_skips_the_model(self):
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")), \
+                self.assertLogs('api.llm', 'INFO') as logs:
+            response = self.client.post("/api/exercise/", {"type": "fill_in_gap", "wordset": self.wordset.id},
+                                        format="json")
+        self.assertEqual(response.status_code, 201)
+        record = logs.records[0].llm
+        self.assertEqual((record['outcome'], record['fallback'], record['fallback_reason']),
+                         ('error', 'basic', 'deadline'))
+        self.assertEqual(record['parse_failures'], 0)
+
+
+class BlockingModel(FakeModel):
+    """Holds every request until ``release`` is set."""
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.requests = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.requests += 1
+        self.entered.set()
+        self.release.wait(5)
+        return super().generate_content(contents, **kwargs)
+
+
+class SingleFlightTest(TestCase):
+    PROMPT = ["Static part", "namas: house"]
+
+    def setUp(self):
+        llm.budget.reset()
+        llm.breaker.reset()
+        hot_cache.shared().clear()
+
+    def generate(self, results, i):
+        with llm.call('multiple_choice') as call:
+            results[i] = (singleflight.generate(call, self.PROMPT), call.coalesced)
+
+    def test_concurrent_identical_calls_share_one_request(self):
+        model = BlockingModel('["reply"]')
+        results = {}
+        with mock.patch('api.llm.get_model', return_value=model), self.assertLogs('api.llm', 'INFO') as logs:
+            leader = threading.Thread(target=self.generate, args=(results, 0))
+            leader.start()
+            model.entered.wait(5)
+            followers = [threading.Thread(target=self.generate, args=(results, i)) for i in range(1, 4)]
+            for thread in followers:
+                thread.start()
+            time.sleep(0.2)
+            model.release.set()
+            for thread in [leader, *followers]:
+                thread.join(5)
+        self.assertEqual(model.requests, 1)
+        self.assertEqual(results, {0: ('["reply"]', False), 1: ('["reply"]', True),
+                                   2: ('["reply"]', True), 3: ('["reply"]', True)})
+        self.assertEqual(sum(r.llm['coalesced'] for r in logs.records), 3)
+
+    def test_waits_for_a_generation_in_another_worker(self):
+        key = singleflight.flight_key('multiple_choice', self.PROMPT)
+        hot_cache.shared().add(f"{key}:lock", "other", 30)
+        hot_cache.shared().set(f"{key}:other", {'text': '["shared"]'}, 30)
+        results = {}
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")), \
+                self.assertLogs('api.llm', 'INFO'):
+            self.generate(results, 0)
+        self.assertEqual(results[0], ('["shared"]', True))
+
+    def test_a_failed_generation_is_not_repeated(self):
+        key = singleflight.flight_key('multiple_choice', self.PROMPT)
+        hot_cache.shared().add(f"{key}:lock", "other", 30)
+        hot_cache.shared().set(f"{key}:other", {'reason': 'circuit_open'}, 30)
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")), \
+                self.assertLogs('api.llm', 'INFO'), self.assertRaises(llm.LLMUnavailable) as raised:
+            self.generate({}, 0)
+        self.assertEqual(raised.exception.reason, 'circuit_open')
+
+    def test_same_words_give_the_same_multiple_choice_prompt(self):
+        words = [Word(pk=1, word="namas", translation="house"), Word(pk=2, word="katė", translation="cat")]
+        helper = ExerciseViewSet()
+        self.assertEqual(helper._m_choice_prompt(words), helper._m_choice_prompt(words[::-1]))
+
+
+class LocalDistractorTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        pairs = [("eiti", "to go"), ("bėgti", "to run"), ("miegoti", "to sleep"), ("valgyti", "to eat"),
+                 ("namas", "house"), ("pelė", "mouse"), ("medis", "tree"), ("katė", "cat"), ("gražus", "beautiful")]
+        self.words = Word.objects.bulk_create([Word(word=w, infinitive=w, translation=t) for w, t in pairs])
+        self.wordset.words.add(*self.words)
+        llm.budget.reset()
+
+    def test_distractors_match_part_of_speech(self):
+        pools = [distractors.user_index(self.user), distractors.shared_index()]
+        picked = distractors.distractors(self.words[0], pools)
+        self.assertEqual(len(picked), 3)
+        self.assertTrue(all(p.startswith("to ") for p in picked))
+        self.assertNotIn("to go", picked)
+        # Similar spelling ranks first among nouns
+        self.assertEqual(distractors.distractors(self.words[4], pools)[0], "mouse")
+
+    def test_local_mode_skips_the_model(self):
+        with override_settings(MULTIPLE_CHOICE_DISTRACTORS='local'), \
+                mock.patch('api.llm.get_model', side_effect=AssertionError("model called")):
+            response = self.client.post("/api/exercise/", {"type": "multiple_choice", "wordset": self.wordset.id},
+                                        format="json")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        for key, question in data["questions"].items():
+            self.assertEqual(len(set(question["choices"])), 4)
+            self.assertIn(data["correct_answers"][key], question["choices"])
+
+    def test_falls_back_when_budget_is_spent(self):
+        for _ in range(settings.LLM_SAFE_CALLS_PER_MINUTE):
+            llm.budget.record()
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")), \
+                self.assertLogs('api.llm', 'INFO') as logs:
+            response = self.client.post("/api/exercise/", {"type": "multiple_choice", "wordset": self.wordset.id},
+                                        format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((logs.records[0].llm['fallback'], logs.records[0].llm['fallback_reason']),
+                         ('local', 'rate_limit'))
+
+    def test_falls_back_when_the_reply_is_unusable(self):
+        with mock.patch('api.llm.get_model', return_value=FakeModel("no questions")), self.assertLogs('api.llm', 'INFO'):
+            response = self.client.post("/api/exercise/", {"type": "multiple_choice", "wordset": self.wordset.id},
+                                        format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["questions"]), len(self.words))
+
+
+class LocalGradingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.word = Word.objects.create(word="keltas", infinitive="keltas", translation="ferry")
+        self.wordset.words.add(self.word)
+        self.exercise = Exercise.objects.create(
+            wordset=self.wordset, type='fill_in_gap',
+            questions={"0": {"sentence": "Keliauti su ___.", "word": "keltas", "infinitive": "keltas"}},
+            correct_answers={"0": "kėltų"})
+
+    def test_classification(self):
+        cases = [("Kėltų ", grading.EXACT), ("keltu", grading.DIACRITICS), ("klėtų", grading.TYPO),
+                 ("kėltus", grading.WRONG_FORM), ("keltas", grading.WRONG_FORM), ("", grading.WRONG_FORM)]
+        self.assertEqual(grading.grade("", " ").credit, 0.0)
+        for answer, kind in cases:
+            self.assertEqual(grading.classify(answer, "kėltų"), kind, answer)
+        with override_settings(GRADING_TYPO_DISTANCE=0):
+            self.assertEqual(grading.classify("klėtų", "kėltų"), grading.WRONG_FORM)
+
+    def submit(self, answer):
+        return self.client.post(f"/api/exercise/{self.exercise.id}/submit/", {"user_answers": {"0": answer}},
+                                format='json').json()
+
+    def test_near_miss_gets_local_feedback_and_partial_credit(self):
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")):
+            data = self.submit("keltu")
+        self.assertEqual(data["grades"]["0"], {"kind": "diacritics", "credit": 0.75})
+        self.assertIn("'e' should be 'ė'", data["feedback"]["0"])
+        self.assertFalse(data["is_correct"])
+        self.assertEqual((data["exercise_progress"][0]["grade"], data["exercise_progress"][0]["correct_count"]),
+                         ("0.75/1", 0.75))
+        wp = WordProgress.objects.get(user=self.user, word=self.word)
+        self.assertEqual((wp.correct_attempts, wp.incorrect_attempts), (0, 1))
+        # Recalled with difficulty: the interval grows but the ease drops
+        self.assertEqual(wp.repetitions, 1)
+        self.assertLess(wp.ease_factor, 2.5)
+
+    def test_only_wrong_forms_are_explained_by_the_model(self):
+        with mock.patch('api.llm.get_model', return_value=FakeModel("Use the instrumental plural.")), \
+                self.assertLogs('api.llm', 'INFO'):
+            data = self.submit("keltas")
+        self.assertEqual(data["grades"]["0"]["kind"], "wrong_form")
+        self.assertEqual(data["feedback"]["0"], "Use the instrumental plural.")
+        self.assertFalse(data["is_correct"])
+
+    def test_credit_is_configurable(self):
+        credit = {'exact': 1.0, 'diacritics': 0.0, 'typo': 0.0, 'wrong_form': 0.0}
+        with override_settings(GRADING_CREDIT=credit):
+            data = self.submit("keltu")
+        self.assertFalse(data["is_correct"])
+        self.assertIn("diacritics", data["feedback"]["0"])
+
+
+class SubmitBatchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.ferry = Word.objects.create(word="keltas", infinitive="keltas", translation="ferry")
+        self.house = Word.objects.create(word="namas", infinitive="namas", translation="house")
+        self.wordset.words.add(self.ferry, self.house)
+        self.flashcard = Exercise.objects.create(
+            wordset=self.wordset, type='flashcard', expires_at=Exercise.session_expiry(),
+            questions={"0": {"front": "keltas", "back": "ferry"}, "1": {"front": "namas", "back": "house"}},
+            correct_answers={"0": "ferry", "1": "house"})
+        self.fill_in_gap = Exercise.objects.create(
+            wordset=self.wordset, type='fill_in_gap',
+            questions={"0": {"sentence": "Keliauti su ___.", "word": "keltas", "infinitive": "keltas"}},
+            correct_answers={"0": "kėltų"})
+
+    def submit(self, submissions):
+        return self.client.post("/api/submissions/", {"submissions": submissions}, format='json')
+
+    def test_records_every_submission_in_order(self):
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")):
+            response = self.submit([
+                {"exercise": self.flashcard.id, "user_answers": {"0": "ferry", "1": ""}},
+                {"exercise": self.fill_in_gap.id, "user_answers": {"0": "keltu"}},
+                {"exercise": self.flashcard.id, "user_answers": {"0": "ferry", "1": "house"}},
+            ])
+        self.assertEqual(response.status_code, 200)
+        first, gap, second = response.data['results']
+        self.assertEqual([first['exercise'], gap['exercise']], [self.flashcard.id, self.fill_in_gap.id])
+        self.assertFalse(first['is_correct'])
+        self.assertTrue(second['is_correct'])
+        self.assertEqual(gap['grades']["0"]["kind"], "diacritics")
+        self.assertEqual(second['exercise_progress'][0]['grade'], "2/2")
+
+        # Answers to the same word are applied in order; the near miss is not a correct answer
+        # but still reschedules the word as recalled
+        ferry = WordProgress.objects.get(user=self.user, word=self.ferry)
+        self.assertEqual((ferry.correct_attempts, ferry.incorrect_attempts, ferry.repetitions), (2, 1, 3))
+        house = WordProgress.objects.get(user=self.user, word=self.house)
+        self.assertEqual((house.correct_attempts, house.incorrect_attempts), (1, 1))
+        self.assertEqual(ExerciseProgress.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(DailyProgress.objects.get(user=self.user).attempts, 3)
+        self.flashcard.refresh_from_db()
+        self.assertIsNone(self.flashcard.expires_at)
+
+    def test_partial_submissions_only_update_word_progress(self):
+        response = self.submit([{"exercise": self.flashcard.id, "user_answers": {"0": "ferry"}}])
+        self.assertNotIn('is_correct', response.data['results'][0])
+        self.assertFalse(ExerciseProgress.objects.exists())
+        self.assertEqual(WordProgress.objects.get(user=self.user, word=self.ferry).correct_attempts, 1)
+
+    def test_progress_cache_is_invalidated(self):
+        namespace = hot_cache.progress_ns(self.user.pk)
+        before, = hot_cache.versions([namespace])
+        self.submit([{"exercise": self.flashcard.id, "user_answers": {"0": "ferry", "1": "house"}}])
+        self.assertNotEqual(hot_cache.versions([namespace]), [before])
+
+    def test_answers_are_logged(self):
+        self.submit([{"exercise": self.fill_in_gap.id, "user_answers": {"0": "keltu"}}])
+        event = AnswerEvent.objects.get()
+        self.assertEqual((event.word, event.exercise, event.correct, event.applied),
+                         (self.ferry, self.fill_in_gap, False, True))
+        self.assertEqual(event.grade, SM2_HARD_GRADE)
+
+    @override_settings(ANSWER_LOG_DEFERRED=True, ANSWER_LOG_SETTLE_SECONDS=0)
+    def test_deferred_progress_waits_for_compaction(self):
+        response = self.submit([{"exercise": self.flashcard.id, "user_answers": {"0": "ferry", "1": "house"}}])
+        self.assertTrue(response.data['results'][0]['is_correct'])
+        self.assertFalse(WordProgress.objects.exists())
+        self.assertFalse(DailyProgress.objects.exists())
+        self.assertEqual(AnswerEvent.objects.filter(applied=False).count(), 2)
+
+        call_command('compact_answer_log', stdout=StringIO())
+        self.assertEqual(WordProgress.objects.filter(user=self.user, correct_attempts=1).count(), 2)
+        daily = DailyProgress.objects.get(user=self.user)
+        self.assertEqual((daily.attempts, daily.correct_attempts, daily.answers_correct), (1, 1, 2))
+        self.assertFalse(ExerciseProgress.objects.filter(rolled_up=False).exists())
+
+    def test_records_the_rest_when_an_exercise_is_unknown(self):
+        response = self.submit([
+            {"exercise": 9999, "user_answers": {"0": "x"}},
+            {"exercise": self.flashcard.id, "user_answers": {"0": "ferry", "1": "house"}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        unknown, recorded = response.data["results"]
+        self.assertEqual((unknown["exercise"], unknown["status"]), (9999, "rejected"))
+        self.assertEqual((recorded["status"], recorded["is_correct"]), ("recorded", True))
+        self.assertEqual(WordProgress.objects.filter(user=self.user).count(), 2)
+
+    def test_rejects_the_whole_batch_when_invalid(self):
+        response = self.submit([
+            {"exercise": self.flashcard.id, "user_answers": {"0": "ferry", "1": "house"}},
+            {"exercise": "x", "user_answers": {"0": "x"}},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exercise", response.data["error"]["submissions"][1])
+        self.assertEqual(self.submit([]).status_code, 400)
+        self.assertFalse(WordProgress.objects.exists())
+
+    def test_rejects_other_users_exercises(self):
+        other = User.objects.create_user(username="other", password="pass", email="other@gmail.com")
+        self.client.force_authenticate(other)
+        response = self.submit([{"exercise": self.flashcard.id, "user_answers": {"0": "ferry", "1": "house"}}])
+        self.assertEqual(response.data["results"][0]["status"], "rejected")
+        self.flashcard.refresh_from_db()
+        self.assertIsNotNone(self.flashcard.expires_at)
+        self.assertFalse(ExerciseProgress.objects.exists())
+        self.assertFalse(AnswerEvent.objects.exists())
+        self.assertFalse(DailyProgress.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.router = ReplicaRouter()
+
+    def replica_flags(self, url):
+        """Whether each read made while serving ``url`` was allowed on a replica."""
+        seen = []
+
+        def db_for_read(model, **hints):
+            seen.append(db_router.replica_reads_allowed())
+            return 'default'
+
+        with mock.patch.object(ReplicaRouter, 'db_for_read', side_effect=db_for_read):
+            self.client.get(url)
+        return seen
+
+    def test_reads_use_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Word), 'default')
+        with use_replica():
+            self.assertEqual(self.router.db_for_read(Word), 'replica0')
+            self.assertEqual(self.router.db_for_write(Word), 'default')
+
+    def history_url(self):
+        wordset = WordSet.objects.create(title="Set", user=self.user)
+        return f"/api/wordset/{wordset.id}/history/"
+
+    def test_listed_view_is_routed_to_replica(self):
+        flags = self.replica_flags(self.history_url())
+        self.assertTrue(flags and all(flags))
+
+    async def test_listed_view_is_routed_to_replica_under_asgi(self):
+        url = await sync_to_async(self.history_url)()
+        seen = []
+
+        def db_for_read(model, **hints):
+            seen.append(db_router.replica_reads_allowed())
+            return 'default'
+
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(ReplicaRouter, 'db_for_read', side_effect=db_for_read):
+            await self.async_client.get(url)
+        self.assertTrue(seen and all(seen[1:]))
+
+    def test_unlisted_view_stays_on_primary(self):
+        flags = self.replica_flags("/api/wordprogress/")
+        self.assertTrue(flags and not any(flags))
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post("/api/wordset/", {
+            "title": "Set", "description": "", "public": False,
+            "words": [{"word": "namas", "infinitive": "namas", "translation": "house"}]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        flags = self.replica_flags("/api/word/")
+        self.assertTrue(flags and not any(flags))
+
+    def test_cache_fills_read_from_primary(self):
+        with use_replica():
+            filled = hot_cache.get_or_set("replica-test", [hot_cache.WORDS_NS],
+                                          lambda: self.router.db_for_read(Word))
+            self.assertEqual(self.router.db_for_read(Word), 'replica0')
+        self.assertEqual(filled, 'default')
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.other = User.objects.create_user(username="other", password="pass", email="other@gmail.com")
+        self.wordset = create_budget_fixture(self.user, wordsets=1, words=3)[0]
+        self.exercise = Exercise.objects.create(wordset=self.wordset, type="fill_in_gap",
+                                                questions={"1": "___"}, correct_answers={"1": "a"})
+        self.client.force_authenticate(self.user)
+
+    def test_wordset_not_modified(self):
+        url = f"/api/wordset/{self.wordset.id}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_wordset_etag_changes_with_words(self):
+        url = f"/api/wordset/{self.wordset.id}/"
+        etag = self.client.get(url)['ETag']
+
+        self.wordset.words.add(Word.objects.create(word="naujas", infinitive="naujas", translation="new"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['words']), 4)
+
+        word = self.wordset.words.get(word="naujas")
+        word.translation = "fresh"
+        word.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_validators_respect_visibility(self):
+        etag = self.client.get(f"/api/wordset/{self.wordset.id}/")['ETag']
+        self.client.force_authenticate(self.other)
+        response = self.client.get(f"/api/wordset/{self.wordset.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_exercise_not_modified(self):
+        url = f"/api/exercise/{self.exercise.id}/"
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_public_list_not_modified_until_a_set_changes(self):
+        url = "/api/wordset/?scope=others"
+        self.client.force_authenticate(self.other)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.wordset.public = False
+        self.wordset.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SequentialTextModel:
+    """Returns a different valid text exercise on every call."""
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        text = json.dumps({"text": f"Tekstas {self.calls}", "questions": [
+            {"question": "Kas?", "choices": ["a", "b", "c", "d"], "correct_answer": "a"}]})
+        return SimpleNamespace(text=text, usage_metadata=None)
+
+
+@override_settings(TEXT_VARIANT_POOL_SIZE=3)
+class TextVariantPoolTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.wordset.words.add(Word.objects.create(word="namas", infinitive="namas", translation="house"))
+        self.model = SequentialTextModel()
+        patches = [
+            mock.patch('api.llm.get_model', return_value=self.model),
+            mock.patch('api.text_pool.schedule_refill'),
+        ]
+        llm.budget.reset()
+        self.refill = [p.start() for p in patches][1]
+        for p in patches:
+            self.addCleanup(p.stop)
+
+    def fetch(self):
+        response = self.client.get(reverse('text-exercise'), {"wordset_id": self.wordset.id})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['text']
+
+    def test_empty_pool_generates_once_and_schedules_refill(self):
+        self.assertEqual(self.fetch(), "Tekstas 1")
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(TextExerciseVariant.objects.filter(wordset=self.wordset).count(), 1)
+        self.refill.assert_called_once()
+
+    def test_full_pool_is_rotated_without_model_calls(self):
+        self.fetch()
+        text_pool.refill(self.wordset.id, *self.refill.call_args.args[1:])
+        self.assertEqual(TextExerciseVariant.objects.filter(wordset=self.wordset).count(), 3)
+        self.refill.reset_mock()
+        calls = self.model.calls
+
+        texts = [self.fetch() for _ in range(3)]
+        self.assertEqual(len(set(texts)), 3)
+        self.assertEqual(self.model.calls, calls)
+        self.refill.assert_not_called()
+
+    def test_changed_words_start_a_new_pool(self):
+        self.fetch()
+        old_version = self.refill.call_args.args[1]
+        self.wordset.words.add(Word.objects.create(word="medis", infinitive="medis", translation="tree"))
+
+        self.assertEqual(self.fetch(), "Tekstas 2")
+        new_version = self.refill.call_args.args[1]
+        self.assertNotEqual(old_version, new_version)
+
+        text_pool.refill(self.wordset.id, new_version)
+        versions = set(TextExerciseVariant.objects.filter(wordset=self.wordset).values_list('content_version', flat=True))
+        self.assertEqual(versions, {new_version})
+
+    @override_settings(TEXT_VARIANT_REFILL_RESERVE=4)
+    def test_refills_leave_the_reserve_of_the_model_budget(self):
+        self.fetch()
+        version = self.refill.call_args.args[1]
+        while llm.budget.remaining() > 5:
+            llm.budget.record()
+
+        text_pool.refill(self.wordset.id, version)
+        # Stopped with the reserve left, one short of a full pool
+        self.assertEqual(TextExerciseVariant.objects.filter(wordset=self.wordset).count(), 2)
+        self.assertEqual(llm.budget.remaining(), 4)
+
+        self.refill.stop()
+        with mock.patch.object(text_pool._executor, 'submit') as submit:
+            text_pool.schedule_refill(self.wordset.id, version)
+        submit.assert_not_called()
+        self.refill.start()
+
+
+class StreamedResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.usage_metadata = SimpleNamespace(prompt_token_count=5, candidates_token_count=len(chunks))
+
+    def __iter__(self):
+        return iter(SimpleNamespace(text=chunk) for chunk in self.chunks)
+
+
+class StreamingTextModel:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        return StreamedResponse(self.chunks)
+
+
+class TextExerciseStreamTest(TestCase):
+    questions = [{"question": "Kas?", "choices": ["a", "b", "c", "d"], "correct_answer": "a"}]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.client.force_authenticate(self.user)
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.wordset.words.add(Word.objects.create(word="namas", infinitive="namas", translation="house"))
+        refill = mock.patch('api.text_pool.schedule_refill')
+        refill.start()
+        self.addCleanup(refill.stop)
+        hot_cache.shared().clear()
+
+    def stream(self, chunks):
+        model = StreamingTextModel(chunks)
+        with mock.patch('api.llm.get_model', return_value=model), self.assertLogs('api.llm', 'INFO'):
+            response = self.client.get(reverse('text-exercise'), {"wordset_id": self.wordset.id, "stream": 1})
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            events = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        return model, events
+
+    def test_text_streams_before_questions(self):
+        body = json.dumps(self.questions)
+        # The marker is split across chunks and must never leak into the text
+        model, events = self.stream(["Labas, ", "čia namas.\n###QUE", "STIONS###\n", body[:10], body[10:]])
+
+        deltas = [e['delta'] for e in events if e['type'] == 'text']
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual("".join(deltas).strip(), "Labas, čia namas.")
+        self.assertEqual([e['type'] for e in events[-2:]], ['questions', 'done'])
+        self.assertEqual(events[-2]['questions'], self.questions)
+        self.assertEqual(TextExerciseVariant.objects.get(wordset=self.wordset).payload['text'], "Labas, čia namas.")
+
+    def test_pooled_variant_is_sent_immediately(self):
+        TextExerciseVariant.objects.create(
+            wordset=self.wordset, content_version=text_pool.content_version(text_pool.wordset_words(self.wordset.id)),
+            payload={"text": "Senas tekstas", "questions": self.questions})
+        response = self.client.get(reverse('text-exercise'), {"wordset_id": self.wordset.id, "stream": 1})
+        events = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([e['type'] for e in events], ['text', 'questions', 'done'])
+        self.assertEqual(events[0]['delta'], "Senas tekstas")
+
+    def test_malformed_stream_reports_error(self):
+        model, events = self.stream(["Tik tekstas be klausimų"])
+        self.assertEqual(events[-1]['type'], 'error')
+        self.assertFalse(TextExerciseVariant.objects.exists())
+
+    def test_joins_a_generation_in_progress(self):
+        self.addCleanup(hot_cache.shared().clear)
+        key = text_pool._flight_key(text_pool.wordset_words(self.wordset.id))
+        payload = {"text": "Bendras tekstas", "questions": self.questions}
+        hot_cache.shared().add(f"{key}:lock", "other", 30)
+        hot_cache.shared().set(f"{key}:other", {'text': json.dumps(payload)}, 30)
+
+        model, events = self.stream(["never requested"])
+        self.assertEqual(model.calls, 0)
+        self.assertEqual([e['type'] for e in events], ['text', 'questions', 'done'])
+        self.assertEqual(events[1]['text'], "Bendras tekstas")
+        # The request that generated it adds it to the pool
+        self.assertFalse(TextExerciseVariant.objects.exists())
+
+    def test_streamed_text_is_shared_with_requests_for_the_same_pool(self):
+        words = text_pool.wordset_words(self.wordset.id)
+        body = json.dumps(self.questions)
+        model = StreamingTextModel(["Labas.\n###QUESTIONS###\n", body])
+        with mock.patch('api.llm.get_model', return_value=model), self.assertLogs('api.llm', 'INFO'), \
+                llm.call('text_exercise') as call:
+            splitter = text_pool._StreamSplitter()
+            for chunk in singleflight.stream(call, text_pool._flight_key(words),
+                                             lambda: call.stream(text_pool.build_prompt(words, streamed=True)),
+                                             lambda: text_pool._shared_text(splitter)):
+                splitter.feed(chunk)
+                # Joined while the stream is in flight
+                flight, leader = singleflight._join(text_pool._flight_key(words))
+                self.assertFalse(leader)
+        self.assertTrue(flight.done.is_set())
+        self.assertEqual(text_pool._parse(flight.text), {"text": "Labas.", "questions": self.questions})
+
+
+class AsyncLLMURLConf:
+    """The API as routed with ASYNC_LLM_VIEWS enabled."""
+    urlpatterns = [path('api/', include(api_urls.async_llm_urlpatterns + [path('', include(api_urls.router.urls))]))]
+
+
+class SlowModel:
+    """Async-only fake that records how many calls are in flight at once."""
+    def __init__(self, text, delay=0.05):
+        self.text = text
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return SimpleNamespace(text=self.text, usage_metadata=None)
+
+
+@override_settings(ROOT_URLCONF=AsyncLLMURLConf)
+class AsyncLLMViewsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", password="pass", email="user@gmail.com")
+        self.wordset = WordSet.objects.create(title="Test Set", user=self.user)
+        self.words = [Word.objects.create(word=w, infinitive=w, translation=t)
+                      for w, t in [("namas", "house"), ("medis", "tree"), ("katė", "cat")]]
+        self.wordset.words.add(*self.words)
+        quiet = mock.patch.object(llm.logger, 'disabled', True)
+        quiet.start()
+        self.addCleanup(quiet.stop)
+        # Earlier tests' model calls count against this process's rate budget
+        llm.budget.reset()
+
+    async def test_requires_login(self):
+        response = await self.async_client.get("/api/text-exercise/", {"wordset_id": self.wordset.id})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_basic_auth_needs_no_csrf_token_unlike_sessions(self):
+        exercise = await Exercise.objects.acreate(wordset=self.wordset, type="flashcard", questions={"0": {}},
+                                                  correct_answers={"0": "house"})
+        client = AsyncClient(enforce_csrf_checks=True)
+        url, body = f"/api/exercise/{exercise.id}/submit/", {"user_answers": {"0": "house"}}
+        credentials = base64.b64encode(b"user@gmail.com:pass").decode()
+
+        response = await client.post(url, body, content_type="application/json",
+                                     headers={"Authorization": f"Basic {credentials}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["is_correct"])
+        wrong = base64.b64encode(b"user@gmail.com:nope").decode()
+        response = await client.post(url, body, content_type="application/json",
+                                     headers={"Authorization": f"Basic {wrong}"})
+        self.assertEqual(response.status_code, 403)
+
+        await client.aforce_login(self.user)
+        response = await client.post(url, body, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("CSRF", response.json()["detail"])
+
+    async def test_feedback_is_requested_concurrently(self):
+        exercise = await Exercise.objects.acreate(
+            wordset=self.wordset, type="fill_in_gap",
+            questions={str(i): {"sentence": "___", "word": w.word, "infinitive": w.word} for i, w in enumerate(self.words)},
+            correct_answers={str(i): w.word for i, w in enumerate(self.words)})
+        model = SlowModel("Try the accusative.")
+        await self.async_client.aforce_login(self.user)
+
+        with mock.patch('api.llm.get_model', return_value=model):
+            response = await self.async_client.post(
+                f"/api/exercise/{exercise.id}/submit/", {"user_answers": {"0": "x", "1": "y", "2": "z"}},
+                content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(model.peak, 3)
+        self.assertEqual(response.json()['feedback'], {str(i): "Try the accusative." for i in range(3)})
+        # Queries made from sync_to_async threads are still timed
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+        self.assertTrue(await ExerciseProgress.objects.filter(exercise=exercise, grade="0/3").aexists())
+
+    async def test_expired_exercise_cannot_be_submitted(self):
+        exercise = await Exercise.objects.acreate(
+            wordset=self.wordset, type="flashcard", questions={"0": {}}, correct_answers={"0": "house"},
+            expires_at=timezone.now() - timedelta(minutes=1))
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.post(f"/api/exercise/{exercise.id}/submit/",
+                                                {"user_answers": {"0": "house"}}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 404)
+        await exercise.arefresh_from_db()
+        self.assertIsNotNone(exercise.expires_at)
+        self.assertFalse(await ExerciseProgress.objects.filter(exercise=exercise).aexists())
+
+    async def test_fill_in_gap_sentences_are_generated_concurrently(self):
+        model = SlowModel('{"sentence": "Tai ___.", "correct_form": "forma"}')
+        await self.async_client.aforce_login(self.user)
+
+        with mock.patch('api.llm.get_model', return_value=model):
+            response = await self.async_client.post(
+                "/api/exercise/", {"type": "fill_in_gap", "wordset": self.wordset.id}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(model.peak, 3)
+        self.assertEqual(list(response.json()['questions']), ["0", "1", "2"])
+        self.assertEqual(await Exercise.objects.filter(type="fill_in_gap").acount(), 1)
+
+    async def test_multiple_choice_and_photo(self):
+        await self.async_client.aforce_login(self.user)
+        reply = '[{"question": "namas", "choices": ["house", "tree", "cat", "dog"], "correct": "house"}]'
+        with mock.patch('api.llm.get_model', return_value=FakeModel(reply)):
+            response = await self.async_client.post(
+                "/api/exercise/", {"type": "multiple_choice", "wordset": self.wordset.id}, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['correct_answers'], {"0": "house"})
+
+        image = BytesIO()
+        Image.new("RGB", (4, 4)).save(image, "PNG")
+        upload = SimpleUploadedFile("words.png", image.getvalue(), content_type="image/png")
+        words = '[{"word": "namo", "translation": "home", "infinitive": "namas"}]'
+        with mock.patch('api.llm.get_model', return_value=FakeModel(words)):
+            response = await self.async_client.post("/api/process-photo/", {"image": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['words'][0]['infinitive'], "namas")
+
+    async def test_listing_still_served_by_drf(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/api/exercise/")
+        self.assertEqual(response.status_code, 200)
+
+    async def test_text_exercise_stream(self):
+        await self.async_client.aforce_login(self.user)
+        body = json.dumps([{"question": "Kas?", "choices": ["a", "b", "c", "d"], "correct_answer": "a"}])
+        model = StreamingTextModel(["Labas.\n", "###QUESTIONS###", body])
+
+        async def stream(contents, stream=False, **kwargs):
+            async def chunks():
+                for chunk in model.chunks:
+                    yield SimpleNamespace(text=chunk)
+            response = chunks()
+            return response
+        model.generate_content_async = stream
+
+        with mock.patch('api.llm.get_model', return_value=model), mock.patch('api.text_pool.schedule_refill'):
+            response = await self.async_client.get("/api/text-exercise/", {"wordset_id": self.wordset.id, "stream": 1})
+            lines = b"".join([chunk async for chunk in response.streaming_content]).splitlines()
+        events = [json.loads(line) for line in lines]
+        self.assertEqual(events[0], {"type": "text", "delta": "Labas.\n"})
+        self.assertEqual([e['type'] for e in events[-2:]], ['questions', 'done'])
+
+    async def test_text_exercise_stream_joins_a_generation_in_progress(self):
+        await self.async_client.aforce_login(self.user)
+        words = await sync_to_async(text_pool.wordset_words)(self.wordset.id)
+        key = text_pool._flight_key(words)
+        payload = {"text": "Bendras tekstas",
+                   "questions": [{"question": "Kas?", "choices": ["a", "b", "c", "d"], "correct_answer": "a"}]}
+        await hot_cache.shared().aadd(f"{key}:lock", "other", 30)
+        await hot_cache.shared().aset(f"{key}:other", {'text': json.dumps(payload)}, 30)
+        self.addCleanup(hot_cache.shared().clear)
+
+        with mock.patch('api.llm.get_model', side_effect=AssertionError("model called")), \
+                mock.patch('api.text_pool.schedule_refill'):
+            response = await self.async_client.get("/api/text-exercise/", {"wordset_id": self.wordset.id, "stream": 1})
+            lines = b"".join([chunk async for chunk in response.streaming_content]).splitlines()
+        events = [json.loads(line) for line in lines]
+        self.assertEqual([e['type'] for e in events], ['text', 'questions', 'done'])
+        self.assertEqual(events[0]['delta'], "Bendras tekstas")
+        self.assertFalse(await TextExerciseVariant.objects.aexists())
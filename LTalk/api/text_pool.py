@@ -0,0 +1,357 @@
+"""
+Pool of generated reading-comprehension texts.
+
+A text exercise is one large model call, so finished texts are stored as
+``TextExerciseVariant`` rows keyed by wordset and content version (a hash of
+the wordset's words). Requests are served from the pool and each user rotates
+through its variants. A background worker tops the pool up only while it
+holds fewer than ``TEXT_VARIANT_POOL_SIZE`` variants for the current content
+version; changing the words starts a new pool and the old one is dropped.
+Refills stop while fewer than ``TEXT_VARIANT_REFILL_RESERVE`` calls are left
+in the per-minute model budget, which requests need more.
+
+Requests that find the pool empty at the same time share one generation
+(``api.singleflight``), streamed or not, and only the one that made it adds
+it to the pool.
+"""
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from main import cache as hot_cache
+from main.models import TextExerciseVariant, Word
+
+from . import llm, prompts, singleflight
+
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=settings.TEXT_VARIANT_WORKERS, thread_name_prefix='text-pool')
+
+# Long enough for a full refill; the lock is released early when it finishes
+REFILL_LOCK_SECONDS = 10 * 60
+ROTATION_SECONDS = 7 * 24 * 60 * 60
+
+# Streamed responses put the plain text first, then this line and the questions
+QUESTIONS_MARKER = prompts.QUESTIONS_MARKER
+JSON_CONFIG = prompts.json_config(prompts.TEXT_EXERCISE_SCHEMA)
+
+
+def wordset_words(wordset_id):
+    return list(Word.objects.filter(wordsets=wordset_id).order_by('id').values('word', 'translation', 'infinitive'))
+
+
+def content_version(words):
+    key = json.dumps(sorted((w['word'], w['translation'], w['infinitive']) for w in words), ensure_ascii=False)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_variant(wordset, words, user):
+    """Text and questions for ``user``, generating one synchronously only if the pool is empty."""
+    version = content_version(words)
+    variants = _pooled(wordset.id, version)
+    if not variants:
+        variants = [_first_variant(wordset.id, version, words)]
+    return _pick(user, wordset.id, version, variants)
+
+
+async def aget_variant(wordset, words, user):
+    """``get_variant`` for async views."""
+    version = content_version(words)
+    variants = await sync_to_async(_pooled)(wordset.id, version)
+    if not variants:
+        variants = [await _afirst_variant(wordset.id, version, words)]
+    return await sync_to_async(_pick)(user, wordset.id, version, variants)
+
+
+def _pooled(wordset_id, version):
+    return list(
+        TextExerciseVariant.objects.filter(wordset_id=wordset_id, content_version=version)
+        .order_by('id').values_list('payload', flat=True)
+    )
+
+
+def _first_variant(wordset_id, version, words):
+    """Generates and pools a variant for an empty pool, unless another request already is."""
+    with llm.call('text_exercise') as call:
+        try:
+            payload = _parse(singleflight.generate(call, build_prompt(words), generation_config=JSON_CONFIG))
+        except Exception as e:
+            _generation_failed(call, e)
+    if not call.coalesced:
+        _add_to_pool(wordset_id, version, payload)
+    return payload
+
+
+async def _afirst_variant(wordset_id, version, words):
+    with llm.call('text_exercise') as call:
+        try:
+            payload = _parse(await singleflight.agenerate(call, build_prompt(words), generation_config=JSON_CONFIG))
+        except Exception as e:
+            _generation_failed(call, e)
+    if not call.coalesced:
+        await sync_to_async(_add_to_pool)(wordset_id, version, payload)
+    return payload
+
+
+def _add_to_pool(wordset_id, version, payload):
+    TextExerciseVariant.objects.create(wordset_id=wordset_id, content_version=version, payload=payload)
+    return payload
+
+
+def _pick(user, wordset_id, version, variants):
+    """The user's next variant; tops the pool up if it is not full."""
+    if len(variants) < settings.TEXT_VARIANT_POOL_SIZE:
+        schedule_refill(wordset_id, version)
+    return variants[_next_index(user, wordset_id, version) % len(variants)]
+
+
+def _next_index(user, wordset_id, version):
+    key = f"text-variant-seen:{user.pk}:{wordset_id}:{version}"
+    cache = hot_cache.shared()
+    cache.add(key, -1, ROTATION_SECONDS)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        return 0
+
+
+def _flight_key(words):
+    """The single-flight key of ``_first_variant``, shared by streamed requests."""
+    return singleflight.flight_key('text_exercise', build_prompt(words), generation_config=JSON_CONFIG)
+
+
+def _budget_left():
+    return llm.budget.remaining() > settings.TEXT_VARIANT_REFILL_RESERVE
+
+
+def schedule_refill(wordset_id, version):
+    if not _budget_left():
+        # The next request that finds the pool short tries again
+        return
+    # One refill per pool across all workers
+    if hot_cache.shared().add(f"text-refill:{wordset_id}:{version}", 1, REFILL_LOCK_SECONDS):
+        _executor.submit(_refill_in_background, wordset_id, version)
+
+
+def _refill_in_background(wordset_id, version):
+    try:
+        refill(wordset_id, version)
+    finally:
+        # Worker threads hold their own connections
+        close_old_connections()
+
+
+def refill(wordset_id, version):
+    """Generate variants until the pool for ``version`` is full. Runs off the request thread."""
+    try:
+        words = wordset_words(wordset_id)
+        if content_version(words) != version:
+            # The words changed while this was queued; the next request schedules the new pool
+            return
+        TextExerciseVariant.objects.filter(wordset_id=wordset_id).exclude(content_version=version).delete()
+
+        pool = TextExerciseVariant.objects.filter(wordset_id=wordset_id, content_version=version)
+        missing = settings.TEXT_VARIANT_POOL_SIZE - pool.count()
+        prompt = build_prompt(words)
+        for _ in range(missing):
+            if not _budget_left():
+                break
+            TextExerciseVariant.objects.create(wordset_id=wordset_id, content_version=version,
+                                               payload=generate(prompt))
+    except Exception:
+        logger.exception("Refilling text variants for wordset %s failed", wordset_id)
+    finally:
+        hot_cache.shared().delete(f"text-refill:{wordset_id}:{version}")
+
+
+def build_prompt(words, streamed=False):
+    return prompts.text_exercise(words, streamed=streamed)
+
+
+def generate(prompt):
+    with llm.call('text_exercise') as call:
+        try:
+            return _parse(call.generate(prompt, generation_config=JSON_CONFIG).text)
+        except Exception as e:
+            _generation_failed(call, e)
+
+
+def _parse(response_text):
+    content = json.loads(response_text)
+
+    # Validate the expected structure
+    if not isinstance(content, dict) or 'text' not in content or 'questions' not in content:
+        raise ValueError("Response missing required fields")
+    _validate_questions(content['questions'])
+
+    return content
+
+
+def _generation_failed(call, e):
+    logger.warning("Error generating content: %s", e)
+    if not call.error:
+        call.parse_failed()
+    raise ValueError(f"Failed to generate content: {str(e)}")
+
+
+def _validate_questions(questions):
+    if not isinstance(questions, list) or len(questions) == 0:
+        raise ValueError("Questions must be a non-empty list")
+
+    for q in questions:
+        if not all(k in q for k in ('question', 'choices', 'correct_answer')):
+            raise ValueError("Question missing required fields")
+
+
+def parse_streamed(response_text):
+    """Split a streamed response into the ``{"text", "questions"}`` payload."""
+    if QUESTIONS_MARKER not in response_text:
+        raise ValueError("Response has no questions section")
+    text, questions_text = response_text.split(QUESTIONS_MARKER, 1)
+    questions = json.loads(questions_text)
+    _validate_questions(questions)
+    return {'text': text.strip(), 'questions': questions}
+
+
+def _event(kind, **data):
+    return json.dumps({'type': kind, **data}, ensure_ascii=False) + "\n"
+
+
+class _StreamSplitter:
+    """Separates the passage of a streamed response from its questions section."""
+
+    def __init__(self):
+        self.received = []
+        self.pending = ""
+        self.in_questions = False
+
+    def feed(self, chunk):
+        """Text that can be shown for ``chunk``; may be empty."""
+        self.received.append(chunk)
+        if self.in_questions:
+            return ""
+        self.pending += chunk
+        if QUESTIONS_MARKER in self.pending:
+            self.in_questions = True
+            return self.pending.split(QUESTIONS_MARKER, 1)[0]
+        # Hold back anything that could be the start of the marker
+        safe = max(len(self.pending) - len(QUESTIONS_MARKER) + 1, 0)
+        text, self.pending = self.pending[:safe], self.pending[safe:]
+        return text
+
+    def result(self):
+        return parse_streamed("".join(self.received))
+
+
+def _pooled_events(payload):
+    return [
+        _event('text', delta=payload['text']),
+        _event('questions', text=payload['text'], questions=payload['questions']),
+        _event('done'),
+    ]
+
+
+def _joined_stream(wordset_id, version, user, payload):
+    """Events for a variant another request generated and pooled."""
+    _next_index(user, wordset_id, version)
+    return _pooled_events(payload)
+
+
+def _finish_stream(wordset_id, version, user, payload):
+    _add_to_pool(wordset_id, version, payload)
+    # Count the streamed variant as seen so the next request gets another one
+    _next_index(user, wordset_id, version)
+    schedule_refill(wordset_id, version)
+    return [
+        _event('questions', text=payload['text'], questions=payload['questions']),
+        _event('done'),
+    ]
+
+
+def stream_variant(wordset, words, user):
+    """
+    NDJSON events for a text exercise: ``text`` deltas, then ``questions``
+    (with the final text) and ``done``, or a single ``error``.
+
+    A pooled variant is sent at once; otherwise the model's output is relayed
+    as it arrives and the finished exercise joins the pool. A request that
+    joins another one's generation gets the whole text once it is done.
+    """
+    version = content_version(words)
+    variants = _pooled(wordset.id, version)
+    if variants:
+        yield from _pooled_events(_pick(user, wordset.id, version, variants))
+        return
+
+    prompt = build_prompt(words, streamed=True)
+    with llm.call('text_exercise') as call:
+        splitter = _StreamSplitter()
+        shared = None
+        try:
+            for chunk in singleflight.stream(call, _flight_key(words), lambda: call.stream(prompt),
+                                             lambda: _shared_text(splitter)):
+                if call.coalesced:
+                    shared = chunk
+                    continue
+                text = splitter.feed(chunk)
+                if text:
+                    yield _event('text', delta=text)
+            payload = _parse(shared) if call.coalesced else splitter.result()
+        except Exception as e:
+            logger.warning("Error streaming content: %s", e)
+            if not call.error:
+                call.parse_failed()
+            yield _event('error', error=f"Failed to generate content: {str(e)}")
+            return
+
+    if call.coalesced:
+        yield from _joined_stream(wordset.id, version, user, payload)
+    else:
+        yield from _finish_stream(wordset.id, version, user, payload)
+
+
+def _shared_text(splitter):
+    # Shared in the JSON form non-streamed requests for the same pool parse
+    return json.dumps(splitter.result(), ensure_ascii=False)
+
+
+async def astream_variant(wordset, words, user):
+    """``stream_variant`` for async views."""
+    version = content_version(words)
+    variants = await sync_to_async(_pooled)(wordset.id, version)
+    if variants:
+        for event in _pooled_events(await sync_to_async(_pick)(user, wordset.id, version, variants)):
+            yield event
+        return
+
+    prompt = build_prompt(words, streamed=True)
+    with llm.call('text_exercise') as call:
+        splitter = _StreamSplitter()
+        shared = None
+        try:
+            async for chunk in singleflight.astream(call, _flight_key(words), lambda: call.stream_async(prompt),
+                                                    lambda: _shared_text(splitter)):
+                if call.coalesced:
+                    shared = chunk
+                    continue
+                text = splitter.feed(chunk)
+                if text:
+                    yield _event('text', delta=text)
+            payload = _parse(shared) if call.coalesced else splitter.result()
+        except Exception as e:
+            logger.warning("Error streaming content: %s", e)
+            if not call.error:
+                call.parse_failed()
+            yield _event('error', error=f"Failed to generate content: {str(e)}")
+            return
+
+    finish = _joined_stream if call.coalesced else _finish_stream
+    for event in await sync_to_async(finish)(wordset.id, version, user, payload):
+        yield event
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
-from .views import ProcessPhotoAPIView, WordViewSet, WordSetViewSet, SubmitExerciseAPIView, WordProgressViewSet, ExerciseViewSet, TextExerciseAPIView
+from .views import ProcessPhotoAPIView, WordViewSet, WordSetViewSet, SubmitExerciseAPIView, WordProgressViewSet, ExerciseViewSet, TextExerciseAPIView, ExerciseHistoryAPIView, DailyProgressAPIView, SubmitBatchAPIView
+from . import async_views
 
 from rest_framework import routers
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
@@ -11,11 +13,27 @@ router.register(r'wordset', WordSetViewSet, basename='wordset')
 router.register(r'wordprogress', WordProgressViewSet, basename='word-progress')
 router.register(r'exercise', ExerciseViewSet, basename='excercise')
 
-urlpatterns = [
-    path('', include(router.urls)),
+# Endpoints that wait on Gemini, as DRF views (WSGI) ...
+sync_llm_urlpatterns = [
     path('exercise/<int:exercise_id>/submit/', SubmitExerciseAPIView.as_view(), name='submit-exercise'),
     path('text-exercise/', TextExerciseAPIView.as_view(), name='text-exercise'),
+    path('process-photo/', ProcessPhotoAPIView.as_view(), name='process_photo'),
+]
+
+# ... or as async views for ASGI deployments. Exercise creation is shadowed
+# here, ahead of the router, so generated exercises are created asynchronously.
+async_llm_urlpatterns = [
+    path('exercise/', async_views.exercise_collection, name='excercise-list'),
+    path('exercise/<int:exercise_id>/submit/', async_views.submit_exercise, name='submit-exercise'),
+    path('text-exercise/', async_views.text_exercise, name='text-exercise'),
+    path('process-photo/', async_views.process_photo, name='process_photo'),
+]
+
+urlpatterns = (async_llm_urlpatterns if settings.ASYNC_LLM_VIEWS else sync_llm_urlpatterns) + [
+    path('wordset/<int:wordset_id>/history/', ExerciseHistoryAPIView.as_view(), name='exercise-history'),
+    path('progress/daily/', DailyProgressAPIView.as_view(), name='progress-daily'),
+    path('submissions/', SubmitBatchAPIView.as_view(), name='submit-batch'),
+    path('', include(router.urls)),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path("docs/", SpectacularSwaggerView.as_view(url_name="schema")),
-    path('process-photo/', ProcessPhotoAPIView.as_view(), name='process_photo'),
 ]
@@ -1,6 +1,7 @@
-import re
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
+from rest_framework.generics import ListAPIView
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
@@ -8,41 +9,67 @@ from rest_framework import status
 
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Max, Value, DateTimeField
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.utils.http import http_date
+from django.db.models import Count, F, Max, Sum, Value, DateTimeField
 from django.db.models.functions import Coalesce, Greatest
 
-from .serializer import ExerciseProgressSerializer, ExerciseSerializer, WordSerializer, WordSetSerializer, WordProgressSerializer
-from main.models import Word, WordSet, WordProgress, Exercise, ExerciseProgress
+from .serializer import (DailyProgressSerializer, ExerciseHistorySerializer, ExerciseHistorySummarySerializer,
+                         ExerciseProgressSerializer, ExerciseSerializer, SubmitBatchSerializer, WordSerializer,
+                         WordSetSerializer, WordProgressSerializer)
+from main.models import DailyProgress, Word, WordSet, WordProgress, Exercise, ExerciseProgress, percent
+from main import cache as hot_cache
+from main.selection import review_queue, sample_unlearned
 from django.db import transaction
 
-import google.generativeai as genai
-import PIL.Image
-from dotenv import load_dotenv
-import os
-import json
-from datetime import datetime
+import logging
+import random
+from datetime import datetime, timedelta
 
+from . import distractors, llm, prompts, singleflight, submissions, text_pool
 
-# Load environment variables from .env file
-load_dotenv()
 
-# Access the API key
-api_key = os.getenv('GOOGLE_API_KEY')
-if not api_key:
-    raise Exception("Please set the GOOGLE_API_KEY in your .env file.")
+logger = logging.getLogger(__name__)
 
-# Configure the API key
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.0-flash')
+
+def conditional(request, tag, updated, respond):
+    """
+    Answer a conditional GET from validators looked up ahead of the body.
+
+    ``tag`` identifies the representation and ``updated`` is its last
+    modification time. When the client's copy is still current a 304 is
+    returned and ``respond`` is never called; otherwise its response gets
+    ``ETag``/``Last-Modified`` and must be revalidated on the next visit.
+    """
+    etag = f'"{tag}-{updated.timestamp():.6f}"'
+    last_modified = int(updated.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Bodies are per-user: only the browser may keep them, and only with revalidation
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 class WordViewSet(ModelViewSet):
    
     serializer_class = WordSerializer
-    queryset = Word.objects.all()
+    queryset = Word.objects.order_by('id')
     http_method_names = ['get', 'head', 'options']
 
+    def list(self, request, *args, **kwargs):
+        data = hot_cache.get_or_set(
+            f"word-list:{request.build_absolute_uri()}", [hot_cache.WORDS_NS],
+            lambda: super(WordViewSet, self).list(request, *args, **kwargs).data,
+        )
+        return Response(data)
+
 
 class WordSetViewSet(ModelViewSet):
 
@@ -53,8 +80,7 @@ class WordSetViewSet(ModelViewSet):
         scope = self.request.query_params.get("scope")
         search = self.request.query_params.get("search", "").strip()
 
-        queryset = WordSet.objects.all()
-
+        queryset = WordSet.objects.prefetch_related('words')
 
         if scope == 'others':
             queryset = queryset.filter(public=True).exclude(user=self.request.user)
@@ -70,6 +96,51 @@ class WordSetViewSet(ModelViewSet):
             )
         ).order_by('-sort_time')
     
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("scope") != 'others':
+            # Own sets are ordered by exercise activity, which has no cheap validator
+            return super().list(request, *args, **kwargs)
+        # Any edit, publish/unpublish or deletion changes the newest timestamp or the count
+        state = WordSet.objects.filter(public=True).exclude(user=request.user).aggregate(
+            latest=Max('updated'), total=Count('id'))
+        if state['latest'] is None:
+            return super().list(request, *args, **kwargs)
+        return conditional(request, f"wordsets-{request.user.id}-{state['total']}", state['latest'],
+                           lambda: super(WordSetViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, pk=None):
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        validators = WordSet.objects.filter(pk=pk).values_list('user_id', 'public', 'updated').first()
+        if validators is None:
+            raise Http404
+        user_id, public, updated = validators
+
+        # Same visibility rules as get_queryset()
+        if request.query_params.get("scope") == 'others':
+            visible = public and user_id != request.user.id
+        else:
+            visible = user_id == request.user.id
+        if not visible:
+            raise Http404
+
+        def respond():
+            entry = hot_cache.get_or_set(f"wordset-detail:{pk}", [hot_cache.wordset_ns(pk)],
+                                         lambda: self._wordset_entry(pk))
+            if entry is None:
+                raise Http404
+            return Response(entry['data'])
+
+        return conditional(request, f"wordset-{pk}", updated, respond)
+
+    def _wordset_entry(self, pk):
+        wordset = WordSet.objects.prefetch_related('words').filter(pk=pk).first()
+        if wordset is None:
+            return None
+        return {'data': dict(self.get_serializer(wordset).data)}
+
     @action(detail=True, methods=['post'], url_path='duplicate')
     def duplicate_wordset(self, request, pk=None):
         original = WordSet.objects.filter(pk=pk).first()
@@ -141,92 +212,53 @@ class ExerciseViewSet(ModelViewSet):
         if exercise_type:
             queryset = queryset.filter(type=exercise_type)
 
-        queryset = queryset.filter(wordset__user=user)
+        queryset = queryset.filter(wordset__user=user).live()
 
         if exercise_type == 'flashcard':
             for exercise in queryset:
-                filtered_words = self._get_unlearned_words(exercise.wordset, user)
-                questions, correct_answers = self._generate_flashcard_data(filtered_words)
+                due_words = review_queue(user, exercise.wordset, settings.REVIEW_BATCH_SIZE)
+                questions, correct_answers = self._generate_flashcard_data(due_words)
                 exercise.questions = questions
                 exercise.correct_answers = correct_answers
 
         elif exercise_type == "multiple_choice":
             for exercise in queryset:
-                questions, correct_answers = self._generate_m_choice_data(exercise.wordset.words.all())
+                words = sample_unlearned(user, exercise.wordset, settings.REVIEW_BATCH_SIZE)
+                questions, correct_answers = self._generate_m_choice_data(words, user)
                 exercise.questions = questions
                 exercise.correct_answers = correct_answers
 
         return queryset
 
-    def _create_questions(self, data):
-        prompt_text = (
-            "Use the given list of Lithuanian words with their English translations to generate multiple choice questions. "
-            "Each question should use the Lithuanian word as the question and provide four English answer options: "
-            "one correct translation and three plausible but incorrect distractors. "
-            "Format the response as a JSON array of objects with the following fields: "
-            "'question' (Lithuanian word), 'choices' (list of 4 English answers), and 'correct' (correct English translation). "
-            "Example format: ['1':{\"question\": \"eiti\", \"choices\": [\"to walk\", \"to sleep\", \"to eat\", \"to read\"], \"correct\": \"to walk\"}]\n\n"
-            "Here is the list of words:\n"
-        )
-
-        word_list = [{"word": word.word, "translation": word.translation} for word in data]
-        word_list_str = json.dumps(word_list, ensure_ascii=False, indent=2)
-
-        full_prompt = prompt_text + word_list_str
+    def retrieve(self, request, *args, **kwargs):
+        if request.query_params.get('type'):
+            # Flashcard/multiple choice payloads are regenerated per request
+            return super().retrieve(request, *args, **kwargs)
         try:
-            response = model.generate_content(full_prompt)
-            response_text = response.text.strip()
-            
-
-            if not response_text.startswith('['):
-                import re
-                json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-                if json_match:
-                    response_text = json_match.group(0)
-                else:
-                    return Response({
-                        "error": "Invalid response format",
-                        "raw_response": response_text
-                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            questions = json.loads(response_text)
-            if not isinstance(questions, list):
-                raise ValueError("Response is not a list")
-
-            return Response({"questions": questions}, status=status.HTTP_200_OK)
-
-        except json.JSONDecodeError as e:
-            return Response({
-                "error": "JSON parsing error",
-                "message": str(e),
-                "raw_response": response.text
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-    def _get_unlearned_words(self, wordset, user):
-        """Helper to get words not yet learned by the user."""
-        all_words = wordset.words.all()
-        if not all_words.exists():
-            return Word.objects.none() 
-
-        progress_map = {
-            wp.word_id: wp.is_learned
-            for wp in WordProgress.objects.filter(user=user, word__in=all_words)
-        }
-
-        # Filter words: include if no progress exists or if progress shows not learned
-        unlearned_word_ids = [
-            word.id for word in all_words
-            if word.id not in progress_map or progress_map[word.id] is False
-        ]
-
-        # If no unlearned words but there are words in the set, return all words
-        if not unlearned_word_ids and all_words.exists():
-            return all_words
-        
-        return all_words.filter(id__in=unlearned_word_ids)
+            pk = int(kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        validators = Exercise.objects.live().filter(pk=pk).values_list('wordset__user_id', 'updated').first()
+        if validators is None or validators[0] != request.user.id:
+            raise Http404
+
+        def respond():
+            entry = hot_cache.get_or_set(f"exercise-detail:{pk}", [hot_cache.exercise_ns(pk)],
+                                         lambda: self._exercise_entry(pk))
+            if entry is None:
+                raise Http404
+            return Response(entry['data'])
+
+        return conditional(request, f"exercise-{pk}", validators[1], respond)
+
+    def _exercise_entry(self, pk):
+        exercise = Exercise.objects.live().filter(pk=pk).first()
+        if exercise is None:
+            return None
+        return {'data': dict(self.get_serializer(exercise).data)}
 
     def _generate_flashcard_data(self, words):
-        """Generates questions and answers dicts from a queryset of words."""
+        """Generates questions and answers dicts from a list of words."""
         questions = {}
         correct_answers = {}
         for i, word in enumerate(words):
@@ -234,17 +266,43 @@ class ExerciseViewSet(ModelViewSet):
             correct_answers[str(i)] = word.translation
         return questions, correct_answers
 
-    def _generate_m_choice_data(self, words):
-        """Generates questions and answers dicts from a queryset of words."""
-        response = self._create_questions(words)
+    def _generate_m_choice_data(self, words, user):
+        """Generates questions and answers dicts from a list of words."""
+        if self._local_m_choice():
+            return self._m_choice_data(distractors.multiple_choice_questions(words, user))
+        with llm.call('multiple_choice') as call:
+            try:
+                text = singleflight.generate(call, self._m_choice_prompt(words),
+                                             generation_config=prompts.json_config(prompts.MULTIPLE_CHOICE_SCHEMA))
+                questions_list = prompts.parse(call, text, list)
+            except Exception as e:
+                questions_list = self._m_choice_failed(call, e, words, user)
+        return self._m_choice_data(questions_list)
+
+    def _m_choice_prompt(self, words):
+        # Words in a fixed order, so users who drew the same words share one generation
+        return prompts.multiple_choice(sorted(words, key=lambda word: word.pk))
+
+    def _local_m_choice(self):
+        """True if distractors should be picked locally rather than by the model."""
+        if settings.MULTIPLE_CHOICE_DISTRACTORS == 'local':
+            return True
+        if llm.budget.exhausted():
+            llm.record_fallback('multiple_choice', 'local', reason='rate_limit')
+            return True
+        return False
+
+    def _m_choice_failed(self, call, error, words, user):
+        logger.warning("Error generating multiple choice questions: %s", error)
+        call.used_fallback('local', reason=llm.fallback_reason(
+            error, 'parse_failed' if isinstance(error, ValueError) else 'error'))
+        return distractors.multiple_choice_questions(words, user)
 
-        if response.status_code != 200:
-            raise Exception("Failed to generate questions")
-        
-        questions_list = response.data.get('questions', [])
+    def _m_choice_data(self, questions_list):
         questions = {}
         correct_answers = {}
 
+        random.shuffle(questions_list)
         for i, item in enumerate(questions_list):
             questions[str(i)] = {
                 "question": item["question"],
@@ -252,173 +310,113 @@ class ExerciseViewSet(ModelViewSet):
             }
             correct_answers[str(i)] = item["correct"]
         return questions, correct_answers
-    # Replace the _generate_fill_in_gap_data method in ExerciseViewSet in LTalk/api/views.py:
-
     def _generate_fill_in_gap_data(self, words):
         """Generates fill-in-the-gap questions and answers with rate limiting"""
         questions = {}
         correct_answers = {}
-        
-        from main.models import SentenceTemplate
-        import time
-        import random
-        from datetime import datetime, timedelta
-        
-        # Rate limiting management
-        MAX_CALLS_PER_MINUTE = 15
-        SAFE_LIMIT = 12  # Stay a bit under the limit for safety
-        
-        # Keep track of API calls with timestamps
-        if not hasattr(self.__class__, '_api_call_timestamps'):
-            self.__class__._api_call_timestamps = []
-        
-        # Clean up old timestamps (older than 1 minute)
-        now = datetime.now()
-        one_minute_ago = now - timedelta(minutes=1)
-        self.__class__._api_call_timestamps = [
-            ts for ts in self.__class__._api_call_timestamps 
-            if ts > one_minute_ago
-        ]
-        
-        # Count recent API calls (within the last minute)
-        recent_calls = len(self.__class__._api_call_timestamps)
-        
+
         for i, word in enumerate(words):
-            # Check if we're approaching the rate limit
-            approaching_limit = recent_calls >= SAFE_LIMIT
-            
-            if approaching_limit:
-                # We're close to the rate limit, use a stored template if available
-                templates = SentenceTemplate.objects.filter(word=word)
-                
-                if templates.exists():
-                    # Use a stored template
-                    template = random.choice(list(templates))
-                    
-                    questions[str(i)] = {
-                        "sentence": template.sentence,
-                        "word": word.word,
-                        "infinitive": word.infinitive,
-                        "translation": word.translation
-                    }
-                    correct_answers[str(i)] = template.correct_form
-                    
-                    print(f"Using stored template for '{word.word}' (rate limit approaching)")
-                    continue
-                
-                # If no template is available and we're at the limit, wait
-                if recent_calls >= MAX_CALLS_PER_MINUTE:
-                    # Calculate how long to wait
-                    oldest_call = min(self.__class__._api_call_timestamps)
-                    wait_time = 60 - (now - oldest_call).total_seconds()
-                    if wait_time > 0:
-                        print(f"Rate limit reached, waiting {wait_time:.2f} seconds")
-                        time.sleep(wait_time + 1)  # Add 1 second buffer
-                    
-                    # Reset recent calls counter
-                    self.__class__._api_call_timestamps = []
-                    recent_calls = 0
-            
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            
-            prompt = f"""
-            Create a beginner-friendly, complete Lithuanian sentence using the word '{word.word}' (which means '{word.translation}' in English).
-            - The sentence must be clear and understandable, with enough context for a language learner.
-            - Use the word in a grammatically correct, but not basic, form (e.g., different case for nouns, different tense/person for verbs).
-            - Replace the word with a gap indicated by '___'.
-            - Do NOT return an empty or placeholder sentence.
-            - Do NOT return only the word or a fragment.
-            - Example output:
-            {{
-                "sentence": "Man patinka keliauti su ___ per upę.",
-                "correct_form": "keltu"
-            }}
-            Format your response as a JSON object with the fields 'sentence' and 'correct_form'. Do not add any explanation.
-            """
-            
-            try:
-                response = model.generate_content(prompt)
-                response_text = response.text.strip()
-                
-                # Record this API call for rate limiting
-                self.__class__._api_call_timestamps.append(datetime.now())
-                recent_calls += 1
-                
-                # Extract the JSON from the response
-                import re
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    data = json.loads(json_match.group(0))
-                    sentence = data.get("sentence", "")
-                    correct_form = data.get("correct_form", word.word)
-                    
-                    # Store or update the template for future fallback
-                    if sentence and sentence != f"___ (using: {word.word}).":
-                        SentenceTemplate.objects.update_or_create(
-                            word=word,
-                            defaults={
-                                'sentence': sentence,
-                                'correct_form': correct_form
-                            }
-                        )
-                    
-                    questions[str(i)] = {
-                        "sentence": sentence,
-                        "word": word.word,
-                        "infinitive": word.infinitive,
-                        "translation": word.translation
-                    }
-                    correct_answers[str(i)] = correct_form
-                else:
-                    # JSON extraction failed, check for fallback from database
-                    template = SentenceTemplate.objects.filter(word=word).first()
-                    
-                    if template:
-                        # Use stored template as fallback
-                        questions[str(i)] = {
-                            "sentence": template.sentence,
-                            "word": word.word,
-                            "infinitive": word.infinitive,
-                            "translation": word.translation
-                        }
-                        correct_answers[str(i)] = template.correct_form
-                        print(f"Using stored template for '{word.word}' (parsing failed)")
-                    else:
-                        # No stored template, use basic fallback
-                        questions[str(i)] = {
-                            "sentence": f"___ (using: {word.word}).",
-                            "word": word.word,
-                            "infinitive": word.infinitive,
-                            "translation": word.translation
-                        }
-                        correct_answers[str(i)] = word.word
-            except Exception as e:
-                print(f"Error generating fill-in-gap question for '{word.word}': {e}")
-                
-                # Error occurred, check for fallback from database
-                template = SentenceTemplate.objects.filter(word=word).first()
-                
-                if template:
-                    # Use stored template as fallback
-                    questions[str(i)] = {
-                        "sentence": template.sentence, 
-                        "word": word.word,
-                        "infinitive": word.infinitive,
-                        "translation": word.translation
-                    }
-                    correct_answers[str(i)] = template.correct_form
-                    print(f"Using stored template for '{word.word}' (API error)")
+            if llm.budget.exhausted():
+                # Close to the rate limit: use a stored template, or a basic gap without waiting
+                if self._template_question(word, i, questions, correct_answers):
+                    llm.record_fallback('fill_in_gap', 'template', reason='rate_limit')
                 else:
-                    # No stored template, use basic fallback
-                    questions[str(i)] = {
-                        "sentence": f"___ (using: {word.word}).",
-                        "word": word.word,
-                        "infinitive": word.infinitive,
-                        "translation": word.translation
+                    self._basic_question(word, i, questions, correct_answers)
+                    llm.record_fallback('fill_in_gap', 'basic', reason='rate_limit')
+                continue
+
+            with llm.call('fill_in_gap') as call:
+                self._generate_fill_in_gap_question(call, word, i, questions, correct_answers)
+
+        return questions, correct_answers
+
+    def _generate_fill_in_gap_question(self, call, word, i, questions, correct_answers):
+        """Fills question i for one word, falling back to a stored template or a basic gap."""
+        try:
+            response = call.generate(prompts.fill_in_gap(word),
+                                     generation_config=prompts.json_config(prompts.FILL_IN_GAP_SCHEMA))
+        except Exception as e:
+            self._fill_in_gap_failed(call, e, word, i, questions, correct_answers)
+        else:
+            self._fill_in_gap_question_from(call, response, word, i, questions, correct_answers)
+
+    def _fill_in_gap_question_from(self, call, response, word, i, questions, correct_answers):
+        """Fills question i from the model's response to the fill-in-gap prompt."""
+        from main.models import SentenceTemplate
+
+        try:
+            data = prompts.parse(call, response.text, dict)
+        except ValueError:
+            if self._template_question(word, i, questions, correct_answers):
+                call.used_fallback('template', reason='parse_failed')
+            else:
+                # No stored template, use basic fallback
+                self._basic_question(word, i, questions, correct_answers)
+                call.used_fallback('basic', reason='parse_failed')
+            return
+
+        try:
+            sentence = data.get("sentence", "")
+            correct_form = data.get("correct_form", word.word)
+
+            # Store or update the template for future fallback
+            if sentence and sentence != f"___ (using: {word.word}).":
+                SentenceTemplate.objects.update_or_create(
+                    word=word,
+                    defaults={
+                        'sentence': sentence,
+                        'correct_form': correct_form
                     }
-                    correct_answers[str(i)] = word.word
+                )
+
+            questions[str(i)] = {
+                "sentence": sentence,
+                "word": word.word,
+                "infinitive": word.infinitive,
+                "translation": word.translation
+            }
+            correct_answers[str(i)] = correct_form
+        except Exception as e:
+            self._fill_in_gap_failed(call, e, word, i, questions, correct_answers)
+
+    def _fill_in_gap_failed(self, call, error, word, i, questions, correct_answers):
+        logger.warning("Error generating fill-in-gap question for '%s': %s", word.word, error)
+        if not call.error:
+            call.parse_failed()
         
-        return questions, correct_answers
+        # Error occurred, check for fallback from database
+        if self._template_question(word, i, questions, correct_answers):
+            call.used_fallback('template', reason=llm.fallback_reason(error))
+        else:
+            # No stored template, use basic fallback
+            self._basic_question(word, i, questions, correct_answers)
+            call.used_fallback('basic', reason=llm.fallback_reason(error))
+
+    def _template_question(self, word, i, questions, correct_answers):
+        """Fills question i from a stored ``SentenceTemplate``; False if the word has none."""
+        from main.models import SentenceTemplate
+
+        templates = list(SentenceTemplate.objects.filter(word=word))
+        if not templates:
+            return False
+        template = random.choice(templates)
+        questions[str(i)] = {
+            "sentence": template.sentence,
+            "word": word.word,
+            "infinitive": word.infinitive,
+            "translation": word.translation
+        }
+        correct_answers[str(i)] = template.correct_form
+        return True
+
+    def _basic_question(self, word, i, questions, correct_answers):
+        questions[str(i)] = {
+            "sentence": f"___ (using: {word.word}).",
+            "word": word.word,
+            "infinitive": word.infinitive,
+            "translation": word.translation
+        }
+        correct_answers[str(i)] = word.word
 
 
     @transaction.atomic # Ensure atomicity
@@ -427,90 +425,115 @@ class ExerciseViewSet(ModelViewSet):
         exercise_type = serializer.validated_data['type']
         user = self.request.user
         
-        # For fill_in_gap exercises, we'll always generate fresh content
-        # and avoid permanent database storage if possible
+        # Generated exercises are sessions: they expire unless answers are submitted
         if exercise_type == 'fill_in_gap':
-            # Check if there's a timestamp in the request, which indicates
-            # the user wants a fresh exercise
-            has_timestamp = 'timestamp' in self.request.data
-            
-            # Get unlearned words for the current user
-            unlearned_words = self._get_unlearned_words(wordset, user)
-            
-            # If no unlearned words found, use all words in the set
-            if not unlearned_words.exists() and wordset.words.exists():
-                unlearned_words = wordset.words.all()
-            
-            # Limit number of words to avoid rate limit issues
-            MAX_WORDS_PER_REQUEST = 12  # Adjust based on your needs - well under the 15/min limit
-            limited_words = list(unlearned_words)[:MAX_WORDS_PER_REQUEST]
+            limited_words = self._fill_in_gap_words(wordset, user)
             
             # If we still have no words, create a basic empty structure
             if not limited_words:
-                questions = {"0": {"sentence": "No words available in this set."}}
-                correct_answers = {"0": ""}
+                questions, correct_answers = self._empty_fill_in_gap()
             else:
                 # Generate fresh questions and answers
                 questions, correct_answers = self._generate_fill_in_gap_data(limited_words)
             
-            # Save as a temporary exercise (timestamp is already removed by serializer.create)
-            instance = serializer.save(
-                questions=questions,
-                correct_answers=correct_answers
-            )
-        
-            
-            # If this is a timestamped request, we'll clean up old fill_in_gap exercises
-            # to avoid database clutter (except for those with progress entries)
-            if has_timestamp:
-                # Find old fill_in_gap exercises without progress and delete them
-                old_exercises = Exercise.objects.filter(
-                    wordset__user=user,
-                    type='fill_in_gap',
-                    wordset=wordset
-                ).exclude(
-                    id=instance.id  # Don't delete the one we just created
-                ).exclude(
-                    progress_entries__isnull=False  # Don't delete exercises with progress
-                )
-                
-                # Delete exercises older than a day (to avoid race conditions with active sessions)
-                import datetime
-                one_day_ago = datetime.datetime.now() - datetime.timedelta(days=1)
-                old_exercises.filter(id__lt=instance.id - 100).delete()
-            
+            self._save_session(serializer, questions, correct_answers)
             return
             
-        # For other exercise types (flashcard, etc.)    
-        # Get only unlearned words for the current user
-        unlearned_words = self._get_unlearned_words(wordset, user)
-        
-        # If no unlearned words found, use all words in the set
-        if not unlearned_words.exists() and wordset.words.exists():
-            unlearned_words = wordset.words.all()
-        
         # Generate questions/answers based on exercise type
         if exercise_type == 'flashcard' and 'questions' not in serializer.validated_data:
-            questions, correct_answers = self._generate_flashcard_data(unlearned_words)
-            serializer.save(
-                questions=questions,
-                correct_answers=correct_answers
-            )
+            due_words = review_queue(user, wordset, settings.REVIEW_BATCH_SIZE)
+            questions, correct_answers = self._generate_flashcard_data(due_words)
+            self._save_session(serializer, questions, correct_answers)
             return
 
         if exercise_type == 'multiple_choice' and not serializer.validated_data.get('questions'):
-            words = wordset.words.all()
-            questions, correct_answers = self._generate_m_choice_data(words)
-
-            serializer.save(
-                questions=questions,
-                correct_answers=correct_answers
-            )
+            words = sample_unlearned(user, wordset, settings.REVIEW_BATCH_SIZE)
+            questions, correct_answers = self._generate_m_choice_data(words, user)
+            self._save_session(serializer, questions, correct_answers)
         else:
             serializer.save()
 
+    def _fill_in_gap_words(self, wordset, user):
+        # Limit number of words to avoid rate limit issues
+        MAX_WORDS_PER_REQUEST = 12  # Adjust based on your needs - well under the 15/min limit
+        return review_queue(user, wordset, MAX_WORDS_PER_REQUEST)
+
+    def _empty_fill_in_gap(self):
+        return {"0": {"sentence": "No words available in this set."}}, {"0": ""}
+
+    def _save_session(self, serializer, questions, correct_answers):
+        return serializer.save(questions=questions, correct_answers=correct_answers,
+                               expires_at=Exercise.session_expiry())
+
+
+
+class HistoryPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ExerciseHistoryAPIView(ListAPIView):
+    """The user's attempts on a wordset, newest first, with a per-type summary."""
+    serializer_class = ExerciseHistorySerializer
+    pagination_class = HistoryPagination
+
+    def _attempts(self):
+        return ExerciseProgress.objects.filter(user=self.request.user, exercise__wordset_id=self.kwargs['wordset_id'])
+
+    def get_queryset(self):
+        queryset = self._attempts()
+        exercise_type = self.request.query_params.get('type')
+        if exercise_type:
+            queryset = queryset.filter(exercise__type=exercise_type)
+        # The type comes from a join; the exercise's JSON blobs are never loaded
+        return queryset.annotate(exercise_type=F('exercise__type')).defer('user_answer').order_by('-answered_at', '-id')
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='type', description="Only attempts of this exercise type", required=False, type=str),
+        ],
+        responses=ExerciseHistorySerializer(many=True),
+    )
+    def get(self, request, *args, **kwargs):
+        response = self.list(request, *args, **kwargs)
+        response.data['summary'] = ExerciseHistorySummarySerializer(self._attempts().summary_by_type(), many=True).data
+        return response
+
+
+class DailyProgressAPIView(APIView):
+    """Progress over time, read only from the ``DailyProgress`` rollups (one row per day)."""
+    MAX_DAYS = 365
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='days', description="Number of days up to today (default 30, max 365)",
+                             required=False, type=int),
+            OpenApiParameter(name='wordset', description="Only this wordset; default is all of the user's",
+                             required=False, type=int),
+        ],
+        responses=DailyProgressSerializer(many=True),
+    )
+    def get(self, request):
+        try:
+            days = min(max(int(request.query_params.get('days', 30)), 1), self.MAX_DAYS)
+            wordset_id = int(request.query_params['wordset']) if request.query_params.get('wordset') else None
+        except ValueError:
+            return Response({"error": "'days' and 'wordset' must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = timezone.localdate() - timedelta(days=days - 1)
+        rollups = DailyProgress.objects.filter(user=request.user, day__gte=since)
+        if wordset_id is not None:
+            rollups = rollups.filter(wordset_id=wordset_id)
+        rows = (
+            rollups.values('day')
+            .annotate(attempts=Sum('attempts'), correct_attempts=Sum('correct_attempts'),
+                      answers_correct=Sum('answers_correct'), answers_total=Sum('answers_total'))
+            .order_by('day')
+        )
+        data = [{**row, 'accuracy': percent(row['answers_correct'], row['answers_total'])} for row in rows]
+        return Response({"since": since, "days": DailyProgressSerializer(data, many=True).data})
 
-    
 
 class SubmitExerciseAPIView(APIView):
     http_method_names = ['post', 'get']
@@ -559,148 +582,93 @@ class SubmitExerciseAPIView(APIView):
             "expected_json": expected_json
         })
 
-    def check_answer(self, user_answer, correct_answer, exercise_type):
-        """Check if the user's answer matches the correct answer for the given exercise type"""
-        
-        if exercise_type == 'multiple_choice':
-            if isinstance(correct_answer, list):
-                return user_answer in correct_answer 
-            else:
-                return user_answer == correct_answer 
-        
-        elif exercise_type == 'flashcard':
-            return user_answer == correct_answer
-            
-        elif exercise_type == 'fill_in_gap':
-            # For fill-in-the-gap, we allow some flexibility in checking
-            if not user_answer or not correct_answer:
-                return False
-            # Simple case-insensitive comparison for basic checking
-            return user_answer.lower().strip() == correct_answer.lower().strip()
-        
-        return False
-        
     def _generate_feedback(self, question_data, user_answer, correct_answer):
         """Generate feedback for incorrect answers using Gemini"""
-        try:
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            sentence = question_data.get('sentence', '')
-            word = question_data.get('word', '')
-            infinitive = question_data.get('infinitive', '')
-            translation = question_data.get('translation', '')
-            
-            prompt = f"""
-            In a Lithuanian language learning exercise, the user was given this fill-in-the-gap sentence:
-            '{sentence}'
-            
-            The word they needed to use is '{infinitive}' (base form of the word).
-            The correct form to fill the gap is '{correct_answer}'.
-            User answered: '{user_answer}'
-
-            Please provide a helpful explanation (2-3 sentences) about:
-            1. Why their answer is incorrect 
-            2. What grammatical rules apply here
-            3. How to correctly form this word from the infinitive
+        with llm.call('feedback') as call:
+            return self._request_feedback(call, question_data, user_answer, correct_answer)
 
-            Focus on Lithuanian grammar and word form. Be clear and educational.
-            """
-            
-            response = model.generate_content(prompt)
+    def _request_feedback(self, call, question_data, user_answer, correct_answer):
+        try:
+            response = call.generate(prompts.feedback(question_data, user_answer, correct_answer))
             return response.text.strip()
         except Exception as e:
-            print(f"Error generating feedback: {e}")
-            return f"The correct answer is '{correct_answer}'."
+            return self._feedback_failed(call, e, correct_answer)
+
+    def _feedback_failed(self, call, error, correct_answer):
+        logger.warning("Error generating feedback: %s", error)
+        call.used_fallback('basic', reason=llm.fallback_reason(error))
+        return f"The correct answer is '{correct_answer}'."
+
+    def _answers_needing_feedback(self, exercise, user_answers):
+        """``(key, question_data, user_answer, correct_answer)`` for each answer the model should explain."""
+        return [
+            (key, exercise.questions[key], user_answers[key], exercise.correct_answers[key])
+            for key, grade in submissions.grades(exercise, user_answers).items()
+            if grade.needs_explanation
+        ]
 
     def post(self, request, exercise_id):
-        exercise = get_object_or_404(Exercise, id=exercise_id)
-        user = request.user
+        # An expired session may already be purged; submitting must not revive it
+        exercise = get_object_or_404(Exercise.objects.live(), id=exercise_id)
 
         user_answers = request.data.get('user_answers')  
         if not user_answers:
             return Response({"error": "'user_answers' is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        is_correct = True  
-        correct = 0
-        incorrect = 0
-        feedback = {}
-        
-        related_words = exercise.wordset.words.all()
-        
-        # Determine if this is a partial submission (single answer) or a complete submission
-        is_partial = len(user_answers) < len(exercise.questions)
-
-        # Process only the submitted answers
-        for key, user_answer in user_answers.items():
-            if key not in exercise.questions:
-                continue
-                
-            question_data = exercise.questions[key]
-            correct_answer = exercise.correct_answers[key]
-            question_is_correct = self.check_answer(user_answer, correct_answer, exercise.type)
+        # Model feedback only for wrong forms; near misses get local feedback in submissions.record
+        feedback = {
+            key: self._generate_feedback(question_data, user_answer, correct_answer)
+            for key, question_data, user_answer, correct_answer in self._answers_needing_feedback(exercise, user_answers)
+        }
+        return Response(self._record_submission(request.user, exercise, user_answers, feedback), status=status.HTTP_200_OK)
+
+    def _record_submission(self, user, exercise, user_answers, feedback):
+        """Update word progress (and exercise progress for complete submissions); returns the response data."""
+        result, = submissions.record(user, [submissions.Submission(exercise, user_answers, feedback)])
+        return result
+
+
+class SubmitBatchAPIView(APIView):
+    """
+    Answers to many exercises in one request, e.g. a queue flushed after
+    offline use. Everything is recorded in one transaction with a bounded
+    number of queries; feedback is local only, so no Gemini calls are made.
+    Submissions to exercises that are unknown, expired or another user's are
+    rejected one by one while the rest are recorded.
+    """
+    http_method_names = ['post']
 
-            if question_is_correct:
-                correct += 1
-            else:
-                incorrect += 1
-                is_correct = False
-                # Generate feedback for fill_in_gap exercises
-                if exercise.type == 'fill_in_gap':
-                    feedback[key] = self._generate_feedback(question_data, user_answer, correct_answer)
-
-            # Find the word by matching either word or translation
-            if exercise.type == 'fill_in_gap':
-                word = related_words.filter(word__iexact=question_data.get('word', '')).first()
+    @extend_schema(
+        request=SubmitBatchSerializer,
+        responses={
+            200: OpenApiResponse(description="One result per submission, in order: 'recorded' ones are shaped "
+                                             "like the submit endpoint's, 'rejected' ones carry an error"),
+            400: OpenApiResponse(description="Bad Request, if the body is invalid"),
+        },
+        description="Submit answers for several exercises at once"
+    )
+    def post(self, request):
+        serializer = SubmitBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        items = serializer.validated_data['submissions']
+
+        # Other users' exercises are reported as unknown
+        exercises = (Exercise.objects.live().filter(wordset__user=request.user)
+                     .in_bulk({item['exercise'] for item in items}))
+        accepted = [item for item in items if item['exercise'] in exercises]
+        recorded = iter(submissions.record(request.user, [
+            submissions.Submission(exercises[item['exercise']], item['user_answers']) for item in accepted
+        ]))
+
+        results = []
+        for item in items:
+            if item['exercise'] in exercises:
+                results.append({"exercise": item['exercise'], "status": "recorded", **next(recorded)})
             else:
-                word = related_words.filter(translation__iexact=correct_answer).first()
-                
-            if word:
-                wp, _ = WordProgress.objects.get_or_create(user=user, word=word)
-                wp.update_progress(question_is_correct)
-
-        # Only create ExerciseProgress for complete submissions
-        if not is_partial:
-            progress = ExerciseProgress.objects.create(
-                user=user,
-                exercise=exercise,
-                user_answer=user_answers,
-                is_correct=is_correct,
-                grade=f"{correct}/{correct + incorrect}" if (correct + incorrect) > 0 else "0/0"
-            )
-            response_data = {
-                "exercise_progress": [ExerciseProgressSerializer(progress).data],
-                "is_correct": is_correct,
-                "feedback": feedback
-            }
-        else:
-            # For partial submissions, just return feedback
-            response_data = {
-                "feedback": feedback
-            }
-            
-        return Response(response_data, status=status.HTTP_200_OK)
-
-
-
-
-
-prompt_text = (
-    "Look at the image, extract only Lithuanian words and give me their English translation. "
-    "For each word, return: "
-    "- the original word exactly as it appears, "
-    "- its English translation, "
-    "- and its basic form (lemma), without changing the part of speech. "
-    "IMPORTANT: The field name 'infinitive' is just a label and DOES NOT mean the word must be a verb. "
-    "For nouns, return the nominative singular form in the 'infinitive' field. "
-    "For verbs, return the actual infinitive form. "
-    "For adjectives, use the masculine nominative singular form, and for other parts of speech, use the dictionary base form. "
-    "Do NOT convert nouns into verbs. For example, do NOT convert 'stalas' (a noun) into 'stalauti' (a verb). "
-    "Preserve the original part of speech. "
-    "Format the output as a JSON array of objects with the following fields: "
-    "'word' (original form), 'translation' (English meaning), and 'infinitive' (basic form). "
-    "Example: [{\"word\": \"stalo\", \"translation\": \"table\", \"infinitive\": \"stalas\"}, "
-    "{\"word\": \"eina\", \"translation\": \"goes\", \"infinitive\": \"eiti\"}]"
-)
-
+                results.append({"exercise": item['exercise'], "status": "rejected",
+                                "error": "Unknown or expired exercise."})
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 class ProcessPhotoAPIView(APIView):
@@ -739,46 +707,50 @@ class ProcessPhotoAPIView(APIView):
         if 'image' not in request.FILES:
             return Response({"error": "No image file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
 
+        import PIL.Image
+
         file = request.FILES['image']
         try:
             img = PIL.Image.open(file)
         except Exception as e:
             return Response({"error": f"Error loading image: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
+        with llm.call('photo_extraction') as call:
+            return self._extract_words(call, img)
+
+    def _extract_words(self, call, img):
         try:
-            response = model.generate_content([prompt_text, img])
-            response_text = response.text.strip()
-
-            if response_text.startswith('```'):
-                response_text = re.sub(r'^```(?:json)?\s*', '', response_text.strip(), flags=re.IGNORECASE)
-                response_text = re.sub(r'\s*```$', '', response_text.strip())
-                
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(0)
-            else:
-                return Response({
-                    "error": "Invalid response format",
-                    "raw_response": response_text
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            words_data = json.loads(response_text)
-            if not isinstance(words_data, list):
-                raise ValueError("Response is not a list")
-
-            return Response({"words": words_data}, status=status.HTTP_200_OK)
-
-        except json.JSONDecodeError as e:
-            return Response({
-                "error": "JSON parsing error",
+            response = call.generate(prompts.photo_words(img),
+                                     generation_config=prompts.json_config(prompts.PHOTO_WORDS_SCHEMA))
+        except Exception as e:
+            return Response(*self._processing_error(e))
+        return Response(*self._parse_words(call, response))
+
+    def _processing_error(self, e):
+        if isinstance(e, llm.LLMUnavailable):
+            # Nothing to fall back to; the client may try again later
+            return {
+                "error": "Service unavailable",
+                "message": str(e)
+            }, status.HTTP_503_SERVICE_UNAVAILABLE
+        return {
+            "error": "Processing error",
+            "message": str(e)
+        }, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    def _parse_words(self, call, response):
+        """``(data, status)`` for the model's reply to the photo prompt."""
+        try:
+            words_data = prompts.parse(call, response.text, list)
+        except ValueError as e:
+            return {
+                "error": "Invalid response format",
                 "message": str(e),
                 "raw_response": response.text
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
+            }, status.HTTP_500_INTERNAL_SERVER_ERROR
         except Exception as e:
-            return Response({
-                "error": "Processing error",
-                "message": str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return self._processing_error(e)
+        return {"words": words_data}, status.HTTP_200_OK
 
 
 class TextExerciseAPIView(APIView):
@@ -792,6 +764,12 @@ class TextExerciseAPIView(APIView):
                 required=True,
                 type=int
             ),
+            OpenApiParameter(
+                name='stream',
+                description='Stream newline-delimited JSON events (text deltas, then questions) instead of one response',
+                required=False,
+                type=bool
+            ),
         ],
         responses={
             200: OpenApiResponse(
@@ -820,17 +798,20 @@ class TextExerciseAPIView(APIView):
         
         try:
             wordset = WordSet.objects.get(id=wordset_id)
-            if not wordset.words.exists():
+            words = text_pool.wordset_words(wordset.id)
+            if not words:
                 return Response({"error": "Wordset has no words"}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Get all words from the wordset
-            words = list(wordset.words.all().values('word', 'translation', 'infinitive'))
-            
-            # Create the prompt for Gemini API
-            prompt = self._create_text_prompt(words)
-            
-            # Generate text and questions using Gemini API
-            generated_content = self._generate_text_and_questions(prompt)
+            if request.query_params.get('stream'):
+                # Newline-delimited JSON events so the text can be shown while it is generated
+                response = StreamingHttpResponse(text_pool.stream_variant(wordset, words, request.user),
+                                                 content_type='application/x-ndjson')
+                response['Cache-Control'] = 'no-cache'
+                response['X-Accel-Buffering'] = 'no'
+                return response
+
+            # Served from the pool of generated variants; Gemini is only called when it is empty
+            generated_content = text_pool.get_variant(wordset, words, request.user)
             
             return Response(generated_content, status=status.HTTP_200_OK)
             
@@ -838,74 +819,3 @@ class TextExerciseAPIView(APIView):
             return Response({"error": "Wordset not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    def _create_text_prompt(self, words):
-        word_list = [f"{word['word']} ({word['translation']})" for word in words]
-        word_list_formatted = ", ".join(word_list)
-        
-        prompt = f"""
-        You are a Lithuanian language teacher helping beginners learn Lithuanian.
-        
-        Using the vocabulary list below, create:
-        1. A coherent text in Lithuanian using as many words from the list as possible
-        2. 5 multiple choice questions in simple Lituanian about the text to check comprehension
-        
-        Vocabulary list: {word_list_formatted}
-        
-        The text should:
-        - Use beginner-friendly grammar and sentence structure
-        - Include at least 50% of the words from the vocabulary list
-        - Be contextual and meaningful (not just random sentences)
-        
-        The questions should:
-        - Be in Lithuanian to test understanding
-        - Each have 4 answer options (A, B, C, D)
-        - Have varying difficulty levels
-        
-        Format your response as JSON with the following structure:
-        {{
-            "text": "Lithuanian text here...",
-            "questions": [
-                {{
-                    "question": "Question 1",
-                    "choices": ["Option A", "Option B", "Option C", "Option D"],
-                    "correct_answer": "Option B"
-                }},
-                ...more questions...
-            ]
-        }}
-        """
-        return prompt
-    
-    def _generate_text_and_questions(self, prompt):
-        try:
-            response = model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Extract JSON content
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(0)
-            
-            content = json.loads(response_text)
-            
-            # Validate the expected structure
-            if 'text' not in content or 'questions' not in content:
-                raise ValueError("Response missing required fields")
-                
-            if not isinstance(content['questions'], list) or len(content['questions']) == 0:
-                raise ValueError("Questions must be a non-empty list")
-                
-            for q in content['questions']:
-                if not all(k in q for k in ('question', 'choices', 'correct_answer')):
-                    raise ValueError("Question missing required fields")
-                
-            return content
-            
-        except Exception as e:
-            print(f"Error generating content: {e}")
-            raise ValueError(f"Failed to generate content: {str(e)}")
-
-
-
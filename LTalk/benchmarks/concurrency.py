@@ -0,0 +1,146 @@
+"""
+Compare how many LLM-bound requests the sync and async views keep in flight.
+
+Both modes send ``--requests`` photo uploads to ``/api/process-photo/`` with a
+fake Gemini model that takes ``--latency`` seconds per call, in-process and
+against a throwaway test database:
+
+- sync: the DRF view driven by ``--workers`` threads, like a gunicorn worker
+  with that many threads (each one blocked for the whole model call);
+- async: the async view driven by a single event loop, like one uvicorn worker.
+
+    python benchmarks/concurrency.py --requests 200 --workers 8 --latency 0.5
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+REPLY = '[{"word": "namas", "translation": "house", "infinitive": "namas"}]'
+
+
+class FixedLatencyModel:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency)
+        return SimpleNamespace(text=REPLY, usage_metadata=None)
+
+    async def generate_content_async(self, contents, **kwargs):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text=REPLY, usage_metadata=None)
+
+
+def png():
+    import PIL.Image
+
+    buf = io.BytesIO()
+    PIL.Image.new('RGB', (8, 8)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def upload(image):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    return {'image': SimpleUploadedFile('page.png', image, content_type='image/png')}
+
+
+def run_sync(user, image, requests, workers):
+    from django.test import Client
+
+    def one(_):
+        client = Client()
+        client.force_login(user)
+        started = time.perf_counter()
+        response = client.post('/api/process-photo/', upload(image))
+        assert response.status_code == 200, response.content
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(one, range(requests)))
+
+
+def run_async(user, image, requests):
+    from django.test import AsyncClient
+
+    async def one():
+        client = AsyncClient()
+        await client.aforce_login(user)
+        started = time.perf_counter()
+        response = await client.post('/api/process-photo/', upload(image))
+        assert response.status_code == 200, response.content
+        return time.perf_counter() - started
+
+    async def all_requests():
+        return await asyncio.gather(*(one() for _ in range(requests)))
+
+    return asyncio.run(all_requests())
+
+
+def report(label, wall, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(f"{label:>6}: {wall:7.2f} s wall  {len(latencies) / wall:8.1f} req/s   "
+          f"p50 {statistics.median(latencies) * 1000:7.0f} ms   p95 {p95 * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=4, help="Threads serving the sync views")
+    parser.add_argument('--latency', type=float, default=0.5, help="Seconds per fake model call")
+    parser.add_argument('--settings', default=os.getenv('DJANGO_SETTINGS_MODULE', 'LTalk.settings'))
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    import django
+
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment
+    from django.urls import include, path
+
+    from api import llm, urls as api_urls
+
+    class SyncURLConf:
+        urlpatterns = [path('api/', include(api_urls.sync_llm_urlpatterns))]
+
+    class AsyncURLConf:
+        urlpatterns = [path('api/', include(api_urls.async_llm_urlpatterns))]
+
+    setup_test_environment()
+    db_name = connection.creation.create_test_db(verbosity=0)
+    llm.logger.disabled = True
+    try:
+        user = get_user_model().objects.create_user(username='bench', password='bench', email='bench@example.com')
+        image = png()
+        print(f"requests: {args.requests}  model latency: {args.latency:.2f} s  sync workers: {args.workers}")
+        # Cookie sessions keep the benchmark off the session table
+        with mock.patch.object(llm, '_model', FixedLatencyModel(args.latency)), \
+                override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            with override_settings(ROOT_URLCONF=SyncURLConf):
+                started = time.perf_counter()
+                latencies = run_sync(user, image, args.requests, args.workers)
+                report('sync', time.perf_counter() - started, latencies)
+            with override_settings(ROOT_URLCONF=AsyncURLConf):
+                started = time.perf_counter()
+                latencies = run_async(user, image, args.requests)
+                report('async', time.perf_counter() - started, latencies)
+    finally:
+        connection.creation.destroy_test_db(db_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
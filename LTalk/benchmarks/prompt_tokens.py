@@ -0,0 +1,214 @@
+"""
+Compare the size of each model prompt before and after the move to JSON
+output mode with response schemas and compact, prefix-first prompts.
+
+"Before" are the prompts the views sent until then, kept here verbatim.
+"After" are the ones built by ``api.prompts`` for the same sample data. Sizes
+are characters and estimated tokens (about 4 characters each); the schema is
+listed separately since the provider counts it as input too. "Static" is the
+share of the prompt that is identical on every call and can be served from a
+prefix cache. With ``--count-with-model`` the tokens are counted by Gemini
+instead, which needs ``GOOGLE_API_KEY``.
+
+    python benchmarks/prompt_tokens.py --words 20
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+SAMPLE = [("eiti", "to go"), ("bėgti", "to run"), ("miegoti", "to sleep"), ("valgyti", "to eat"),
+          ("namas", "house"), ("pelė", "mouse"), ("medis", "tree"), ("katė", "cat"), ("gražus", "beautiful"),
+          ("knyga", "book"), ("vanduo", "water"), ("mokykla", "school"), ("draugas", "friend"), ("upė", "river")]
+
+QUESTION = {'sentence': "Vakar mes ___ į parką.", 'infinitive': "eiti"}
+
+
+def sample_words(count):
+    return [SimpleNamespace(word=w, translation=t, infinitive=w)
+            for w, t in (SAMPLE * (count // len(SAMPLE) + 1))[:count]]
+
+
+# Prompts as they were before api.prompts
+
+def before_multiple_choice(words):
+    prompt_text = (
+        "Use the given list of Lithuanian words with their English translations to generate multiple choice questions. "
+        "Each question should use the Lithuanian word as the question and provide four English answer options: "
+        "one correct translation and three plausible but incorrect distractors. "
+        "Format the response as a JSON array of objects with the following fields: "
+        "'question' (Lithuanian word), 'choices' (list of 4 English answers), and 'correct' (correct English translation). "
+        "Example format: ['1':{\"question\": \"eiti\", \"choices\": [\"to walk\", \"to sleep\", \"to eat\", \"to read\"], \"correct\": \"to walk\"}]\n\n"
+        "Here is the list of words:\n"
+    )
+    word_list = [{"word": word.word, "translation": word.translation} for word in words]
+    return prompt_text + json.dumps(word_list, ensure_ascii=False, indent=2)
+
+
+def before_fill_in_gap(word):
+    return f"""
+            Create a beginner-friendly, complete Lithuanian sentence using the word '{word.word}' (which means '{word.translation}' in English).
+            - The sentence must be clear and understandable, with enough context for a language learner.
+            - Use the word in a grammatically correct, but not basic, form (e.g., different case for nouns, different tense/person for verbs).
+            - Replace the word with a gap indicated by '___'.
+            - Do NOT return an empty or placeholder sentence.
+            - Do NOT return only the word or a fragment.
+            - Example output:
+            {{
+                "sentence": "Man patinka keliauti su ___ per upę.",
+                "correct_form": "keltu"
+            }}
+            Format your response as a JSON object with the fields 'sentence' and 'correct_form'. Do not add any explanation.
+            """
+
+
+def before_feedback(question_data, user_answer, correct_answer):
+    sentence = question_data.get('sentence', '')
+    infinitive = question_data.get('infinitive', '')
+    return f"""
+            In a Lithuanian language learning exercise, the user was given this fill-in-the-gap sentence:
+            '{sentence}'
+
+            The word they needed to use is '{infinitive}' (base form of the word).
+            The correct form to fill the gap is '{correct_answer}'.
+            User answered: '{user_answer}'
+
+            Please provide a helpful explanation (2-3 sentences) about:
+            1. Why their answer is incorrect
+            2. What grammatical rules apply here
+            3. How to correctly form this word from the infinitive
+
+            Focus on Lithuanian grammar and word form. Be clear and educational.
+            """
+
+
+BEFORE_PHOTO_WORDS = (
+    "Look at the image, extract only Lithuanian words and give me their English translation. "
+    "For each word, return: "
+    "- the original word exactly as it appears, "
+    "- its English translation, "
+    "- and its basic form (lemma), without changing the part of speech. "
+    "IMPORTANT: The field name 'infinitive' is just a label and DOES NOT mean the word must be a verb. "
+    "For nouns, return the nominative singular form in the 'infinitive' field. "
+    "For verbs, return the actual infinitive form. "
+    "For adjectives, use the masculine nominative singular form, and for other parts of speech, use the dictionary base form. "
+    "Do NOT convert nouns into verbs. For example, do NOT convert 'stalas' (a noun) into 'stalauti' (a verb). "
+    "Preserve the original part of speech. "
+    "Format the output as a JSON array of objects with the following fields: "
+    "'word' (original form), 'translation' (English meaning), and 'infinitive' (basic form). "
+    "Example: [{\"word\": \"stalo\", \"translation\": \"table\", \"infinitive\": \"stalas\"}, "
+    "{\"word\": \"eina\", \"translation\": \"goes\", \"infinitive\": \"eiti\"}]"
+)
+
+BEFORE_STREAMED_FORMAT = """
+        Format your response as follows: first the Lithuanian text as plain text, without any heading
+        or formatting. Then a line containing only ###QUESTIONS###, followed by the questions as a
+        JSON list with the following structure:
+        [
+            {
+                "question": "Question 1",
+                "choices": ["Option A", "Option B", "Option C", "Option D"],
+                "correct_answer": "Option B"
+            },
+            ...more questions...
+        ]"""
+
+BEFORE_JSON_FORMAT = """
+        Format your response as JSON with the following structure:
+        {
+            "text": "Lithuanian text here...",
+            "questions": [
+                {
+                    "question": "Question 1",
+                    "choices": ["Option A", "Option B", "Option C", "Option D"],
+                    "correct_answer": "Option B"
+                },
+                ...more questions...
+            ]
+        }"""
+
+
+def before_text_exercise(words, streamed=False):
+    word_list_formatted = ", ".join(f"{word.word} ({word.translation})" for word in words)
+    return f"""
+        You are a Lithuanian language teacher helping beginners learn Lithuanian.
+
+        Using the vocabulary list below, create:
+        1. A coherent text in Lithuanian using as many words from the list as possible
+        2. 5 multiple choice questions in simple Lituanian about the text to check comprehension
+
+        Vocabulary list: {word_list_formatted}
+
+        The text should:
+        - Use beginner-friendly grammar and sentence structure
+        - Include at least 50% of the words from the vocabulary list
+        - Be contextual and meaningful (not just random sentences)
+
+        The questions should:
+        - Be in Lithuanian to test understanding
+        - Each have 4 answer options (A, B, C, D)
+        - Have varying difficulty levels
+        {BEFORE_STREAMED_FORMAT if streamed else BEFORE_JSON_FORMAT}
+        """
+
+
+def cases(words):
+    """``(prompt type, before, after parts, schema)`` for each prompt."""
+    from api import prompts
+
+    return [
+        ('multiple_choice', before_multiple_choice(words), prompts.multiple_choice(words),
+         prompts.MULTIPLE_CHOICE_SCHEMA),
+        ('fill_in_gap', before_fill_in_gap(words[0]), prompts.fill_in_gap(words[0]), prompts.FILL_IN_GAP_SCHEMA),
+        ('feedback', before_feedback(QUESTION, "eina", "ėjome"), prompts.feedback(QUESTION, "eina", "ėjome"), None),
+        ('photo_extraction', BEFORE_PHOTO_WORDS, [prompts.PHOTO_WORDS], prompts.PHOTO_WORDS_SCHEMA),
+        ('text_exercise', before_text_exercise(words), prompts.text_exercise(words), prompts.TEXT_EXERCISE_SCHEMA),
+        ('text_exercise (streamed)', before_text_exercise(words, streamed=True),
+         prompts.text_exercise(words, streamed=True), None),
+    ]
+
+
+def estimate(text):
+    return (len(text) + 3) // 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--words', type=int, default=20, help="words in the sample wordset")
+    parser.add_argument('--count-with-model', action='store_true', help="count tokens with Gemini")
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LTalk.settings')
+    import django
+
+    django.setup()
+
+    count = estimate
+    if args.count_with_model:
+        from api.llm import get_model
+
+        model = get_model()
+
+        def count(text):
+            return model.count_tokens(text).total_tokens
+
+    header = f"{'prompt':<26}{'before':>14}{'after':>14}{'schema':>8}{'static':>8}{'saved':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, before, parts, schema in cases(sample_words(args.words)):
+        after = "".join(parts)
+        before_tokens, after_tokens = count(before), count(after)
+        schema_tokens = count(json.dumps(schema)) if schema else 0
+        saved = 1 - (after_tokens + schema_tokens) / before_tokens
+        print(f"{name:<26}{len(before):>7} /{before_tokens:>5}{len(after):>7} /{after_tokens:>5}"
+              f"{schema_tokens:>8}{len(parts[0]) / len(after):>8.0%}{saved:>8.0%}")
+    print("\nbefore/after: characters / tokens" + ("" if args.count_with_model else " (estimated)"))
+
+
+if __name__ == '__main__':
+    main()
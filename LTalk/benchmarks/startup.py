@@ -0,0 +1,78 @@
+"""
+Measure process startup cost: ``django.setup()`` plus loading every URLconf
+(which imports all views), each in a fresh interpreter.
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --importtime   # list the slowest imports
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+PROBE = """
+import time
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t2 = time.perf_counter()
+import sys
+print(f"{t1 - t0:.6f} {t2 - t1:.6f} {int('google.generativeai' in sys.modules)} {int('PIL.Image' in sys.modules)}")
+"""
+
+
+def run_probe(env):
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=BASE_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    setup, urls, genai, pil = out.stdout.split()[-4:]
+    return float(setup), float(urls), genai == '1', pil == '1'
+
+
+def slowest_imports(env, limit):
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=BASE_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append((int(cumulative_us), name))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settings', default=os.getenv('DJANGO_SETTINGS_MODULE', 'LTalk.settings'))
+    parser.add_argument('--importtime', action='store_true', help="Show the slowest imports")
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=args.settings)
+    results = [run_probe(env) for _ in range(args.runs)]
+    setup = [r[0] * 1000 for r in results]
+    urls = [r[1] * 1000 for r in results]
+    total = [s + u for s, u in zip(setup, urls)]
+
+    print(f"runs: {args.runs}  settings: {args.settings}")
+    for label, values in (("django.setup()", setup), ("URL loading", urls), ("total", total)):
+        print(f"{label:>15}: median {statistics.median(values):7.1f} ms   min {min(values):7.1f} ms")
+    print(f"google.generativeai imported at startup: {results[0][2]}")
+    print(f"PIL.Image imported at startup: {results[0][3]}")
+
+    if args.importtime:
+        print("\nslowest imports (cumulative):")
+        for cumulative_us, name in slowest_imports(env, args.top):
+            print(f"{cumulative_us / 1000:9.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
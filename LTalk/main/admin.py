@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import WordSet, Word, WordProgress, Exercise
+from .models import AnswerEvent, WordSet, Word, WordProgress, Exercise
 
 
 @admin.register(WordSet)
@@ -18,7 +18,7 @@ class WordAdmin(admin.ModelAdmin):
 
 @admin.register(WordProgress)
 class WordProgressAdmin(admin.ModelAdmin):
-    list_display = ('user', 'word', 'correct_attempts', 'incorrect_attempts', 'is_learned')
+    list_display = ('user', 'word', 'correct_attempts', 'incorrect_attempts', 'is_learned', 'due_at')
     list_filter = ('is_learned',)
     search_fields = ('user__username', 'word__word')
 
@@ -28,3 +28,10 @@ class ExerciseAdmin(admin.ModelAdmin):
     list_display = ('wordset', 'type', )
     list_filter = ('type',)
     search_fields = ('wordset__title',)
+
+
+@admin.register(AnswerEvent)
+class AnswerEventAdmin(admin.ModelAdmin):
+    list_display = ('user', 'word', 'correct', 'grade', 'answered_at', 'applied')
+    list_filter = ('correct', 'applied')
+    search_fields = ('user__username', 'word__word')
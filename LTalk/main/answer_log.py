@@ -0,0 +1,160 @@
+"""
+The answer log: ``AnswerEvent`` rows, and the ``WordProgress`` derived from them.
+
+Every answered word is appended as an event and never updated. By default a
+submission also folds its events into ``WordProgress`` and its attempts into
+the ``DailyProgress`` rollups in the same transaction, locking the user's
+progress rows so the next page shows the answer. With ``ANSWER_LOG_DEFERRED``
+the submission only inserts rows (events, and attempts marked not
+``rolled_up``) and takes no locks on progress or rollups.
+``manage.py compact_answer_log`` then folds both in batches.
+
+Compaction reads pending events in id order from a ``LogCursor``. An event
+whose transaction commits after a later id was compacted would be skipped, so
+only events older than ``ANSWER_LOG_SETTLE_SECONDS`` are folded. Submissions
+must commit within that time. Attempts are flagged once rolled up, so they
+need no settle time.
+
+``replay()`` recomputes ``WordProgress`` from every event a user has, e.g.
+after a change to the learning rules, one user per transaction. Answers from
+before the log existed are not in it: rows that count more attempts than
+their logged events are skipped unless ``force`` is given, which rebuilds
+them from the log alone and drops the older answers. Rows of words with no
+events are left as they are.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache as hot_cache
+from .models import AnswerEvent, DailyProgress, ExerciseProgress, LogCursor, WordProgress
+
+
+COMPACTION_CURSOR = 'answer-log-compaction'
+
+PROGRESS_FIELDS = ['correct_attempts', 'incorrect_attempts', 'is_learned',
+                   'repetitions', 'interval_days', 'ease_factor', 'due_at']
+
+
+def progress_rows(pairs):
+    """``{(user_id, word_id): WordProgress}`` for ``pairs``, locked, creating the missing rows."""
+    if not pairs:
+        return {}
+    rows = WordProgress.objects.select_for_update().filter(
+        user_id__in={user_id for user_id, _ in pairs}, word_id__in={word_id for _, word_id in pairs})
+    progress = {(wp.user_id, wp.word_id): wp for wp in rows if (wp.user_id, wp.word_id) in pairs}
+    missing = pairs - progress.keys()
+    if missing:
+        # A concurrent submission may create some of them first
+        WordProgress.objects.bulk_create([WordProgress(user_id=u, word_id=w) for u, w in missing],
+                                         ignore_conflicts=True)
+        progress.update(((wp.user_id, wp.word_id), wp) for wp in rows.all()
+                        if (wp.user_id, wp.word_id) in missing)
+    return progress
+
+
+def fold(events):
+    """Apply ``events``, in order, to the progress rows they belong to; returns the ids of the users touched."""
+    if not events:
+        return set()
+    with transaction.atomic():
+        progress = progress_rows({(e.user_id, e.word_id) for e in events})
+        for event in events:
+            progress[event.user_id, event.word_id].apply_answer(event.correct, grade=event.grade,
+                                                                now=event.answered_at)
+        WordProgress.objects.bulk_update(progress.values(), PROGRESS_FIELDS)
+    return _touched(events)
+
+
+def _touched(events):
+    users = {e.user_id for e in events}
+    # bulk_update() sends no post_save signals
+    hot_cache.bump(*[hot_cache.progress_ns(user_id) for user_id in users])
+    return users
+
+
+def compact(batch_size=None, now=None):
+    """
+    Fold one batch of settled pending events into ``WordProgress`` and one
+    batch of pending attempts into ``DailyProgress``; returns how many events
+    and attempts were folded.
+    """
+    batch_size = batch_size or settings.ANSWER_LOG_BATCH_SIZE
+    settled = (now or timezone.now()) - timedelta(seconds=settings.ANSWER_LOG_SETTLE_SECONDS)
+    with transaction.atomic():
+        # Compaction and replay run one at a time
+        cursor, _ = LogCursor.objects.select_for_update().get_or_create(name=COMPACTION_CURSOR)
+        pending = AnswerEvent.objects.filter(pk__gt=cursor.position, applied=False).order_by('pk')[:batch_size]
+        events = []
+        for event in pending:
+            if event.answered_at > settled:
+                break
+            events.append(event)
+        if events:
+            fold(events)
+            cursor.position = events[-1].pk
+            cursor.save(update_fields=['position'])
+        attempts = _roll_up(batch_size)
+    return len(events) + attempts
+
+
+def _roll_up(batch_size):
+    attempts = list(
+        ExerciseProgress.objects.filter(rolled_up=False).select_related('exercise').order_by('pk')
+        .only('user_id', 'answered_at', 'is_correct', 'correct_count', 'total_count', 'exercise__wordset_id')
+        [:batch_size]
+    )
+    if attempts:
+        DailyProgress.record(attempts)
+        ExerciseProgress.objects.filter(pk__in=[a.pk for a in attempts]).update(rolled_up=True)
+    return len(attempts)
+
+
+def replay(users=None, batch_size=None, force=False):
+    """
+    Recompute the progress of ``users`` (a queryset; everyone by default) for
+    every word they have events for, one user per transaction. Returns
+    ``(rebuilt, skipped)``: the rows rebuilt and those left alone because
+    they count answers from before the log (all rebuilt with ``force``).
+    """
+    batch_size = batch_size or settings.ANSWER_LOG_BATCH_SIZE
+    user_ids = AnswerEvent.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    if users is not None:
+        user_ids = user_ids.filter(user__in=users)
+    rebuilt = skipped = 0
+    for user_id in list(user_ids):
+        user_rebuilt, user_skipped = _replay_user(user_id, batch_size, force)
+        rebuilt += user_rebuilt
+        skipped += user_skipped
+    return rebuilt, skipped
+
+
+def _replay_user(user_id, batch_size, force):
+    with transaction.atomic():
+        # Compaction waits until this user is done
+        cursor, _ = LogCursor.objects.select_for_update().get_or_create(name=COMPACTION_CURSOR)
+        # Events compaction has not reached yet are folded when it does
+        events = list(AnswerEvent.objects.filter(Q(applied=True) | Q(pk__lte=cursor.position), user_id=user_id)
+                      .order_by('pk').iterator(chunk_size=batch_size))
+        logged = Counter(e.word_id for e in events)
+        progress = progress_rows({(user_id, word_id) for word_id in logged})
+        legacy = set() if force else {
+            word_id for (_, word_id), wp in progress.items()
+            if wp.correct_attempts + wp.incorrect_attempts > logged[word_id]
+        }
+        progress = {key: wp for key, wp in progress.items() if key[1] not in legacy}
+        for wp in progress.values():
+            for name in PROGRESS_FIELDS:
+                setattr(wp, name, WordProgress._meta.get_field(name).get_default())
+        for event in events:
+            if event.word_id not in legacy:
+                progress[user_id, event.word_id].apply_answer(event.correct, grade=event.grade,
+                                                              now=event.answered_at)
+        WordProgress.objects.bulk_update(progress.values(), PROGRESS_FIELDS, batch_size=batch_size)
+        if progress:
+            _touched(events)
+    return len(progress), len(legacy)
@@ -0,0 +1,137 @@
+"""
+Two-tier cache for hot read paths.
+
+Values are stored in a small in-process LRU in front of the shared Django
+cache. Every entry belongs to one or more namespaces (``wordset:12``,
+``progress:3``...). Each namespace has a version number kept in the shared
+cache; the version is part of the entry key, so bumping a namespace (done by
+the model signals in ``main.signals``) makes every dependent entry
+unreachable in all processes at once. Old entries simply age out.
+
+QuerySet.update() and bulk_create() send no signals; code that writes
+through them must call ``bump()`` for the affected namespaces itself.
+
+Values are computed on the primary even in views that read from a replica: a
+lagging replica would otherwise store stale data under the current version,
+where no later bump replaces it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from LTalk.db_router import use_replica
+
+
+_MISSING = object()
+
+
+class LocalLRU:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local = LocalLRU(settings.LOCAL_CACHE_SIZE, settings.LOCAL_CACHE_TTL)
+
+
+def shared():
+    return caches[settings.HOT_CACHE_ALIAS]
+
+
+def _version_key(namespace):
+    return f"ver:{namespace}"
+
+
+def versions(namespaces):
+    """Current version of each namespace, creating missing ones."""
+    keys = [_version_key(ns) for ns in namespaces]
+    found = shared().get_many(keys)
+    result = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            # A fresh, never-reused value, so an evicted version key can't
+            # resurrect entries written under an older one.
+            shared().add(key, time.time_ns(), None)
+            version = shared().get(key)
+        result.append(str(version))
+    return result
+
+
+def bump(*namespaces):
+    if namespaces:
+        shared().set_many({_version_key(ns): time.time_ns() for ns in namespaces}, None)
+
+
+def get_or_set(key, namespaces, compute, timeout=None):
+    """Return the cached value for ``key`` or compute, store and return it."""
+    full_key = f"{key}@{'.'.join(versions(namespaces))}"
+    value = local.get(full_key)
+    if value is not _MISSING:
+        return value
+    value = shared().get(full_key, _MISSING)
+    if value is _MISSING:
+        with use_replica(False):
+            value = compute()
+        shared().set(full_key, value, settings.HOT_CACHE_TIMEOUT if timeout is None else timeout)
+    local.set(full_key, value)
+    return value
+
+
+# Namespaces used by the signal handlers and the cached views.
+def wordset_ns(wordset_id):
+    return f"wordset:{wordset_id}"
+
+
+def owner_ns(user_id):
+    return f"owner:{user_id}"
+
+
+def progress_ns(user_id):
+    return f"progress:{user_id}"
+
+
+def exercise_ns(exercise_id):
+    return f"exercise:{exercise_id}"
+
+
+WORDS_NS = "words"
+
+
+def progress_summary(user):
+    """``{wordset_id: (word_count, learned_count)}`` for every wordset the user owns."""
+    from .models import WordSet
+
+    def compute():
+        rows = WordSet.objects.filter(user=user).with_progress(user).values_list('id', 'word_count', 'learned_count')
+        return {ws_id: (total, learned) for ws_id, total, learned in rows}
+
+    return get_or_set(f"progress-summary:{user.pk}", [owner_ns(user.pk), progress_ns(user.pk)], compute)
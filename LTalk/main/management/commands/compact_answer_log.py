@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main import answer_log
+
+
+class Command(BaseCommand):
+    help = ("Fold pending answer events into WordProgress and attempts into DailyProgress in batches "
+            "(run from cron with ANSWER_LOG_DEFERRED)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.ANSWER_LOG_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop after this many batches; default is until nothing settled is left")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches to spread the load")
+
+    def handle(self, *args, **options):
+        total = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            folded = answer_log.compact(batch_size=options['batch_size'])
+            if not folded:
+                break
+            total += folded
+            batches += 1
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Compacted {total} answer events and attempts"))
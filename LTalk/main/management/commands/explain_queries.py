@@ -0,0 +1,121 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, DateTimeField, Max, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from authentication.models import User
+from main.models import AnswerEvent, WordSet, Word, WordProgress, Exercise, ExerciseProgress
+from main.selection import unlearned_words
+
+
+def hot_queries(user, wordset, word, exercise):
+    """``(label, queryset)`` for the query shapes behind the busiest views."""
+    return [
+        ("home / my wordsets", WordSet.objects.filter(user=user).annotate(
+            sort_time=Greatest(
+                Coalesce(Max('exercises__progress_entries__answered_at'),
+                         Value(datetime.min, output_field=DateTimeField())),
+                Coalesce('created', Value(datetime.min, output_field=DateTimeField())),
+            )).order_by('-sort_time')),
+        ("progress summary", WordSet.objects.filter(user=user).with_progress(user)),
+        ("explore (public, newest first)",
+         WordSet.objects.filter(public=True).exclude(user=user).order_by('-created')[:5]),
+        ("word get_or_create", Word.objects.filter(word_key=word.word_key)),
+        ("word progress (user, word)", WordProgress.objects.filter(user=user, word=word)),
+        ("learned words (user, is_learned)", WordProgress.objects.filter(user=user, is_learned=True)),
+        ("review queue (user, due_at)",
+         WordProgress.objects.filter(user=user, word__wordsets=wordset, due_at__lte=timezone.now())
+         .order_by('due_at')[:20]),
+        ("unlearned words (anti-join)", unlearned_words(user, wordset).values_list('pk', flat=True)),
+        ("exercises by type", Exercise.objects.filter(wordset=wordset, type='fill_in_gap')),
+        ("submission word match", wordset.words.filter(word_key__in=[word.word_key])),
+        ("exercise history", ExerciseProgress.objects.filter(user=user, exercise=exercise).order_by('-answered_at')),
+        ("pending answer events (compaction)",
+         AnswerEvent.objects.filter(pk__gt=0, applied=False).order_by('pk')[:settings.ANSWER_LOG_BATCH_SIZE]),
+        ("answer log replay (user, id)", AnswerEvent.objects.filter(user=user).order_by('pk')),
+    ]
+
+
+def full_scans(plan, vendor):
+    """Plan lines that read a whole table."""
+    lines = plan.splitlines()
+    if vendor == 'postgresql':
+        return [line.strip() for line in lines if 'Seq Scan' in line]
+    # SQLite: "SCAN t" is a full scan, "SCAN t USING (COVERING) INDEX i" is not
+    return [line.strip() for line in lines if 'SCAN ' in line and 'USING' not in line]
+
+
+class Command(BaseCommand):
+    help = (
+        "Print EXPLAIN plans for the hot view queries. To compare index changes, save a run "
+        "with --save before migrating and pass it to --baseline afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="User id to run the queries for (default: most wordsets)")
+        parser.add_argument('--analyze', action='store_true', help="EXPLAIN ANALYZE (PostgreSQL only)")
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--save', metavar='PATH', help="Write the plans to a JSON file")
+        parser.add_argument('--baseline', metavar='PATH', help="JSON file from an earlier --save to compare with")
+
+    def handle(self, *args, **options):
+        db = options['database']
+        vendor = connections[db].vendor
+        explain_options = {}
+        if options['analyze']:
+            if vendor != 'postgresql':
+                raise CommandError("--analyze is only supported on PostgreSQL")
+            explain_options = {'analyze': True, 'buffers': True}
+
+        user, wordset, word, exercise = self._samples(db, options['user'])
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        plans = {}
+        for label, queryset in hot_queries(user, wordset, word, exercise):
+            plan = queryset.using(db).explain(**explain_options)
+            plans[label] = plan
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {label}"))
+            self.stdout.write(plan)
+            self.stdout.write("")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Full table scans per query"))
+        for label, plan in plans.items():
+            scans = len(full_scans(plan, vendor))
+            line = f"{label:<36} {scans}"
+            if label in baseline:
+                before = len(full_scans(baseline[label], vendor))
+                changed = "plan changed" if baseline[label] != plan else "same plan"
+                line = f"{label:<36} {before} -> {scans}  ({changed})"
+            self.stdout.write(line)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(plans, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Plans saved to {options['save']}"))
+
+    def _samples(self, db, user_id):
+        users = User.objects.using(db)
+        if user_id is not None:
+            user = users.filter(pk=user_id).first()
+        else:
+            user = users.annotate(n=Count('wordsets')).order_by('-n').first()
+        if user is None:
+            raise CommandError("No user found; seed data first (manage.py seed_dataset)")
+
+        wordset = WordSet.objects.using(db).filter(user=user, words__isnull=False).first()
+        if wordset is None:
+            raise CommandError(f"User {user.pk} has no wordset with words")
+        word = wordset.words.using(db).first()
+        exercise = (Exercise.objects.using(db).filter(progress_entries__user=user).first()
+                    or Exercise.objects.using(db).first())
+        if exercise is None:
+            raise CommandError("No exercises found; seed data first (manage.py seed_dataset)")
+        return user, wordset, word, exercise
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.models import Exercise
+
+
+class Command(BaseCommand):
+    help = "Delete expired, never-submitted exercise sessions in batches (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches to spread the load")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the expired sessions")
+
+    def handle(self, *args, **options):
+        # Submitted exercises have no expiry; the progress check guards against stale rows
+        expired = Exercise.objects.expired().filter(progress_entries__isnull=True)
+        if options['dry_run']:
+            self.stdout.write(f"{expired.count()} expired exercise sessions")
+            return
+
+        total = 0
+        while True:
+            ids = list(expired.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            # Re-checked at delete time in case a session was submitted meanwhile
+            _, deleted = expired.filter(pk__in=ids).delete()
+            total += deleted.get(Exercise._meta.label, 0)
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {total} expired exercise sessions"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from main.models import DailyProgress
+
+
+class Command(BaseCommand):
+    help = "Recompute the DailyProgress rollups from ExerciseProgress"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help="Only this user id (repeatable); default is everyone")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(id__in=options['users']) if options['users'] else None
+        DailyProgress.rebuild(users=users, batch_size=options['batch_size'])
+        rows = DailyProgress.objects.filter(user__in=users) if users is not None else DailyProgress.objects.all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows.count()} daily progress rows"))
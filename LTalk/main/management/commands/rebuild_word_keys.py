@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Word
+
+
+class Command(BaseCommand):
+    help = "Recompute Word lookup keys, e.g. after changing WORD_KEY_FOLD_DIACRITICS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        total = 0
+        for word in Word.objects.only('id', 'word', 'translation').iterator(chunk_size=batch_size):
+            batch.append(word)
+            if len(batch) >= batch_size:
+                # WordQuerySet.bulk_update recomputes the keys
+                Word.objects.bulk_update(batch, ['word_key', 'translation_key'])
+                total += len(batch)
+                batch = []
+        if batch:
+            Word.objects.bulk_update(batch, ['word_key', 'translation_key'])
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt lookup keys for {total} words"))
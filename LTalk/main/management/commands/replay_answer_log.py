@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from main import answer_log
+
+
+class Command(BaseCommand):
+    help = "Recompute WordProgress from the answer log, e.g. after the learning rules change"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help="Only this user id (repeatable); default is everyone")
+        parser.add_argument('--batch-size', type=int, default=settings.ANSWER_LOG_BATCH_SIZE)
+        parser.add_argument('--force', action='store_true',
+                            help="Also rebuild rows that count answers from before the log, dropping those answers")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(id__in=options['users']) if options['users'] else None
+        rebuilt, skipped = answer_log.replay(users=users, batch_size=options['batch_size'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f"Replayed {rebuilt} word progress rows"))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {skipped} rows with answers from before the log; --force rebuilds them from the log alone"))
@@ -0,0 +1,247 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from authentication.models import User
+from main.models import DailyProgress, WordSet, Word, WordProgress, Exercise, ExerciseProgress
+
+
+SYLLABLES = [
+    'ka', 'la', 'ba', 'ma', 'na', 'ra', 'ta', 'va', 'ša', 'ža', 'ke', 'le', 'me', 'ne', 're',
+    'ti', 'li', 'mi', 'ni', 'ri', 'ko', 'lo', 'mo', 'no', 'ro', 'ku', 'lu', 'mu', 'nu', 'ru',
+    'dė', 'gė', 'lė', 'rė', 'ū', 'ie', 'uo', 'ai', 'au', 'ei',
+]
+ENDINGS = ['as', 'is', 'ys', 'us', 'a', 'ė', 'ti', 'oti', 'yti', 'auti']
+ENGLISH = [
+    'house', 'tree', 'river', 'bread', 'water', 'street', 'window', 'friend', 'city', 'table',
+    'to walk', 'to read', 'to sleep', 'to eat', 'to write', 'to run', 'to see', 'to buy',
+    'green', 'small', 'quick', 'cold', 'happy', 'slowly', 'often', 'today',
+]
+
+
+@contextmanager
+def explicit_timestamps(model, field_name):
+    """Let bulk_create keep generated values for an auto_now_add field."""
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "Generate a large synthetic dataset (users, wordsets, progress) for capacity testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--wordsets-per-user', type=int, default=10)
+        parser.add_argument('--words-per-set', type=int, default=30)
+        parser.add_argument('--shared-words', type=int, default=2000,
+                            help="Size of the vocabulary pool reused across wordsets")
+        parser.add_argument('--shared-ratio', type=float, default=0.5,
+                            help="Fraction of each wordset drawn from the shared pool")
+        parser.add_argument('--progress-coverage', type=float, default=0.8,
+                            help="Fraction of a user's words that get a WordProgress row")
+        parser.add_argument('--attempts-per-set', type=int, default=20,
+                            help="ExerciseProgress rows per wordset")
+        parser.add_argument('--exercises-per-type', type=int, default=2)
+        parser.add_argument('--public-ratio', type=float, default=0.3)
+        parser.add_argument('--duplicate-ratio', type=float, default=0.1,
+                            help="Fraction of users that duplicate a public wordset of someone else")
+        parser.add_argument('--days', type=int, default=90, help="Spread of generated timestamps")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        # Seeded users have fixed emails, so a second run would collide with the first
+        if User.objects.filter(email=self._email(0)).exists():
+            raise CommandError("The database is already seeded; seed an empty database (e.g. after manage.py flush)")
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        started = timezone.now()
+
+        with explicit_timestamps(WordSet, 'created'), \
+                explicit_timestamps(ExerciseProgress, 'answered_at'):
+            users = self._create_users(options['users'])
+            shared = self._create_words(options['shared_words'])
+            user_words = self._create_wordsets(users, shared, options)
+            self._create_duplicates(users, options['duplicate_ratio'])
+            self._create_word_progress(user_words, options['progress_coverage'])
+            self._create_exercise_progress(options['exercises_per_type'], options['attempts_per_set'])
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f"Seeding finished in {elapsed:.1f}s"))
+
+    def _timestamp(self):
+        return self.now - timedelta(seconds=self.rng.randint(0, self.days * 86400))
+
+    def _word(self):
+        length = self.rng.randint(1, 3)
+        stem = ''.join(self.rng.choice(SYLLABLES) for _ in range(length))
+        return stem, stem + self.rng.choice(ENDINGS)
+
+    def _bulk(self, model, rows):
+        """Insert an iterable of unsaved instances in batches, returning the saved ones."""
+        created = []
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                created.extend(model.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created.extend(model.objects.bulk_create(batch))
+        return created
+
+    def _stream(self, model, rows, label):
+        """Insert without keeping instances around, for the very large tables."""
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            total += len(batch)
+        self.stdout.write(f"{label}: {total}")
+        return total
+
+    @staticmethod
+    def _email(i):
+        return f"seed{i}@example.com"
+
+    def _create_users(self, count):
+        password = make_password('seedpass')
+        users = self._bulk(User, (
+            User(username=f"seed{i}", email=self._email(i), password=password) for i in range(count)
+        ))
+        self.stdout.write(f"Users: {len(users)}")
+        return users
+
+    def _create_words(self, count):
+        words = []
+        for _ in range(count):
+            stem, word = self._word()
+            words.append(Word(word=word[:35], infinitive=(stem + 'ti')[:35],
+                              translation=self.rng.choice(ENGLISH)))
+        return [w.id for w in self._bulk(Word, words)]
+
+    def _create_wordsets(self, users, shared, options):
+        per_set = options['words_per_set']
+        shared_count = min(int(per_set * options['shared_ratio']), len(shared))
+        unique_count = per_set - shared_count
+
+        wordsets = self._bulk(WordSet, (
+            WordSet(user=user, title=f"Set {n} of {user.username}"[:35],
+                    description="Generated wordset", public=self.rng.random() < options['public_ratio'],
+                    created=self._timestamp())
+            for user in users for n in range(options['wordsets_per_user'])
+        ))
+        self.stdout.write(f"WordSets: {len(wordsets)}")
+
+        unique_ids = iter(self._create_words(unique_count * len(wordsets)))
+        through = Word.wordsets.through
+        user_words = {}
+        self.seeded_sets = [(ws.id, ws.user_id) for ws in wordsets]
+        self.public_sets = [(ws.id, ws.user_id, ws.title) for ws in wordsets if ws.public]
+
+        def links():
+            for ws in wordsets:
+                word_ids = set(self.rng.sample(shared, shared_count))
+                word_ids.update(next(unique_ids) for _ in range(unique_count))
+                user_words.setdefault(ws.user_id, set()).update(word_ids)
+                for word_id in word_ids:
+                    yield through(wordset_id=ws.id, word_id=word_id)
+        self._stream(through, links(), "Wordset words")
+        return user_words
+
+    def _create_duplicates(self, users, ratio):
+        public = self.public_sets
+        if not public:
+            return
+        through = Word.wordsets.through
+        copies = []
+        for user in users:
+            if self.rng.random() >= ratio:
+                continue
+            original_id, owner_id, title = self.rng.choice(public)
+            if owner_id != user.id:
+                copies.append(WordSet(user=user, title=title, description="Duplicated", public=False,
+                                      duplicated_from_id=original_id, created=self._timestamp()))
+        copies = self._bulk(WordSet, copies)
+        self.seeded_sets.extend((c.id, c.user_id) for c in copies)
+
+        words_by_set = {}
+        for ws_id, word_id in through.objects.filter(
+                wordset_id__in={c.duplicated_from_id for c in copies}).values_list('wordset_id', 'word_id'):
+            words_by_set.setdefault(ws_id, []).append(word_id)
+        self._stream(through, (
+            through(wordset_id=copy.id, word_id=word_id)
+            for copy in copies for word_id in words_by_set.get(copy.duplicated_from_id, [])
+        ), "Duplicated wordsets")
+
+    def _create_word_progress(self, user_words, coverage):
+        def rows():
+            for user_id, word_ids in user_words.items():
+                for word_id in word_ids:
+                    if self.rng.random() >= coverage:
+                        continue
+                    correct = self.rng.randint(0, 10)
+                    incorrect = self.rng.randint(0, 6)
+                    total = correct + incorrect
+                    interval = self.rng.choice([1, 1, 6, 15, 38])
+                    yield WordProgress(
+                        user_id=user_id, word_id=word_id,
+                        correct_attempts=correct, incorrect_attempts=incorrect,
+                        is_learned=correct >= 3 and total and correct / total >= 0.6,
+                        repetitions=min(correct, 4), interval_days=interval,
+                        ease_factor=round(self.rng.uniform(1.3, 2.8), 2),
+                        # Spread over the past and coming interval so the queue has both due and upcoming cards
+                        due_at=self.now + timedelta(days=self.rng.uniform(-interval, interval)),
+                    )
+        self._stream(WordProgress, rows(), "WordProgress")
+
+    def _create_exercise_progress(self, per_type, attempts):
+        wordsets = self.seeded_sets
+        exercises = self._bulk(Exercise, (
+            Exercise(wordset_id=ws_id, type=ex_type,
+                     questions={"0": {"front": "žodis", "back": "word"}},
+                     correct_answers={"0": "word"})
+            for ws_id, _ in wordsets
+            for ex_type, _ in Exercise.EXERCISE_TYPES
+            for _ in range(per_type)
+        ))
+        self.stdout.write(f"Exercises: {len(exercises)}")
+
+        owners = dict(wordsets)
+        by_set = {}
+        for exercise in exercises:
+            by_set.setdefault(exercise.wordset_id, []).append(exercise.id)
+
+        def rows():
+            for ws_id, exercise_ids in by_set.items():
+                for _ in range(attempts):
+                    total = self.rng.randint(5, 15)
+                    correct = self.rng.randint(0, total)
+                    yield ExerciseProgress.graded(
+                        correct, total,
+                        user_id=owners[ws_id], exercise_id=self.rng.choice(exercise_ids),
+                        user_answer={"0": "word"}, is_correct=correct == total,
+                        answered_at=self._timestamp(),
+                    )
+        self._stream(ExerciseProgress, rows(), "ExerciseProgress")
+        DailyProgress.rebuild(users=User.objects.filter(id__in=set(owners.values())))
+        self.stdout.write(f"DailyProgress: {DailyProgress.objects.count()}")
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-19 13:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_exercise_updated_wordset_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextExerciseVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_version', models.CharField(max_length=64)),
+                ('payload', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('wordset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='text_variants', to='main.wordset')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wordset', 'content_version'], name='main_textex_wordset_3bfaf6_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-19 13:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_progress(apps, schema_editor):
+    """Fold duplicate (user, word) progress rows into the oldest one before the unique constraint."""
+    WordProgress = apps.get_model('main', 'WordProgress')
+    duplicates = (
+        WordProgress.objects.values('user_id', 'word_id')
+        .annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    )
+    for dup in duplicates.iterator():
+        rows = list(WordProgress.objects.filter(user_id=dup['user_id'], word_id=dup['word_id']))
+        kept = next(row for row in rows if row.id == dup['keep'])
+        kept.correct_attempts = sum(row.correct_attempts for row in rows)
+        kept.incorrect_attempts = sum(row.incorrect_attempts for row in rows)
+        total = kept.correct_attempts + kept.incorrect_attempts
+        # Same rule as WordProgress.update_progress
+        kept.is_learned = kept.correct_attempts >= 3 and kept.correct_attempts / total >= 0.6
+        kept.save(update_fields=['correct_attempts', 'incorrect_attempts', 'is_learned'])
+        WordProgress.objects.filter(id__in=[row.id for row in rows if row.id != kept.id]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_textexercisevariant'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['wordset', 'type'], name='main_exerci_wordset_d46439_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseprogress',
+            index=models.Index(fields=['user', 'exercise', 'answered_at'], name='main_exerci_user_id_cf1835_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='word',
+            index=models.Index(fields=['word'], name='main_word_word_085247_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wordprogress',
+            index=models.Index(fields=['user', 'is_learned'], name='main_wordpr_user_id_41ed9a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wordset',
+            index=models.Index(fields=['user', 'created'], name='main_wordse_user_id_8b06ae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wordset',
+            index=models.Index(fields=['public', 'created'], name='main_wordse_public_f82bb4_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_progress, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wordprogress',
+            constraint=models.UniqueConstraint(fields=('user', 'word'), name='unique_word_progress'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+
+def lookup_key(text):
+    # main.models.lookup_key as of this migration, with WORD_KEY_FOLD_DIACRITICS
+    # off; "manage.py rebuild_word_keys" applies the current setting
+    return " ".join((text or "").split()).casefold()
+
+
+def fill_lookup_keys(apps, schema_editor):
+    Word = apps.get_model('main', 'Word')
+    batch = []
+    for word in Word.objects.only('id', 'word', 'translation').iterator(chunk_size=2000):
+        word.word_key = lookup_key(word.word)
+        word.translation_key = lookup_key(word.translation)
+        batch.append(word)
+        if len(batch) >= 2000:
+            Word.objects.bulk_update(batch, ['word_key', 'translation_key'])
+            batch = []
+    if batch:
+        Word.objects.bulk_update(batch, ['word_key', 'translation_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        # Superseded by the word_key index
+        migrations.RemoveIndex(
+            model_name='word',
+            name='main_word_word_085247_idx',
+        ),
+        migrations.AddField(
+            model_name='word',
+            name='translation_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=70),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='word',
+            name='word_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=70),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+    ]
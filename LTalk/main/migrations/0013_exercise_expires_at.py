@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 13:40
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def expire_unsubmitted_sessions(apps, schema_editor):
+    """Fill-in-gap and flashcard rows were created on every page load; unsubmitted ones become sessions."""
+    Exercise = apps.get_model('main', 'Exercise')
+    Exercise.objects.filter(type__in=['fill_in_gap', 'flashcard'], progress_entries__isnull=True).update(
+        expires_at=timezone.now() + timedelta(seconds=settings.EXERCISE_SESSION_TTL))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_word_lookup_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(expire_unsubmitted_sessions, migrations.RunPython.noop),
+    ]
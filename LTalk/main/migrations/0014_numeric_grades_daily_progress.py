@@ -0,0 +1,91 @@
+# Generated by Django 5.2 on 2026-10-19 13:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+BATCH_SIZE = 2000
+
+
+def parse_grade(grade):
+    """``"3/5"`` -> ``(3, 5)``; anything unparseable counts as ``(0, 0)``."""
+    try:
+        correct, total = (int(part) for part in (grade or "").split('/'))
+    except ValueError:
+        return 0, 0
+    return max(correct, 0), max(total, 0)
+
+
+def backfill_grade_counts(apps, schema_editor):
+    ExerciseProgress = apps.get_model('main', 'ExerciseProgress')
+    last_id = 0
+    while True:
+        batch = list(ExerciseProgress.objects.filter(id__gt=last_id).order_by('id').only('id', 'grade')[:BATCH_SIZE])
+        if not batch:
+            break
+        for row in batch:
+            row.correct_count, row.total_count = parse_grade(row.grade)
+        ExerciseProgress.objects.bulk_update(batch, ['correct_count', 'total_count'])
+        last_id = batch[-1].id
+
+
+def backfill_daily_progress(apps, schema_editor):
+    ExerciseProgress = apps.get_model('main', 'ExerciseProgress')
+    DailyProgress = apps.get_model('main', 'DailyProgress')
+    rows = (
+        ExerciseProgress.objects.order_by()
+        .values('user_id', wordset_id=F('exercise__wordset_id'), day=TruncDate('answered_at'))
+        .annotate(n=Count('id'), full=Count('id', filter=Q(is_correct=True)),
+                  right=Sum('correct_count'), answered=Sum('total_count'))
+    )
+    batch = []
+    for r in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(DailyProgress(user_id=r['user_id'], wordset_id=r['wordset_id'], day=r['day'], attempts=r['n'],
+                                   correct_attempts=r['full'], answers_correct=r['right'] or 0,
+                                   answers_total=r['answered'] or 0))
+        if len(batch) >= BATCH_SIZE:
+            DailyProgress.objects.bulk_create(batch)
+            batch = []
+    DailyProgress.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_exercise_expires_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exerciseprogress',
+            name='correct_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='exerciseprogress',
+            name='total_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DailyProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('correct_attempts', models.PositiveIntegerField(default=0)),
+                ('answers_correct', models.PositiveIntegerField(default=0)),
+                ('answers_total', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_progress', to=settings.AUTH_USER_MODEL)),
+                ('wordset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_progress', to='main.wordset')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='main_dailyp_user_id_e97d9d_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'wordset', 'day'), name='unique_daily_progress')],
+            },
+        ),
+        migrations.RunPython(backfill_grade_counts, migrations.RunPython.noop),
+        migrations.RunPython(backfill_daily_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-19 13:49
+
+import django.utils.timezone
+from django.conf import settings
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def schedule_learned_words(apps, schema_editor):
+    # Every existing row starts out due now; words already learned are treated
+    # as two successful reviews in, so the queue opens with the words still
+    # being learned.
+    WordProgress = apps.get_model('main', 'WordProgress')
+    WordProgress.objects.filter(is_learned=True).update(
+        repetitions=2, interval_days=6, due_at=django.utils.timezone.now() + timedelta(days=6))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_numeric_grades_daily_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wordprogress',
+            name='due_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='wordprogress',
+            name='ease_factor',
+            field=models.FloatField(default=2.5),
+        ),
+        migrations.AddField(
+            model_name='wordprogress',
+            name='interval_days',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='wordprogress',
+            name='repetitions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='wordprogress',
+            index=models.Index(fields=['user', 'due_at'], name='main_wordpr_user_id_804404_idx'),
+        ),
+        migrations.RunPython(schedule_learned_words, migrations.RunPython.noop),
+    ]
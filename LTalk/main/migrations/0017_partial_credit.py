@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_answer_log'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailyprogress',
+            name='answers_correct',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='exerciseprogress',
+            name='correct_count',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-19 15:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_partial_credit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exerciseprogress',
+            name='rolled_up',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseprogress',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='exercise_progress_pending'),
+        ),
+    ]
@@ -1,13 +1,54 @@
+import unicodedata
+
+from django.conf import settings
 from django.db import models
-from datetime import datetime
+from django.db import transaction
+from django.db.models import Count, Func, Max, OuterRef, Subquery, Sum, F, Q
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from datetime import datetime, timedelta
 from authentication.models import User
 
+
+def _count_subquery(queryset):
+    """Correlated COUNT(*) subquery that yields 0 instead of NULL."""
+    counted = queryset.order_by().annotate(c=Func(F('pk'), function='COUNT')).values('c')
+    return Coalesce(Subquery(counted, output_field=models.IntegerField()), 0)
+
+
+def lookup_key(text):
+    """
+    Normalized form of ``text`` for case-insensitive matching through an
+    ordinary index: casefolded, trimmed, inner whitespace collapsed and, with
+    ``WORD_KEY_FOLD_DIACRITICS``, diacritics removed (``Katė`` -> ``kate``).
+    """
+    key = " ".join((text or "").split()).casefold()
+    if settings.WORD_KEY_FOLD_DIACRITICS:
+        key = "".join(c for c in unicodedata.normalize('NFKD', key) if not unicodedata.combining(c))
+    return key
+
+
+class WordSetQuerySet(models.QuerySet):
+    def with_progress(self, user):
+        """Annotate word_count and learned_count so learned percentages need no extra queries."""
+        return self.annotate(
+            word_count=_count_subquery(
+                Word.wordsets.through.objects.filter(wordset_id=OuterRef('pk'))
+            ),
+            learned_count=_count_subquery(
+                WordProgress.objects.filter(user=user, is_learned=True, word__wordsets=OuterRef('pk'))
+            ),
+        )
+
+
 class WordSet(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wordsets')
     title = models.CharField(max_length=35, blank=False, null=False)
     description = models.CharField(max_length=200, blank=True, null=True)
     public = models.BooleanField(default=True)
     created = models.DateTimeField(auto_now_add=True)
+    # Touched on any change to the set or its words; used as an HTTP validator
+    updated = models.DateTimeField(auto_now=True)
     duplicated_from = models.ForeignKey(
         'self',
         on_delete=models.SET_NULL,
@@ -16,7 +57,18 @@ class WordSet(models.Model):
         related_name='duplicates'
     )
 
+    objects = WordSetQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # "My wordsets" and the public explore listing, newest first
+            models.Index(fields=['user', 'created']),
+            models.Index(fields=['public', 'created']),
+        ]
+
     def learned_percent(self, user):
+        if hasattr(self, 'word_count') and hasattr(self, 'learned_count'):
+            return int((self.learned_count / self.word_count) * 100) if self.word_count else 0
         words = self.words.all()
         total = words.count()
         if total == 0:
@@ -27,25 +79,93 @@ class WordSet(models.Model):
     def __str__(self):
         return self.title
 
+class WordQuerySet(models.QuerySet):
+    """Keeps the lookup keys in sync for bulk writes, which bypass ``Word.save()``."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.set_keys()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.set_keys()
+        return super().bulk_update(objs, Word.with_key_fields(fields), *args, **kwargs)
+
+
 class Word(models.Model):
     word = models.CharField(max_length=35, null=False, blank=False)
     infinitive = models.CharField(max_length=35, null=False, blank=False)
     translation = models.CharField(max_length=35, null=False, blank=False)
     wordsets = models.ManyToManyField(WordSet, related_name="words")
+    # lookup_key() of word and translation; queried instead of __iexact so an index applies.
+    # QuerySet.update() does not maintain them.
+    word_key = models.CharField(max_length=70, editable=False, db_index=True)
+    translation_key = models.CharField(max_length=70, editable=False, db_index=True)
+
+    objects = WordQuerySet.as_manager()
+
+    KEY_FIELDS = {'word': 'word_key', 'translation': 'translation_key'}
+
+    def set_keys(self):
+        self.word_key = lookup_key(self.word)
+        self.translation_key = lookup_key(self.translation)
+
+    @classmethod
+    def with_key_fields(cls, fields):
+        fields = list(fields)
+        return fields + [cls.KEY_FIELDS[f] for f in fields if f in cls.KEY_FIELDS and cls.KEY_FIELDS[f] not in fields]
+
+    def save(self, *args, **kwargs):
+        self.set_keys()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = self.with_key_fields(kwargs['update_fields'])
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.word
     
 
+# SM-2 review grades (0-5). A right answer is "correct after hesitation", a
+# near miss given partial credit "correct with difficulty" and a wrong one
+# "incorrect, but easy to recall" since the correct answer is shown with the result.
+SM2_CORRECT_GRADE = 4
+SM2_HARD_GRADE = 3
+SM2_WRONG_GRADE = 2
+SM2_MIN_EASE = 1.3
+
+
 class WordProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     word = models.ForeignKey(Word, on_delete=models.CASCADE)
     correct_attempts = models.IntegerField(default=0)
     incorrect_attempts = models.IntegerField(default=0)
     is_learned = models.BooleanField(default=False)
+    # SM-2 schedule: a new row is due at once
+    repetitions = models.PositiveIntegerField(default=0)
+    interval_days = models.PositiveIntegerField(default=0)
+    ease_factor = models.FloatField(default=2.5)
+    due_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        constraints = [
+            # Also serves as the (user, word) lookup index
+            models.UniqueConstraint(fields=['user', 'word'], name='unique_word_progress'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'is_learned']),
+            # Review queue: WHERE user = ? ORDER BY due_at LIMIT n
+            models.Index(fields=['user', 'due_at']),
+        ]
 
-    def update_progress(self, correct: bool):
+    def update_progress(self, correct: bool, grade=None):
+        self.apply_answer(correct, grade=grade)
+        self.save()
+
+    def apply_answer(self, correct: bool, grade=None, now=None):
+        """``update_progress`` without saving, for updating many rows in bulk."""
         if correct:
             self.correct_attempts += 1
         else:
@@ -54,7 +174,35 @@ class WordProgress(models.Model):
         total = self.correct_attempts + self.incorrect_attempts
         ratio = self.correct_attempts / total if total > 0 else 0
         self.is_learned = self.correct_attempts >= 3 and ratio >= 0.6
-        self.save()
+        self.schedule(correct, now=now, grade=grade)
+
+    def schedule(self, correct: bool, now=None, grade=None):
+        """Move ``due_at`` to the next SM-2 review after a right or wrong answer, or one of SM-2 ``grade``."""
+        if grade is None:
+            grade = SM2_CORRECT_GRADE if correct else SM2_WRONG_GRADE
+        if grade >= 3:
+            if self.repetitions == 0:
+                self.interval_days = 1
+            elif self.repetitions == 1:
+                self.interval_days = 6
+            else:
+                self.interval_days = round(self.interval_days * self.ease_factor)
+            self.repetitions += 1
+        else:
+            self.repetitions = 0
+            self.interval_days = 1
+        self.ease_factor = max(
+            SM2_MIN_EASE, self.ease_factor + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+        self.due_at = (now or timezone.now()) + timedelta(days=self.interval_days)
+
+
+class ExerciseQuerySet(models.QuerySet):
+    def live(self):
+        """Submitted exercises plus unsubmitted ones that have not expired."""
+        return self.filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
 
 
 class Exercise(models.Model):
@@ -67,23 +215,194 @@ class Exercise(models.Model):
     type = models.CharField(max_length=20, choices=EXERCISE_TYPES)
     questions = models.JSONField()
     correct_answers = models.JSONField()
+    updated = models.DateTimeField(auto_now=True)
+    # Generated exercises start as sessions that expire after EXERCISE_SESSION_TTL
+    # (purge_exercises deletes them); the first submission clears this and keeps them.
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = ExerciseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['wordset', 'type'])]
+
+    @staticmethod
+    def session_expiry():
+        return timezone.now() + timedelta(seconds=settings.EXERCISE_SESSION_TTL)
 
     def __str__(self):
         return f"{self.get_type_display()} for {self.wordset.title}"
 
 
+class ExerciseProgressQuerySet(models.QuerySet):
+    def summary_by_type(self):
+        """
+        One row per exercise type: ``attempts``, fully ``correct`` attempts,
+        ``accuracy`` (percent of answers that were right) and
+        ``last_attempt``, aggregated in the database.
+        """
+        rows = (
+            self.order_by().values(type=F('exercise__type'))
+            .annotate(attempts=Count('id'), correct=Count('id', filter=Q(is_correct=True)),
+                      answers_correct=Sum('correct_count'), answers_total=Sum('total_count'),
+                      last_attempt=Max('answered_at'))
+            .order_by('type')
+        )
+        labels = dict(Exercise.EXERCISE_TYPES)
+        return [
+            {**row, 'label': labels.get(row['type'], row['type']),
+             'accuracy': percent(row['answers_correct'], row['answers_total'])}
+            for row in rows
+        ]
+
+
 class ExerciseProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exercise_progress')
     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='progress_entries')
     user_answer = models.JSONField(blank=True, null=True)
     is_correct = models.BooleanField(default=False)
     answered_at = models.DateTimeField(auto_now_add=True)
+    # "correct/total", kept for API clients; statistics use the count columns
     grade = models.CharField()
+    # Summed credit of the answers; near misses in fill-in-the-gap earn a fraction
+    correct_count = models.FloatField(default=0)
+    total_count = models.PositiveIntegerField(default=0)
+    # Whether DailyProgress includes this attempt; with ANSWER_LOG_DEFERRED
+    # compaction adds it (main.answer_log)
+    rolled_up = models.BooleanField(default=True)
+
+    objects = ExerciseProgressQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'exercise', 'answered_at']),
+            # Compaction only looks at attempts not rolled up yet
+            models.Index(fields=['id'], condition=Q(rolled_up=False), name='exercise_progress_pending'),
+        ]
+
+    @classmethod
+    def graded(cls, correct, total, **kwargs):
+        """Unsaved attempt with ``grade`` and the count columns in agreement."""
+        return cls(grade=f"{correct:g}/{total}", correct_count=correct, total_count=total, **kwargs)
 
     def __str__(self):
         return f"{self.user} - {self.exercise} - {'Correct' if self.is_correct else 'Incorrect'}"
 
 
+def percent(part, whole):
+    return round((part or 0) * 100 / whole) if whole else 0
+
+
+class DailyProgress(models.Model):
+    """
+    Per-user, per-wordset totals of one day's exercise attempts.
+
+    Maintained incrementally by ``record()`` as attempts are saved, so
+    progress-over-time reads touch one row per day instead of every attempt.
+    Rebuild from ``ExerciseProgress`` with ``manage.py rebuild_daily_progress``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_progress')
+    wordset = models.ForeignKey(WordSet, on_delete=models.CASCADE, related_name='daily_progress')
+    day = models.DateField()
+    attempts = models.PositiveIntegerField(default=0)
+    # Attempts with every answer right
+    correct_attempts = models.PositiveIntegerField(default=0)
+    answers_correct = models.FloatField(default=0)
+    answers_total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'wordset', 'day'], name='unique_daily_progress'),
+        ]
+        indexes = [models.Index(fields=['user', 'day'])]
+
+    @classmethod
+    def record(cls, attempts):
+        """Add saved ``ExerciseProgress`` rows (with ``exercise`` loaded or ``wordset_id`` known) to the rollups."""
+        totals = {}
+        for attempt in attempts:
+            key = (attempt.user_id, attempt.exercise.wordset_id, timezone.localdate(attempt.answered_at))
+            row = totals.setdefault(key, [0, 0, 0, 0])
+            row[0] += 1
+            row[1] += int(attempt.is_correct)
+            row[2] += attempt.correct_count
+            row[3] += attempt.total_count
+
+        with transaction.atomic():
+            for (user_id, wordset_id, day), (n, full, right, answered) in totals.items():
+                row, _ = cls.objects.get_or_create(user_id=user_id, wordset_id=wordset_id, day=day)
+                # F() increments, so concurrent submissions for the same day add up
+                cls.objects.filter(pk=row.pk).update(
+                    attempts=F('attempts') + n, correct_attempts=F('correct_attempts') + full,
+                    answers_correct=F('answers_correct') + right, answers_total=F('answers_total') + answered,
+                )
+
+    @classmethod
+    def rebuild(cls, users=None, batch_size=2000):
+        """Recompute the rollups of ``users`` (a queryset; everyone by default) from their attempts."""
+        attempts = ExerciseProgress.objects.all()
+        existing = cls.objects.all()
+        if users is not None:
+            attempts = attempts.filter(user__in=users)
+            existing = existing.filter(user__in=users)
+        rows = (
+            attempts.order_by()
+            .values('user_id', wordset_id=F('exercise__wordset_id'), day=TruncDate('answered_at'))
+            .annotate(n=Count('id'), full=Count('id', filter=Q(is_correct=True)),
+                      right=Sum('correct_count'), answered=Sum('total_count'))
+        )
+        with transaction.atomic():
+            existing.delete()
+            batch = []
+            for r in rows.iterator(chunk_size=batch_size):
+                batch.append(cls(user_id=r['user_id'], wordset_id=r['wordset_id'], day=r['day'], attempts=r['n'],
+                                 correct_attempts=r['full'], answers_correct=r['right'] or 0,
+                                 answers_total=r['answered'] or 0))
+                if len(batch) >= batch_size:
+                    cls.objects.bulk_create(batch)
+                    batch = []
+            cls.objects.bulk_create(batch)
+
+
+class AnswerEvent(models.Model):
+    """
+    One answer to one word, appended by every submission and never updated.
+
+    ``WordProgress`` is derived from these rows: folded in right away, or by
+    ``manage.py compact_answer_log`` with ``ANSWER_LOG_DEFERRED`` (see
+    ``main.answer_log``), and rebuilt with ``manage.py replay_answer_log``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='answer_events')
+    word = models.ForeignKey(Word, on_delete=models.CASCADE, related_name='answer_events')
+    exercise = models.ForeignKey(Exercise, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='answer_events')
+    correct = models.BooleanField()
+    # SM-2 grade when it differs from the right/wrong default (partially credited answers)
+    grade = models.PositiveSmallIntegerField(null=True, blank=True)
+    answered_at = models.DateTimeField(default=timezone.now)
+    # Whether WordProgress was updated when the event was written
+    applied = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Replay reads a user's events in order
+            models.Index(fields=['user', 'id']),
+            # Compaction only looks at events not applied yet
+            models.Index(fields=['id'], condition=Q(applied=False), name='answer_event_pending'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.word} - {'Correct' if self.correct else 'Incorrect'}"
+
+
+class LogCursor(models.Model):
+    """How far a background job has read an append-only log (the id of the last row it processed)."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
+
+
 class SentenceTemplate(models.Model):
     word = models.ForeignKey(Word, on_delete=models.CASCADE)
     sentence = models.TextField()
@@ -95,3 +414,18 @@ class SentenceTemplate(models.Model):
         
     def __str__(self):
         return f"Template for {self.word.word}"
+
+
+class TextExerciseVariant(models.Model):
+    """A generated reading-comprehension text, reused across requests for the same words."""
+    wordset = models.ForeignKey(WordSet, on_delete=models.CASCADE, related_name='text_variants')
+    # Hash of the wordset's words when the text was generated
+    content_version = models.CharField(max_length=64)
+    payload = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['wordset', 'content_version'])]
+
+    def __str__(self):
+        return f"Text variant {self.pk} for {self.wordset.title}"
@@ -0,0 +1,71 @@
+"""
+Which words of a wordset to practise next.
+
+Every ``WordProgress`` row carries an SM-2 ``due_at`` (see
+``WordProgress.schedule``). The queue is read through the ``(user, due_at)``
+index with ``ORDER BY due_at LIMIT n``, so picking cards costs the same for a
+user tracking fifty words as for one tracking fifty thousand.
+
+Word states are tested with ``NOT EXISTS`` subqueries against the user's
+progress rows, so each set is one anti-join rather than a list of ids built
+in Python. Random picks never use ``ORDER BY RANDOM()``, which would sort the
+whole set: ``sample()`` reads only the primary keys, draws from them in
+Python and fetches the drawn rows by key.
+"""
+import random
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import WordProgress
+
+
+def _progress(user, **filters):
+    return Exists(WordProgress.objects.filter(user=user, word=OuterRef('pk'), **filters))
+
+
+def untracked_words(user, wordset):
+    """Words of ``wordset`` that ``user`` has never practised."""
+    return wordset.words.filter(~_progress(user))
+
+
+def unlearned_words(user, wordset):
+    """Words of ``wordset`` that ``user`` has not learned yet."""
+    return wordset.words.filter(~_progress(user, is_learned=True))
+
+
+def sample(queryset, k, rng=random):
+    """Up to ``k`` distinct rows of ``queryset`` in random order, in two queries."""
+    ids = list(queryset.order_by().values_list('pk', flat=True).distinct())
+    picked = rng.sample(ids, min(k, len(ids)))
+    if not picked:
+        return []
+    rows = queryset.model._default_manager.in_bulk(picked)
+    return [rows[pk] for pk in picked if pk in rows]
+
+
+def sample_unlearned(user, wordset, k, rng=random):
+    """``k`` random words ``user`` still has to learn, topped up with learned ones if fewer are left."""
+    words = sample(unlearned_words(user, wordset), k, rng)
+    if len(words) < k:
+        words += sample(wordset.words.filter(_progress(user, is_learned=True)), k - len(words), rng)
+    return words
+
+
+def review_queue(user, wordset, limit, now=None, rng=random):
+    """
+    Up to ``limit`` words of ``wordset`` for ``user``: overdue reviews (most
+    overdue first), then a random pick of words never practised, then the
+    reviews coming up soonest. Both reads of the queue are bounded by ``limit``.
+    """
+    now = now or timezone.now()
+    progress = WordProgress.objects.filter(user=user, word__wordsets=wordset).select_related('word')
+    words = [wp.word for wp in progress.filter(due_at__lte=now).order_by('due_at')[:limit]]
+
+    if len(words) < limit:
+        words += sample(untracked_words(user, wordset), limit - len(words), rng)
+
+    if len(words) < limit:
+        # Everything is scheduled ahead; practise what comes up next rather than nothing
+        words += [wp.word for wp in progress.filter(due_at__gt=now).order_by('due_at')[:limit - len(words)]]
+    return words
@@ -0,0 +1,72 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache
+from .models import WordSet, Word, WordProgress, Exercise
+
+
+def _wordset_owners(wordset_ids):
+    return set(WordSet.objects.filter(id__in=wordset_ids).values_list('user_id', flat=True))
+
+
+def _touch(wordset_ids):
+    # Word and membership changes alter the wordset's representation, so move
+    # its ``updated`` validator too. update() sends no signals of its own.
+    if wordset_ids:
+        WordSet.objects.filter(id__in=wordset_ids).update(updated=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=WordSet)
+def wordset_changed(sender, instance, **kwargs):
+    cache.bump(cache.wordset_ns(instance.pk), cache.owner_ns(instance.user_id))
+
+
+@receiver(pre_delete, sender=Word)
+def word_deleting(sender, instance, **kwargs):
+    # The through rows are gone by post_delete, so remember the wordsets now.
+    instance._cached_wordset_ids = list(instance.wordsets.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Word)
+def word_changed(sender, instance, created=False, **kwargs):
+    if created:
+        # A new word belongs to no wordset yet; m2m_changed handles the link.
+        cache.bump(cache.WORDS_NS)
+        return
+    wordset_ids = getattr(instance, '_cached_wordset_ids', None)
+    if wordset_ids is None:
+        wordset_ids = list(instance.wordsets.values_list('id', flat=True))
+    _touch(wordset_ids)
+    cache.bump(cache.WORDS_NS, *[cache.wordset_ns(ws_id) for ws_id in wordset_ids],
+               *[cache.owner_ns(user_id) for user_id in _wordset_owners(wordset_ids)])
+
+
+@receiver(m2m_changed, sender=Word.wordsets.through)
+def wordset_words_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if isinstance(instance, Word):
+            instance._cleared_wordset_ids = list(instance.wordsets.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if isinstance(instance, WordSet):
+        _touch([instance.pk])
+        cache.bump(cache.wordset_ns(instance.pk), cache.owner_ns(instance.user_id))
+        return
+
+    wordset_ids = list(pk_set or getattr(instance, '_cleared_wordset_ids', []))
+    _touch(wordset_ids)
+    cache.bump(*[cache.wordset_ns(ws_id) for ws_id in wordset_ids],
+               *[cache.owner_ns(user_id) for user_id in _wordset_owners(wordset_ids)])
+
+
+@receiver([post_save, post_delete], sender=WordProgress)
+def word_progress_changed(sender, instance, **kwargs):
+    cache.bump(cache.progress_ns(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=Exercise)
+def exercise_changed(sender, instance, **kwargs):
+    cache.bump(cache.exercise_ns(instance.pk))
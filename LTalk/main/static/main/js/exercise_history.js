@@ -1,7 +1,62 @@
 document.addEventListener('DOMContentLoaded', () => {
-    const buttons = document.querySelectorAll('.type-button');
+    const buttons = document.querySelectorAll('.type-button[data-type]');
     const lists = document.querySelectorAll('.progress-list');
 
+    // Next page URL per type; undefined until the type is first opened, null when exhausted
+    const nextPage = {};
+
+    function formatDate(value) {
+        const date = new Date(value);
+        const pad = n => String(n).padStart(2, '0');
+        return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())} ` +
+               `${pad(date.getHours())}:${pad(date.getMinutes())}`;
+    }
+
+    function renderEntry(list, entry) {
+        const row = document.createElement('div');
+        row.className = 'progress-entry';
+
+        const when = document.createElement('strong');
+        when.textContent = formatDate(entry.answered_at);
+        const result = document.createElement('span');
+        result.className = entry.is_correct ? 'correct' : 'incorrect';
+        result.textContent = entry.is_correct ? 'correct' : 'incorrect';
+
+        row.append(when, ` - ${list.dataset.label}: `, result, ` (Grade: ${entry.grade})`);
+        return row;
+    }
+
+    async function loadPage(list) {
+        const type = list.dataset.type;
+        const entries = list.querySelector('.history-entries');
+        const more = list.querySelector('.history-more');
+        if (!entries) return;  // no attempts of this type
+
+        const url = nextPage[type] === undefined
+            ? `${historyUrl}?type=${encodeURIComponent(type)}`
+            : nextPage[type];
+        if (!url) return;
+
+        more.disabled = true;
+        try {
+            const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+            data.results.forEach(entry => entries.appendChild(renderEntry(list, entry)));
+            nextPage[type] = data.next;
+        } catch (error) {
+            console.error('Error loading history:', error);
+        } finally {
+            more.disabled = false;
+            more.hidden = !nextPage[type];
+        }
+    }
+
+    lists.forEach(list => {
+        const more = list.querySelector('.history-more');
+        if (more) more.addEventListener('click', () => loadPage(list));
+    });
+
     buttons.forEach(button => {
         button.addEventListener('click', () => {
             const type = button.getAttribute('data-type');
@@ -10,7 +65,11 @@ document.addEventListener('DOMContentLoaded', () => {
             button.classList.add('active');
 
             lists.forEach(list => {
-                list.style.display = list.getAttribute('data-type') === type ? 'block' : 'none';
+                const selected = list.getAttribute('data-type') === type;
+                list.style.display = selected ? 'block' : 'none';
+                if (selected && nextPage[type] === undefined) {
+                    loadPage(list);
+                }
             });
         });
     });
@@ -6,6 +6,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const nextBtn = document.getElementById('next-btn');
     const correctCountSpan = document.getElementById('correct-count');
     const incorrectCountSpan = document.getElementById('incorrect-count');
+    const partialCountSpan = document.getElementById('partial-count');
     const progressBar = document.getElementById('progress-bar');
     const feedbackArea = document.getElementById('feedback-area');
 
@@ -15,6 +16,7 @@ document.addEventListener('DOMContentLoaded', () => {
     let userAnswers = {};
     let correctAnswersCount = 0;
     let incorrectAnswersCount = 0;
+    let partialAnswersCount = 0;
     let feedback = {};
 
     // --- Helper Functions ---
@@ -153,6 +155,22 @@ document.addEventListener('DOMContentLoaded', () => {
             if (response.ok) {
                 const result = await response.json();
                 
+                // Only full credit is correct, as on the server; near misses (missing
+                // diacritics, typos) earn partial credit and are counted separately
+                const grade = result.grades && result.grades[questionKey];
+                if (grade && grade.credit >= 1) {
+                    incorrectAnswersCount--;
+                    correctAnswersCount++;
+                    showFeedback(questionKey, true, result.feedback && result.feedback[questionKey]);
+                    return;
+                }
+                if (grade && grade.credit > 0) {
+                    incorrectAnswersCount--;
+                    partialAnswersCount++;
+                    showFeedback(questionKey, false, result.feedback && result.feedback[questionKey], grade.credit);
+                    return;
+                }
+
                 // Update the feedback if available
                 if (result.feedback && result.feedback[questionKey]) {
                     const feedbackContent = feedbackArea.querySelector('.feedback-content');
@@ -208,6 +226,8 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         } catch (error) {
             console.error("Error submitting final results:", error);
+            // Offline: keep the answers and send them with the next batch
+            window.submissionQueue.enqueue(exercise.id, userAnswers);
         }
     }
 
@@ -218,6 +238,7 @@ document.addEventListener('DOMContentLoaded', () => {
         summaryArea.style.display = 'block';
         correctCountSpan.textContent = correctAnswersCount;
         incorrectCountSpan.textContent = incorrectAnswersCount;
+        partialCountSpan.textContent = partialAnswersCount;
         
         // Set progress bar to 100% when showing summary
         progressBar.style.width = '100%';
@@ -226,15 +247,21 @@ document.addEventListener('DOMContentLoaded', () => {
         submitResults();
     }
 
-    function showFeedback(questionKey, isCorrect, feedbackText) {
+    // credit: the partial credit of a near miss, if any
+    function showFeedback(questionKey, isCorrect, feedbackText, credit = 0) {
         feedbackArea.innerHTML = '';
         feedbackArea.style.display = 'block';
         
         const feedbackElement = document.createElement('div');
+        let header = isCorrect ? '✓ Correct!' : '✗ Incorrect';
         feedbackElement.className = isCorrect ? 'feedback correct' : 'feedback incorrect';
+        if (!isCorrect && credit > 0) {
+            header = `~ Almost (${Math.round(credit * 100)}% credit)`;
+            feedbackElement.className = 'feedback partial';
+        }
         
         feedbackElement.innerHTML = `
-            <div class="feedback-header">${isCorrect ? '✓ Correct!' : '✗ Incorrect'}</div>
+            <div class="feedback-header">${header}</div>
             <div class="feedback-content">${feedbackText || ''}</div>
         `;
         
@@ -250,7 +277,7 @@ document.addEventListener('DOMContentLoaded', () => {
     async function fetchOrCreateExercise() {
         showLoading();
         try {
-            // Always create a new exercise for each session with a unique timestamp
+            // Every visit gets a new exercise session; it is kept only if answers are submitted
             const response = await fetch('/api/exercise/', {
                 method: 'POST',
                 headers: {
@@ -260,8 +287,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 },
                 body: JSON.stringify({
                     wordset: wordsetId,
-                    type: 'fill_in_gap',
-                    timestamp: timestamp || Date.now() // Use provided timestamp or generate one
+                    type: 'fill_in_gap'
                 })
             });
 
@@ -209,11 +209,13 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         } catch (error) {
             console.error("Error submitting results:", error);
+            // Offline: keep the answers and send them with the next batch
+            window.submissionQueue.enqueue(exercise.id, userAnswers);
              const summaryP = summaryArea.querySelector('p');
              if (summaryP) {
                     const errorDiv = document.createElement('div');
                     errorDiv.className = 'error-message';
-                    errorDiv.textContent = `Network error saving progress: ${error.message}`;
+                    errorDiv.textContent = "You're offline. Your progress will be saved when you're back online.";
                     summaryArea.insertBefore(errorDiv, summaryP.nextSibling);
              }
         }
@@ -0,0 +1,116 @@
+// Offline queue for exercise submissions.
+// Answers that could not be sent (no connection) are kept in localStorage and
+// flushed to /api/submissions/ once the browser is back online. Entries the
+// server rejects (e.g. an expired exercise) are dropped; the rest are kept
+// until they are recorded.
+window.submissionQueue = (function() {
+    const STORAGE_KEY = 'ltalk-pending-submissions';
+    // Below the server's SUBMIT_BATCH_MAX
+    const BATCH_SIZE = 50;
+    let flushing = false;
+
+    function getCSRFToken() {
+        const cookies = document.cookie.split(';');
+        for (let cookie of cookies) {
+            const [key, value] = cookie.trim().split('=');
+            if (key === 'csrftoken') {
+                return decodeURIComponent(value);
+            }
+        }
+        return '';
+    }
+
+    function load() {
+        try {
+            return JSON.parse(localStorage.getItem(STORAGE_KEY)) || [];
+        } catch (error) {
+            return [];
+        }
+    }
+
+    function save(pending) {
+        if (pending.length) {
+            localStorage.setItem(STORAGE_KEY, JSON.stringify(pending));
+        } else {
+            localStorage.removeItem(STORAGE_KEY);
+        }
+    }
+
+    function enqueue(exerciseId, userAnswers) {
+        const pending = load();
+        pending.push({ exercise: exerciseId, user_answers: userAnswers });
+        save(pending);
+    }
+
+    // Indexes of the entries in a batch that would fail the same way every time
+    function rejectedEntries(response, data) {
+        if (response.ok) {
+            return data.results.flatMap((result, i) => result.status === 'rejected' ? [i] : []);
+        }
+        const errors = data.error && data.error.submissions;
+        if (!Array.isArray(errors)) {
+            return null;
+        }
+        return errors.flatMap((error, i) => Object.keys(error).length ? [i] : []);
+    }
+
+    async function send(batch) {
+        const response = await fetch('/api/submissions/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: JSON.stringify({ submissions: batch })
+        });
+        if (!response.ok && response.status !== 400) {
+            return false;
+        }
+        const data = await response.json();
+        let rejected = rejectedEntries(response, data);
+        if (rejected === null) {
+            // The request as a whole is malformed and would fail the same way every time
+            console.error("Dropping queued submissions:", data);
+            rejected = batch.map((entry, i) => i);
+        } else if (rejected.length) {
+            console.error("Dropping rejected submissions:", rejected.map(i => batch[i]), data);
+        }
+        // Recorded entries are done; invalid ones are dropped and the rest of a 400 batch retried.
+        // Anything queued while the request was in flight is kept.
+        const done = response.ok ? batch.map((entry, i) => i) : rejected;
+        const sent = load();
+        save(sent.slice(0, batch.length).filter((entry, i) => !done.includes(i)).concat(sent.slice(batch.length)));
+        return true;
+    }
+
+    async function flush() {
+        if (flushing || !navigator.onLine) {
+            return;
+        }
+        flushing = true;
+        try {
+            let pending = load();
+            while (pending.length) {
+                if (!await send(pending.slice(0, BATCH_SIZE))) {
+                    break;
+                }
+                const remaining = load();
+                if (remaining.length >= pending.length) {
+                    // Nothing was removed; retry on the next flush
+                    break;
+                }
+                pending = remaining;
+            }
+        } catch (error) {
+            console.error("Error flushing queued submissions:", error);
+        } finally {
+            flushing = false;
+        }
+    }
+
+    window.addEventListener('online', flush);
+    document.addEventListener('DOMContentLoaded', flush);
+
+    return { enqueue, flush };
+})();
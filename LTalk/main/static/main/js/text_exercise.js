@@ -30,15 +30,32 @@ document.addEventListener('DOMContentLoaded', () => {
         resultsArea.style.display = 'none';
     }
     
-    // Load the text and questions from the API
+    // Show the text as it streams in, before the questions are ready
+    function showStreamingText() {
+        exerciseArea.innerHTML = '';
+        const textArea = document.createElement('div');
+        textArea.className = 'text-area';
+        textArea.style.whiteSpace = 'pre-wrap';
+        exerciseArea.appendChild(textArea);
+
+        const pendingQuestions = document.createElement('div');
+        pendingQuestions.className = 'loading';
+        pendingQuestions.textContent = 'Preparing questions...';
+        exerciseArea.appendChild(pendingQuestions);
+        return textArea;
+    }
+    
+    // Load the text and questions from the API.
+    // The response is a stream of JSON lines: "text" events carry pieces of the
+    // passage, then one "questions" event carries the full exercise.
     async function fetchGeminiContent() {
         showLoading();
         
         try {
-            const response = await fetch(`/api/text-exercise/?wordset_id=${wordsetId}`, {
+            const response = await fetch(`/api/text-exercise/?wordset_id=${wordsetId}&stream=1`, {
                 method: 'GET',
                 headers: {
-                    'Accept': 'application/json',
+                    'Accept': 'application/x-ndjson',
                     'X-CSRFToken': getCSRFToken()
                 }
             });
@@ -48,9 +65,40 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.error || 'Failed to load exercise');
             }
             
-            const data = await response.json();
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let textArea = null;
+            let data = null;
+            
+            const handleEvent = (event) => {
+                if (event.type === 'text') {
+                    if (!textArea) {
+                        textArea = showStreamingText();
+                    }
+                    textArea.textContent += event.delta;
+                } else if (event.type === 'questions') {
+                    data = event;
+                } else if (event.type === 'error') {
+                    throw new Error(event.error);
+                }
+            };
+            
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+            }
+            if (buffer.trim()) {
+                handleEvent(JSON.parse(buffer));
+            }
             
-            if (!data.text || !data.questions || !Array.isArray(data.questions)) {
+            if (!data || !data.text || !data.questions || !Array.isArray(data.questions)) {
                 throw new Error('Invalid response format from server');
             }
             
@@ -1,3 +1,202 @@
-from django.test import TestCase
+import random
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from LTalk.testing import PerformanceBudgetMixin, create_budget_fixture
+from . import answer_log
+from .models import AnswerEvent, LogCursor, Word, WordProgress
+from .selection import sample, sample_unlearned, unlearned_words
+
+
+class PageBudgetTest(PerformanceBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="budget", password="pass", email="budget@gmail.com")
+        self.wordsets = create_budget_fixture(self.user)
+        self.client.force_login(self.user)
+
+    def test_home_budget(self):
+        with self.assertWithinBudget('home'):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_wordset_detail_budget(self):
+        with self.assertWithinBudget('wordset_detail'):
+            response = self.client.get(reverse('wordset_detail', args=[self.wordsets[0].id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_exercise_history_budget(self):
+        with self.assertWithinBudget('exercise_history'):
+            response = self.client.get(reverse('exercise_history', args=[self.wordsets[0].id]))
+        self.assertEqual(response.status_code, 200)
+
+
+class HotCacheTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="cache", password="pass", email="cache@gmail.com")
+        self.wordset = create_budget_fixture(self.user, wordsets=1, words=4)[0]
+        self.client.force_login(self.user)
+
+    def test_home_progress_is_cached_and_invalidated(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, "4 words")
+        self.assertContains(response, 'data-progress="50"')
+
+        WordProgress.objects.filter(user=self.user, is_learned=False).update(is_learned=True)
+        WordProgress.objects.filter(user=self.user).first().save()
+        self.assertContains(self.client.get(reverse('home')), 'data-progress="100"')
+
+    def test_wordset_detail_api_invalidated_on_word_change(self):
+        url = f"/api/wordset/{self.wordset.id}/"
+        self.client.get(url)
+        # Session, user and the validator lookup; the body comes from the cache
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.client.get(url).json()['words']), 4)
+
+        self.wordset.words.add(Word.objects.create(word="naujas", infinitive="naujas", translation="new"))
+        self.assertEqual(len(self.client.get(url).json()['words']), 5)
+
+        word = self.wordset.words.get(word="naujas")
+        word.translation = "fresh"
+        word.save()
+        self.assertIn("fresh", [w['translation'] for w in self.client.get(url).json()['words']])
+
+
+class HotQueryIndexTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="indexed", password="pass", email="indexed@gmail.com")
+        self.wordset = create_budget_fixture(self.user, wordsets=1, words=3)[0]
+
+    def test_word_progress_is_unique_per_user_and_word(self):
+        word = self.wordset.words.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            WordProgress.objects.create(user=self.user, word=word)
+
+    def test_explain_queries_reports_every_hot_query(self):
+        out = StringIO()
+        call_command('explain_queries', user=self.user.id, stdout=out, no_color=True)
+        output = out.getvalue()
+        for label in ("home / my wordsets", "word progress (user, word)", "exercise history"):
+            self.assertIn(f"== {label}", output)
+        self.assertIn("Full table scans per query", output)
+
+
+class WordSelectionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="selector", password="pass", email="selector@gmail.com")
+        # Words alternate between learned and not learned for this user
+        self.wordset = create_budget_fixture(self.user, wordsets=1, words=10)[0]
+        self.learned = set(WordProgress.objects.filter(user=self.user, is_learned=True).values_list('word_id', flat=True))
+
+    def test_unlearned_words_is_one_query(self):
+        with self.assertNumQueries(1):
+            ids = {w.id for w in unlearned_words(self.user, self.wordset)}
+        self.assertEqual(len(ids), 5)
+        self.assertFalse(ids & self.learned)
+
+    def test_sample_draws_distinct_rows_without_sorting_randomly(self):
+        with self.assertNumQueries(2) as ctx:
+            words = sample(self.wordset.words.all(), 4, random.Random(1))
+        self.assertEqual(len({w.id for w in words}), 4)
+        self.assertNotIn('RANDOM', " ".join(q['sql'].upper() for q in ctx.captured_queries))
+        self.assertEqual(len(sample(self.wordset.words.all(), 50)), 10)
+
+    def test_sample_unlearned_prefers_unlearned_words(self):
+        words = sample_unlearned(self.user, self.wordset, 3)
+        self.assertFalse({w.id for w in words} & self.learned)
+        # Tops up with learned words once the unlearned ones run out
+        self.assertEqual(len(sample_unlearned(self.user, self.wordset, 8)), 8)
+
+
+class SeedDatasetTest(TestCase):
+    def test_refuses_to_seed_twice(self):
+        options = dict(users=2, wordsets_per_user=1, words_per_set=4, shared_words=4, exercises_per_type=1,
+                       attempts_per_set=2, seed=1, stdout=StringIO())
+        call_command('seed_dataset', **options)
+        self.assertEqual(User.objects.get(username="seed1").email, "seed1@example.com")
+        with self.assertRaisesMessage(CommandError, "already seeded"):
+            call_command('seed_dataset', **options)
+        self.assertEqual(User.objects.filter(username__startswith="seed").count(), 2)
+
+
+class AnswerLogTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="logger", password="pass", email="logger@gmail.com")
+        self.words = Word.objects.bulk_create([Word(word=f"žodis{i}", infinitive=f"žodis{i}", translation=f"word {i}")
+                                               for i in range(2)])
+        self.start = timezone.now() - timedelta(hours=1)
+
+    def log(self, word, correct, minutes, **kwargs):
+        return AnswerEvent.objects.create(user=self.user, word=word, correct=correct,
+                                          answered_at=self.start + timedelta(minutes=minutes), **kwargs)
+
+    def test_compaction_folds_settled_events_in_order(self):
+        first, second = self.words
+        for minute, correct in enumerate([True, True, False, True]):
+            self.log(first, correct, minute)
+        self.log(second, True, 5, applied=True)
+        self.log(second, True, 58)
+
+        with self.assertNumQueries(15):
+            folded = answer_log.compact(batch_size=100, now=self.start + timedelta(minutes=30))
+        self.assertEqual(folded, 4)
+        wp = WordProgress.objects.get(user=self.user, word=first)
+        self.assertEqual((wp.correct_attempts, wp.incorrect_attempts, wp.is_learned), (3, 1, True))
+        # Scheduled from the time of the last answer, not of the compaction
+        self.assertEqual(wp.due_at, self.start + timedelta(minutes=3, days=1))
+        # The applied event is skipped and the unsettled one waits for a later run
+        self.assertFalse(WordProgress.objects.filter(word=second).exists())
+        self.assertEqual(answer_log.compact(now=self.start + timedelta(minutes=30)), 0)
+
+        out = StringIO()
+        call_command('compact_answer_log', stdout=out)
+        self.assertIn("Compacted 1 answer events and attempts", out.getvalue())
+        self.assertEqual(WordProgress.objects.get(word=second).correct_attempts, 1)
+        self.assertEqual(LogCursor.objects.get(name=answer_log.COMPACTION_CURSOR).position,
+                         AnswerEvent.objects.latest('pk').pk)
+
+    def test_replay_rebuilds_progress_from_the_log(self):
+        first, second = self.words
+        self.log(first, True, 0)
+        self.log(first, False, 1, grade=1)
+        # Written by a submission that updated the progress itself
+        answer_log.fold([self.log(second, True, 2, applied=True)])
+        answer_log.compact()
+        expected = {wp.word_id: wp for wp in WordProgress.objects.filter(user=self.user)}
+        # Pending events compaction has not reached are left for it
+        self.log(second, False, 70)
+        WordProgress.objects.filter(user=self.user).update(ease_factor=1.3, interval_days=40)
+
+        out = StringIO()
+        call_command('replay_answer_log', user=[self.user.pk], stdout=out)
+        self.assertIn("Replayed 2 word progress rows", out.getvalue())
+        for wp in WordProgress.objects.filter(user=self.user):
+            fields = ['correct_attempts', 'incorrect_attempts', 'ease_factor', 'interval_days', 'due_at']
+            self.assertEqual([getattr(wp, f) for f in fields], [getattr(expected[wp.word_id], f) for f in fields])
+
+    def test_replay_keeps_answers_from_before_the_log(self):
+        first, second = self.words
+        answer_log.fold([self.log(first, True, 0, applied=True), self.log(second, True, 1, applied=True)])
+        # Counted before the log existed
+        WordProgress.objects.filter(word=first).update(correct_attempts=5, ease_factor=1.3)
+
+        self.assertEqual(answer_log.replay(), (1, 1))
+        self.assertEqual(WordProgress.objects.get(word=first).ease_factor, 1.3)
+
+        out = StringIO()
+        call_command('replay_answer_log', stdout=out)
+        self.assertIn("Skipped 1 rows", out.getvalue())
+        call_command('replay_answer_log', force=True, stdout=StringIO())
+        wp = WordProgress.objects.get(word=first)
+        self.assertEqual((wp.correct_attempts, wp.ease_factor), (1, WordProgress.objects.get(word=second).ease_factor))
 
-# Create your tests here.
@@ -3,7 +3,8 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Max, Value, DateTimeField
 from django.db.models.functions import Coalesce, Greatest
 
-from .models import WordSet, Exercise, WordProgress
+from .models import WordSet, Exercise, ExerciseProgress, WordProgress
+from .cache import progress_summary
 
 import time
 from datetime import datetime
@@ -19,7 +20,9 @@ def home(request):
             )
     ).order_by('-sort_time')
     
+    summary = progress_summary(request.user)
     for ws in wordsets:
+        ws.word_count, ws.learned_count = summary.get(ws.id, (0, 0))
         ws.progress = ws.learned_percent(request.user)
     return render(request, "home.html", {"wordsets": wordsets})
 
@@ -41,14 +44,11 @@ def flashcard_practice(request, wordset_id):
 @login_required(login_url='login')
 def fill_in_gap_practice(request, wordset_id):
     wordset = get_object_or_404(WordSet, id=wordset_id, user=request.user)
-    # Add timestamp to ensure a new exercise is created each time
-    timestamp = int(time.time())
     
-    # The frontend JS will handle fetching/creating the exercise via the API
+    # The frontend JS creates a fresh exercise session via the API
     context = {
         'wordset': wordset,
         'wordset_id': wordset_id, # Pass ID for JS
-        'timestamp': timestamp, # Pass timestamp to ensure uniqueness
     }
     return render(request, "main/fill_in_gap.html", context)
 
@@ -76,8 +76,8 @@ def text_exercise(request, wordset_id):
 
 @login_required(login_url='login')
 def wordset_detail(request, id):
-    wordset = get_object_or_404(WordSet, pk=id)
-    if not wordset.public and wordset.user != request.user:
+    wordset = get_object_or_404(WordSet.objects.select_related('user').prefetch_related('words'), pk=id)
+    if not wordset.public and wordset.user_id != request.user.id:
         return redirect('home')
     
     context = {
@@ -86,22 +86,17 @@ def wordset_detail(request, id):
     }
     return render(request, 'wordset_detail.html', context=context)
 
-from collections import defaultdict
-
 @login_required(login_url='login')
 def exercise_history(request, id):
     wordset = get_object_or_404(WordSet, pk=id)
-    exercises = wordset.exercises.prefetch_related('progress_entries')
-    
-    grouped_exercises = defaultdict(list)
-    for exercise in exercises:
-        grouped_exercises[exercise.type].append(exercise)
+    # Only the per-type summary is rendered; the attempts are loaded page by
+    # page from /api/wordset/<id>/history/ when a type is opened.
+    summary = ExerciseProgress.objects.filter(user=request.user, exercise__wordset=wordset).summary_by_type()
 
     context = {
         "wordset": wordset,
-        "grouped_exercises": dict(grouped_exercises),
+        "summary": {row['type']: row for row in summary},
         "exercise_types": Exercise.EXERCISE_TYPES,
-        "label_lookup": dict(Exercise.EXERCISE_TYPES)
     }
     return render(request, 'exercise_history.html', context=context)
 